@@ -0,0 +1,175 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from typing import AsyncIterator, Iterable, Optional
+
+import requests
+
+from .genie_client import MESSAGE_TERMINAL_STATES, STATEMENT_PENDING_STATES, GenieClient
+from .polling import AdaptivePoller, PollSchedule, PollTimeoutError
+from .transport import GenieTransport, TransportConfig
+
+
+class AsyncGenieClient:
+    """
+    asyncio counterpart of GenieClient for driving many conversations at once.
+
+    HTTP calls go through the same pooled GenieTransport as the blocking client
+    and run on a small executor sized to the connection pool; all waiting
+    between polls is done with asyncio.sleep, so a pending question costs a
+    coroutine rather than an OS thread.
+    """
+
+    def __init__(
+        self,
+        workspace_url: str,
+        auth_token: str,
+        space_id: str,
+        max_concurrency: int = 16,
+        transport_config: Optional[TransportConfig] = None,
+        transport: Optional[GenieTransport] = None,
+        message_schedule: Optional[PollSchedule] = None,
+        statement_schedule: Optional[PollSchedule] = None,
+    ):
+        """
+        :param max_concurrency: Maximum number of HTTP requests in flight at once
+        """
+        if transport is None:
+            transport_config = transport_config or TransportConfig()
+            # Keep one pooled connection per concurrent request; a copy, the caller's config may be shared
+            transport_config = replace(
+                transport_config, pool_maxsize=max(transport_config.pool_maxsize, max_concurrency)
+            )
+        self.client = GenieClient(
+            workspace_url=workspace_url,
+            auth_token=auth_token,
+            space_id=space_id,
+            transport_config=transport_config,
+            transport=transport,
+            message_schedule=message_schedule,
+            statement_schedule=statement_schedule,
+        )
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="genie-http")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def _call(self, fn, *args, **kwargs):
+        # The semaphore is created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def start_conversation(self, question: str) -> dict:
+        return await self._call(self.client.start_conversation, question)
+
+    async def ask_follow_up(self, conversation_id: str, question: str) -> dict:
+        return await self._call(self.client.ask_follow_up, conversation_id, question)
+
+    async def get_message(self, conversation_id: str, message_id: str) -> dict:
+        return await self._call(self.client.get_message, conversation_id, message_id)
+
+    async def get_query_result(self, conversation_id: str, message_id: str, attachment_id: str) -> dict:
+        return await self._call(self.client.get_query_result, conversation_id, message_id, attachment_id)
+
+    async def wait_for_completion(
+        self, conversation_id: str, message_id: str, timeout_seconds: Optional[float] = None
+    ) -> dict | None:
+        return await AdaptivePoller(self.client.message_schedule).apoll(
+            lambda: self.get_message(conversation_id, message_id),
+            lambda message: message["status"] in MESSAGE_TERMINAL_STATES,
+            deadline=timeout_seconds,
+        )
+
+    async def wait_for_many(
+        self, pending: Iterable[tuple[str, str]], timeout_seconds: Optional[float] = None
+    ) -> AsyncIterator[tuple[tuple[str, str], dict]]:
+        """
+        Yield ((conversation_id, message_id), message) as each pending message completes.
+        """
+        async def wait(key):
+            return key, await self.wait_for_completion(*key, timeout_seconds=timeout_seconds)
+
+        for next_done in asyncio.as_completed([wait(key) for key in pending]):
+            yield await next_done
+
+    async def ask_question(self, question: str, conversation_id: Optional[str] = None) -> tuple[dict, str]:
+        """
+        Async version of GenieClient.ask_question.
+
+        Returns:
+        - tuple: (response_dict, conversation_id)
+        """
+        if not conversation_id:
+            conversation = await self.start_conversation(question)
+            conversation_id = conversation["conversation_id"]
+            message_id = conversation["message_id"]
+        else:
+            message_id = (await self.ask_follow_up(conversation_id, question))["message_id"]
+        completed_message = await self.wait_for_completion(conversation_id, message_id)
+        return self.client.get_message_result(completed_message), conversation_id
+
+    async def ask_many(self, questions: list[str], return_exceptions: bool = True) -> list:
+        """
+        Ask several independent questions concurrently, each in its own conversation.
+
+        Returns:
+            Results in input order; with return_exceptions a failed question
+            yields its exception instead of cancelling the others
+        """
+        return await asyncio.gather(
+            *(self.ask_question(question) for question in questions),
+            return_exceptions=return_exceptions,
+        )
+
+    async def execute_sql_query(self, warehouse_id: str, query: str, timeout_seconds: int = 50) -> dict:
+        """
+        Async version of GenieClient.execute_sql_query.
+
+        Raises:
+            Exception: If the query fails or times out
+        """
+        try:
+            statement = await self._call(self.client.submit_statement, warehouse_id, query, timeout_seconds)
+            statement_id = statement["statement_id"]
+            response_data = statement
+
+            if statement["status"]["state"] in STATEMENT_PENDING_STATES:
+                async def fetch():
+                    data = await self._call(self.client.get_statement, statement_id)
+                    GenieClient.raise_for_statement_state(data["status"])
+                    return data
+
+                response_data = await AdaptivePoller(self.client.statement_schedule).apoll(
+                    fetch,
+                    lambda data: data["status"]["state"] not in STATEMENT_PENDING_STATES,
+                    deadline=timeout_seconds,
+                )
+
+            result = GenieClient.statement_result(response_data)
+            # Follow next_chunk_index so large results are not truncated to the first chunk
+            next_chunk_index = (response_data.get("result") or {}).get("next_chunk_index")
+            while result["manifest"] and next_chunk_index is not None:
+                chunk = await self._call(self.client.get_result_chunk, statement_id, next_chunk_index)
+                result["data_array"].extend(chunk.get("data_array", []))
+                next_chunk_index = chunk.get("next_chunk_index")
+            return result
+
+        except PollTimeoutError:
+            raise TimeoutError(f"Query execution timed out after {timeout_seconds} seconds")
+        except requests.exceptions.RequestException as e:
+            raise GenieClient.query_error(e)
+
+    def transport_stats(self) -> dict:
+        return self.client.transport_stats()
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
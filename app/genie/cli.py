@@ -1,4 +1,5 @@
 import argparse
+import csv
 import os
 import sys
 
@@ -24,6 +25,12 @@ def main():
     )
     follow_parser.add_argument("--conv_id", "-c", help="Conversation ID")
 
+    sql_parser = subparsers.add_parser("sql", help="Run a SQL query and stream all rows as CSV")
+    sql_parser.add_argument("--query", "-q", required=True, help="SQL statement to execute")
+    sql_parser.add_argument(
+        "--warehouse", "-w", help="SQL warehouse ID (default: $DATABRICKS_WAREHOUSE_ID)"
+    )
+
     args = parser.parse_args()
     load_dotenv()
     client = GenieClient(
@@ -75,6 +82,21 @@ def main():
         client.print_response(message)
         client.save_session(conversation_id)
 
+    elif args.command == "sql":
+        warehouse_id = args.warehouse or os.getenv("DATABRICKS_WAREHOUSE_ID")
+        if not warehouse_id:
+            print(
+                Fore.YELLOW
+                + "⚠️ Please provide a warehouse id via --warehouse or DATABRICKS_WAREHOUSE_ID."
+                + Fore.RESET
+            )
+            sys.exit(1)
+        stream = client.stream_sql_query(warehouse_id, args.query)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(stream.columns)
+        for rows in stream.iter_row_batches():
+            writer.writerows(rows)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,168 @@
+import sys
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+INTEGER_TYPES = {"BYTE", "SHORT", "INT", "LONG"}
+FLOAT_TYPES = {"FLOAT", "DOUBLE", "DECIMAL"}
+TEMPORAL_TYPES = {"DATE", "TIMESTAMP", "TIMESTAMP_NTZ"}
+
+
+def to_typed_array(values: Iterable, type_name: Optional[str]) -> np.ndarray:
+    """
+    Convert one column of JSON_ARRAY values (all strings or None) to a NumPy
+    array of the type declared in the statement manifest.
+
+    Integer columns containing NULLs become float64 with NaN, boolean columns
+    containing NULLs stay object arrays.
+    """
+    values = np.asarray(values if isinstance(values, (list, tuple)) else list(values), dtype=object)
+    nulls = values == None  # noqa: E711 - elementwise comparison
+    type_name = (type_name or "STRING").upper()
+
+    if type_name in INTEGER_TYPES:
+        if nulls.any():
+            values[nulls] = np.nan
+            return values.astype(np.float64)
+        return values.astype(np.int64)
+    if type_name in FLOAT_TYPES:
+        values[nulls] = np.nan
+        return values.astype(np.float64)
+    if type_name == "BOOLEAN":
+        if nulls.any():
+            values[~nulls] = values[~nulls] == "true"
+            return values
+        return values == "true"
+    if type_name in TEMPORAL_TYPES:
+        # Typed datetime64[ns], naive UTC (NULLs become NaT)
+        parsed = pd.DatetimeIndex(pd.to_datetime(values, errors="coerce", utc=True))
+        return parsed.tz_convert(None).to_numpy("datetime64[ns]")
+    return values
+
+
+class ColumnarResult:
+    """
+    A statement result held as one typed array per column.
+
+    Built once per statement from the manifest schema and the result rows (or
+    an Arrow table) and consumed directly by the renderers, instead of
+    materialising one dict of strings per row.
+    """
+
+    def __init__(self, columns: list[str], data: dict[str, np.ndarray], types: Optional[dict[str, str]] = None):
+        self.columns = columns
+        self.data = data
+        self.types = types or {}
+        self.num_rows = len(data[columns[0]]) if columns else 0
+
+    @classmethod
+    def from_statement(cls, manifest: dict, row_batches: Iterable[list[list]]) -> "ColumnarResult":
+        """
+        Build from a statement manifest and its rows, one chunk at a time.
+
+        Args:
+            manifest: The statement manifest (schema.columns with name and type_name)
+            row_batches: Lists of rows, e.g. StatementChunkStream.iter_row_batches()
+        """
+        schema = manifest.get("schema", {}).get("columns", [])
+        columns = [column["name"] for column in schema]
+        types = {column["name"]: column.get("type_name", "STRING") for column in schema}
+        parts: dict[str, list[np.ndarray]] = {name: [] for name in columns}
+        for rows in row_batches:
+            if not rows:
+                continue
+            for name, values in zip(columns, zip(*rows)):
+                parts[name].append(to_typed_array(values, types[name]))
+        data = {
+            name: np.concatenate(arrays) if arrays else to_typed_array([], types[name])
+            for name, arrays in parts.items()
+        }
+        return cls(columns, data, types)
+
+    @classmethod
+    def from_stream(cls, stream) -> "ColumnarResult":
+        return cls.from_statement(stream.manifest, stream.iter_row_batches())
+
+    @classmethod
+    def from_arrow(cls, table: pa.Table, types: Optional[dict[str, str]] = None) -> "ColumnarResult":
+        columns = list(table.column_names)
+        data = {name: table.column(name).to_numpy(zero_copy_only=False) for name in columns}
+        types = types or {field.name: str(field.type) for field in table.schema}
+        return cls(columns, data, types)
+
+    @classmethod
+    def from_records(cls, records: list[dict]) -> "ColumnarResult":
+        columns = list(records[0].keys()) if records else []
+        data = {name: _object_array([record.get(name) for record in records]) for name in columns}
+        # Let NumPy pick numeric dtypes for plain Python numbers
+        for name, values in data.items():
+            if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+                data[name] = values.astype(np.float64 if any(isinstance(v, float) for v in values) else np.int64)
+        return cls(columns, data)
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __bool__(self) -> bool:
+        return self.num_rows > 0
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.data
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.data[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.data.get(name, default)
+
+    def row(self, index: int) -> dict:
+        return {name: _to_python(self.data[name][index]) for name in self.columns}
+
+    def records(self, limit: Optional[int] = None) -> list[dict]:
+        count = self.num_rows if limit is None else min(limit, self.num_rows)
+        return [self.row(index) for index in range(count)]
+
+    def take(self, indices) -> "ColumnarResult":
+        """Return a new result restricted to the given row indices or boolean mask."""
+        return ColumnarResult(self.columns, {name: values[indices] for name, values in self.data.items()}, self.types)
+
+    def with_column(self, name: str, values: np.ndarray) -> "ColumnarResult":
+        columns = self.columns if name in self.data else self.columns + [name]
+        return ColumnarResult(columns, {**self.data, name: values}, self.types)
+
+    def to_arrow(self) -> pa.Table:
+        return pa.table({name: pa.array(self.data[name]) for name in self.columns})
+
+    def nbytes(self, sample_size: int = 1000) -> int:
+        """
+        Approximate memory footprint; object columns are estimated from a sample
+        of their values since ndarray.nbytes only counts the pointers.
+        """
+        total = 0
+        for values in self.data.values():
+            total += values.nbytes
+            if values.dtype == object and len(values):
+                sample = values[:sample_size]
+                total += int(sum(sys.getsizeof(value) for value in sample) * len(values) / len(sample))
+        return total
+
+    def to_pandas(self, columns: Optional[list[str]] = None) -> pd.DataFrame:
+        columns = [name for name in (columns or self.columns) if name in self.data]
+        return pd.DataFrame({name: self.data[name] for name in columns}, columns=columns)
+
+
+def _object_array(values: list) -> np.ndarray:
+    # np.array() would turn list-valued cells (e.g. flags) into a 2-D array
+    array = np.empty(len(values), dtype=object)
+    for index, value in enumerate(values):
+        array[index] = value
+    return array
+
+
+def _to_python(value: Any) -> Any:
+    if isinstance(value, np.datetime64):
+        # .item() would give an int for nanosecond precision
+        return None if np.isnat(value) else pd.Timestamp(value)
+    return value.item() if isinstance(value, np.generic) else value
@@ -2,22 +2,52 @@ import json
 import os
 import re
 import sys
-import time
-from time import sleep
-from typing import Optional
+import threading
+from typing import Callable, Iterable, Iterator, Optional
 
 import requests
 from colorama import Fore
 
+from .polling import (
+    GENIE_MESSAGE_SCHEDULE,
+    STATEMENT_SCHEDULE,
+    AdaptivePoller,
+    MultiplexedWaiter,
+    PollCancelledError,
+    PollSchedule,
+    PollTimeoutError,
+)
+from .question_cache import QuestionCache
+from .streaming import StatementChunkStream
+from .transport import GenieTransport, TransportConfig
+
+MESSAGE_TERMINAL_STATES = ("COMPLETED", "FAILED", "CANCELLED")
+STATEMENT_PENDING_STATES = ("PENDING", "RUNNING")
+
 
 class GenieClient:
     SESSION_FILE_PATH = ".genie_session.json"
 
-    def __init__(self, workspace_url: str, auth_token: str, space_id: str):
+    def __init__(
+        self,
+        workspace_url: str,
+        auth_token: str,
+        space_id: str,
+        transport_config: Optional[TransportConfig] = None,
+        transport: Optional[GenieTransport] = None,
+        message_schedule: Optional[PollSchedule] = None,
+        statement_schedule: Optional[PollSchedule] = None,
+        question_cache: Optional[QuestionCache] = None,
+    ):
         """
         Initializes the Genie client.
         :param workspace_url: Your Databricks instance URL (e.g., 'https://abc.cloud.databricks.com')
         :param auth_token: Your personal access token for authentication
+        :param transport_config: Pool size, timeouts and retry settings for the HTTP transport
+        :param transport: An existing transport to share between clients (overrides transport_config)
+        :param message_schedule: Polling schedule used while waiting for Genie messages
+        :param statement_schedule: Polling schedule used while waiting for SQL statements
+        :param question_cache: Cache of Genie-generated queries for repeated questions
         """
         self.workspace_url = workspace_url
         self.auth_token = auth_token
@@ -26,6 +56,22 @@ class GenieClient:
             "Content-Type": "application/json",
         }
         self.space_id = space_id
+        self.transport = transport or GenieTransport(headers=self.headers, config=transport_config)
+        self.message_schedule = message_schedule or GENIE_MESSAGE_SCHEDULE
+        self.statement_schedule = statement_schedule or STATEMENT_SCHEDULE
+        self.question_cache = question_cache
+
+    def close(self):
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def transport_stats(self) -> dict:
+        return self.transport.stats()
 
     def get_message_result(self, message: dict) -> dict | None:
         match message["status"]:
@@ -34,7 +80,15 @@ class GenieClient:
                     if "text" in attachment.keys():
                         return {"type":"text", "message": attachment['text']['content']}
                     elif "query" in attachment.keys():
-                        return {"type":"query", "message": attachment['query']['query'], "description": attachment['query']['description']}
+                        return {
+                            "type": "query",
+                            "message": attachment['query']['query'],
+                            "description": attachment['query']['description'],
+                            # Needed to fetch the result Genie already computed for this query
+                            "conversation_id": message.get("conversation_id"),
+                            "message_id": message.get("message_id") or message.get("id"),
+                            "attachment_id": attachment.get("attachment_id") or attachment['query'].get("attachment_id"),
+                        }
                     else:
                         print("unknown entity in the message[status]")
                                 
@@ -50,29 +104,63 @@ class GenieClient:
  
 
 
-    def ask_question(self, question: str, conversation_id: Optional[str] = None) -> tuple[dict, str]:
+    def ask_question(
+        self,
+        question: str,
+        conversation_id: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        on_poll: Optional[Callable[[int, dict], None]] = None,
+    ) -> tuple[dict, str]:
         """
         Sends a message to a Databricks Genie conversation.
 
         Parameters:
         - conversation_id (str): Genie conversation ID
         - question (str): The message/question to send to Genie
+        - cancel_event (threading.Event): Set to abandon waiting for the answer
+        - on_poll (callable): Called with (poll round, message) while waiting
 
         Returns:
         - tuple: (response_dict, conversation_id) where:
             - response_dict: JSON response from the Genie API
             - conversation_id: The conversation ID used for this request
+
+        With a question_cache configured, repeated questions are answered from
+        the cache without a Genie round trip; the returned conversation_id may
+        then be a virtual id that is turned into a real Genie conversation on
+        the first follow-up the cache cannot answer.
         """
+        cache = self.question_cache
+        if cache is None:
+            return self._ask_genie(question, conversation_id, cancel_event, on_poll)
+
+        cached = cache.get(self.space_id, question, conversation_id)
+        if cached is not None:
+            return cached, cache.record(conversation_id, question)
+
+        message = cache.context_prompt(conversation_id, question)
+        genie_conversation_id = None if cache.is_virtual(conversation_id) else conversation_id
+        result, genie_conversation_id = self._ask_genie(message, genie_conversation_id, cancel_event, on_poll)
+        cache.put(self.space_id, question, conversation_id, result)
+        return result, cache.record(conversation_id, question, genie_conversation_id)
+
+    def _ask_genie(
+        self,
+        question: str,
+        conversation_id: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None,
+        on_poll: Optional[Callable[[int, dict], None]] = None,
+    ) -> tuple[dict, str]:
         if not conversation_id:
             conversation = self.start_conversation(question)
             conversation_id = conversation["conversation_id"]
             message_id = conversation["message_id"]
-            completed_message = self.wait_for_completion(conversation_id, message_id)
-            return self.get_message_result(completed_message), conversation_id
         else:
             message_id = self.ask_follow_up(conversation_id, question)["message_id"]
-            completed_message = self.wait_for_completion(conversation_id, message_id)
-            return self.get_message_result(completed_message), conversation_id
+        completed_message = self.wait_for_completion(
+            conversation_id, message_id, cancel_event=cancel_event, on_poll=on_poll
+        )
+        return self.get_message_result(completed_message), conversation_id
 
     def execute_sql_query(self, warehouse_id: str, query: str, timeout_seconds: int = 50) -> dict:
         """
@@ -86,11 +174,165 @@ class GenieClient:
         Returns:
             A dictionary containing:
             - manifest: The query result schema and metadata
-            - data_array: List of rows from the query result
+            - data_array: List of rows from the query result (all result chunks)
             
         Raises:
             Exception: If the query fails or times out
         """
+        response_data = self.run_statement(warehouse_id, query, timeout_seconds)
+        if response_data["status"]["state"] != "SUCCEEDED":
+            return {"manifest": {}, "data_array": []}
+        try:
+            data_array = list(StatementChunkStream(self, response_data).iter_rows())
+        except requests.exceptions.RequestException as e:
+            raise self.query_error(e)
+        return {"manifest": response_data.get("manifest", {}), "data_array": data_array}
+
+    def stream_sql_query(
+        self,
+        warehouse_id: str,
+        query: str,
+        timeout_seconds: int = 50,
+        prefetch: int = 2,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> StatementChunkStream:
+        """
+        Execute a SQL query and return a lazy stream over all of its result chunks.
+
+        Use iter_rows() or iter_row_batches() on the returned stream to process
+        results larger than memory; further chunks are fetched in the background
+        at most `prefetch` chunks ahead of the consumer.
+        """
+        response_data = self.run_statement(warehouse_id, query, timeout_seconds, cancel_event=cancel_event)
+        # A statement that failed within wait_timeout is returned by the submit call, not the poll
+        self.raise_for_statement_state(response_data["status"])
+        if response_data["status"]["state"] != "SUCCEEDED":
+            response_data = {"manifest": {}, "result": None}
+        return StatementChunkStream(self, response_data, prefetch=prefetch)
+
+    def execute_sql_query_arrow(
+        self, warehouse_id: str, query: str, timeout_seconds: int = 50, max_workers: int = 8
+    ):
+        """
+        Execute a SQL query using EXTERNAL_LINKS + ARROW_STREAM and return a pyarrow.Table.
+
+        Unlike execute_sql_query this is not capped by the INLINE result limit and
+        skips JSON parsing; result chunks are downloaded in parallel.
+
+        Args:
+            max_workers: Number of chunks downloaded concurrently
+        """
+        from .results import ArrowResultReader
+
+        response_data = self.run_statement(
+            warehouse_id, query, timeout_seconds, disposition="EXTERNAL_LINKS", format="ARROW_STREAM"
+        )
+        self.raise_for_statement_state(response_data["status"])
+        return ArrowResultReader(self, max_workers=max_workers).read_table(response_data)
+
+    def iter_sql_query_arrow(
+        self, warehouse_id: str, query: str, timeout_seconds: int = 50, max_workers: int = 8
+    ):
+        """
+        Streaming variant of execute_sql_query_arrow.
+
+        Yields:
+            pyarrow.RecordBatch objects in result order while later chunks are
+            still downloading
+        """
+        from .results import ArrowResultReader
+
+        response_data = self.run_statement(
+            warehouse_id, query, timeout_seconds, disposition="EXTERNAL_LINKS", format="ARROW_STREAM"
+        )
+        self.raise_for_statement_state(response_data["status"])
+        yield from ArrowResultReader(self, max_workers=max_workers).iter_batches(response_data)
+
+    def run_statement(
+        self,
+        warehouse_id: str,
+        query: str,
+        timeout_seconds: int = 50,
+        disposition: str = "INLINE",
+        format: str = "JSON_ARRAY",
+        cancel_event: Optional[threading.Event] = None,
+    ) -> dict:
+        """
+        Submit a statement and poll until it finished.
+
+        Setting cancel_event stops polling and cancels the statement on the
+        warehouse (PollCancelledError is raised).
+
+        Returns:
+            The final statement JSON (status, manifest and first result chunk)
+
+        Raises:
+            Exception: If the query fails or times out
+        """
+        try:
+            # Execute the statement
+            statement = self.submit_statement(warehouse_id, query, timeout_seconds, disposition, format)
+            statement_id = statement["statement_id"]
+            
+            # Poll for completion
+            response_data = statement
+            if statement["status"]["state"] in STATEMENT_PENDING_STATES:
+                try:
+                    response_data = self.wait_for_statement(statement_id, timeout_seconds, cancel_event)
+                except PollCancelledError:
+                    self.cancel_statement(statement_id)
+                    raise
+            return response_data
+            
+        except PollTimeoutError:
+            raise TimeoutError(f"Query execution timed out after {timeout_seconds} seconds")
+        except requests.exceptions.RequestException as e:
+            raise self.query_error(e)
+
+    def wait_for_statement(
+        self,
+        statement_id: str,
+        timeout_seconds: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> dict:
+        """
+        Poll a statement on the adaptive statement schedule until it leaves PENDING/RUNNING.
+
+        Raises:
+            Exception: If the statement failed or was canceled
+            PollTimeoutError: If timeout_seconds passes first
+        """
+        def fetch():
+            response_data = self.get_statement(statement_id)
+            self.raise_for_statement_state(response_data["status"])
+            return response_data
+
+        return AdaptivePoller(self.statement_schedule).poll(
+            fetch,
+            lambda data: data["status"]["state"] not in STATEMENT_PENDING_STATES,
+            deadline=timeout_seconds,
+            cancel_event=cancel_event,
+        )
+
+    def submit_statement(
+        self,
+        warehouse_id: str,
+        query: str,
+        timeout_seconds: int = 50,
+        disposition: str = "INLINE",
+        format: str = "JSON_ARRAY",
+    ) -> dict:
+        """
+        Submit a SQL statement to the statement execution API without polling.
+
+        Args:
+            disposition: "INLINE" or "EXTERNAL_LINKS"
+            format: "JSON_ARRAY", "ARROW_STREAM" or "CSV"
+
+        Returns:
+            The statement JSON (statement_id, status and, if it finished within
+            wait_timeout, manifest and result)
+        """
         # Endpoint for statement execution
         url = f"{self.workspace_url}/api/2.0/sql/statements/"
         
@@ -99,88 +341,135 @@ class GenieClient:
             "statement": query,
             "warehouse_id": warehouse_id,
             "wait_timeout": f"{timeout_seconds}s",
-            "disposition": "INLINE",
-            "format": "JSON_ARRAY",
+            "disposition": disposition,
+            "format": format,
             "on_wait_timeout": "CANCEL"
         }
-        
+
+        connect_timeout, read_timeout = self.transport.config.timeout_for("execute_statement")
+        response = self.transport.post(
+            url=url,
+            endpoint="execute_statement",
+            headers=self.headers,
+            json=payload,
+            timeout=(connect_timeout, max(read_timeout, timeout_seconds + 1))
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def get_statement(self, statement_id: str) -> dict:
+        """
+        Fetch the current status (and result, once finished) of a SQL statement.
+        """
+        url = f"{self.workspace_url}/api/2.0/sql/statements/{statement_id}"
+        response = self.transport.get(url=url, endpoint="get_statement", headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+    def cancel_statement(self, statement_id: str):
+        """
+        Ask the warehouse to cancel a running statement (best effort).
+        """
+        url = f"{self.workspace_url}/api/2.0/sql/statements/{statement_id}/cancel"
         try:
-            # Execute the statement
-            response = requests.post(
-                url=url,
-                headers=self.headers,
-                json=payload,
-                timeout=timeout_seconds+1  # Connection timeout in seconds
-            )
-            response.raise_for_status()
-            
-            # Get the statement ID and initial status
-            statement = response.json()
-            statement_id = statement["statement_id"]
-            status = statement["status"]
-            
-            # Poll for completion
-            start_time = time.time()
-            status_response = None
-            while status["state"] in ("PENDING", "RUNNING"):
-                # Check for timeout
-                if time.time() - start_time > timeout_seconds:
-                    raise TimeoutError(f"Query execution timed out after {timeout_seconds} seconds")
-                
-                # Wait before polling again
-                time.sleep(1)
-                
-                # Check statement status
-                status_url = f"{url}{statement_id}"
-                status_response = requests.get(
-                    url=status_url,
-                    headers=self.headers,
-                    timeout=timeout_seconds+1
-                )
-                status_response.raise_for_status()
-                
-                status = status_response.json()["status"]
-                if status["state"] == "SUCCEEDED":
-                    break
-                elif status["state"] == "FAILED":
-                    error_message = status.get("error", {}).get("message", "Unknown error")
-                    raise Exception(f"Query execution failed: {error_message}")
-                elif status["state"] == "CANCELED":
-                    raise Exception("Query execution was canceled")
-            
-            response_data = status_response.json() if status_response else statement
-            
-            if status['state'] == 'SUCCEEDED':
-                # Return both manifest and data_array for the query result
-                return {
-                    "manifest": response_data.get("manifest", {}),
-                    "data_array": response_data.get("result", {}).get("data_array", [])
-                }
-            return {"manifest": {}, "data_array": []}
-            
-        except requests.exceptions.RequestException as e:
-            error_message = str(e)
-            if hasattr(e, 'response') and e.response is not None:
-                try:
-                    error_details = e.response.json()
-                    error_message = f"{error_message}: {error_details}"
-                except:
-                    pass
-            raise Exception(f"Failed to execute query: {error_message}")
+            self.transport.post(url=url, endpoint="cancel_statement", headers=self.headers)
+        except requests.exceptions.RequestException:
+            pass
 
+    def get_result_chunk(self, statement_id: str, chunk_index: int) -> dict:
+        """
+        Fetch one result chunk of a finished statement.
+
+        Returns:
+            The chunk JSON: data_array for INLINE results, external_links for
+            EXTERNAL_LINKS results, plus next_chunk_index when more chunks follow
+        """
+        url = f"{self.workspace_url}/api/2.0/sql/statements/{statement_id}/result/chunks/{chunk_index}"
+        response = self.transport.get(url=url, endpoint="get_result_chunk", headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def raise_for_statement_state(status: dict):
+        if status["state"] == "FAILED":
+            error_message = status.get("error", {}).get("message", "Unknown error")
+            raise Exception(f"Query execution failed: {error_message}")
+        elif status["state"] == "CANCELED":
+            raise Exception("Query execution was canceled")
+
+    @staticmethod
+    def statement_result(response_data: dict) -> dict:
+        if response_data["status"]["state"] == "SUCCEEDED":
+            # Return both manifest and data_array for the query result
+            return {
+                "manifest": response_data.get("manifest", {}),
+                "data_array": response_data.get("result", {}).get("data_array", [])
+            }
+        return {"manifest": {}, "data_array": []}
+
+    @staticmethod
+    def query_error(e: requests.exceptions.RequestException) -> Exception:
+        error_message = str(e)
+        if hasattr(e, 'response') and e.response is not None:
+            try:
+                error_details = e.response.json()
+                error_message = f"{error_message}: {error_details}"
+            except:
+                pass
+        return Exception(f"Failed to execute query: {error_message}")
+
+
+    def wait_for_completion(
+        self,
+        conversation_id: str,
+        message_id: str,
+        timeout_seconds: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+        on_poll: Optional[Callable[[int, dict], None]] = None,
+    ) -> dict | None:
+        """
+        Poll a Genie message until it is COMPLETED, FAILED or CANCELLED.
 
-    def wait_for_completion(self, conversation_id: str, message_id: str) -> dict | None:
-        while True:
-            message = self.get_message(conversation_id, message_id)
-            status = message["status"]
+        Polls quickly at first and backs off with jitter while Genie is still
+        working. timeout_seconds (default: the schedule's deadline) raises
+        PollTimeoutError, setting cancel_event raises PollCancelledError.
+        on_poll is called with (poll round, message) after every poll.
+        """
+        def report(round_: int, message: dict):
             sys.stdout.write(
                 Fore.YELLOW
-                + f"\r\033[K⏳ Waiting for response, status: {Fore.RESET}{status}"
+                + f"\r\033[K⏳ Waiting for response, status: {Fore.RESET}{message['status']}"
             )
             sys.stdout.flush()
-            if status in ("COMPLETED", "FAILED", "CANCELLED"):
-                return message
-            sleep(3)
+            if on_poll is not None:
+                on_poll(round_, message)
+
+        return AdaptivePoller(self.message_schedule).poll(
+            lambda: self.get_message(conversation_id, message_id),
+            lambda message: message["status"] in MESSAGE_TERMINAL_STATES,
+            deadline=timeout_seconds,
+            cancel_event=cancel_event,
+            on_poll=report,
+        )
+
+    def wait_for_many(
+        self,
+        pending: Iterable[tuple[str, str]],
+        timeout_seconds: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Iterator[tuple[tuple[str, str], dict]]:
+        """
+        Wait on many (conversation_id, message_id) pairs in a single polling loop.
+
+        Yields:
+            ((conversation_id, message_id), message) in completion order
+        """
+        waiter = MultiplexedWaiter(
+            lambda key: self.get_message(*key),
+            lambda message: message["status"] in MESSAGE_TERMINAL_STATES,
+            self.message_schedule,
+        )
+        yield from waiter.as_completed(pending, deadline=timeout_seconds, cancel_event=cancel_event)
 
     def start_conversation(self, question: str) -> dict:
         """
@@ -194,7 +483,7 @@ class GenieClient:
         """
         url = f"{self.workspace_url}/api/2.0/genie/spaces/{self.space_id}/start-conversation"
         payload = {"content": question}
-        response = requests.post(url=url, headers=self.headers, json=payload)
+        response = self.transport.post(url=url, endpoint="start_conversation", headers=self.headers, json=payload)
         response.raise_for_status()  # Raise exception for HTTP errors
         return response.json()
 
@@ -214,7 +503,7 @@ class GenieClient:
             f"{self.space_id}/conversations/{conversation_id}/messages/{message_id}"
         )
 
-        response = requests.get(url, headers=self.headers)
+        response = self.transport.get(url, endpoint="get_message", headers=self.headers)
         response.raise_for_status()  # Raise exception on HTTP errors
         return response.json()
 
@@ -231,7 +520,7 @@ class GenieClient:
         """
         url = f"{self.workspace_url}/api/2.0/genie/spaces/{self.space_id}/conversations/{conversation_id}/messages"
         payload = {"content": question}
-        response = requests.post(url, headers=self.headers, json=payload)
+        response = self.transport.post(url, endpoint="ask_follow_up", headers=self.headers, json=payload)
         response.raise_for_status()  # Raise error for bad responses
         return response.json()
 
@@ -263,10 +552,31 @@ class GenieClient:
             f"attachments/{attachment_id}/query-result"
         )
         
-        response = requests.get(url, headers=self.headers)
+        response = self.transport.get(url, endpoint="get_query_result", headers=self.headers)
         response.raise_for_status()
         return response.json()
 
+    def stream_attachment_result(
+        self, conversation_id: str, message_id: str, attachment_id: str, prefetch: int = 2
+    ) -> Optional[StatementChunkStream]:
+        """
+        Stream the result Genie already computed for a query attachment.
+
+        Returns:
+            A StatementChunkStream over the attachment's statement, or None if the
+            result is missing, expired or did not succeed (re-execute the SQL then)
+        """
+        try:
+            response = self.get_query_result(conversation_id, message_id, attachment_id)
+        except requests.exceptions.HTTPError as e:
+            if e.response is not None and 400 <= e.response.status_code < 500:
+                return None
+            raise
+        statement = response.get("statement_response")
+        if not statement or statement.get("status", {}).get("state") != "SUCCEEDED":
+            return None
+        return StatementChunkStream(self, statement, prefetch=prefetch)
+
     def print_response(self, message: dict, conversation_id: str = None, message_id: str = None):
         """
         Print the response from Genie, including query results if available.
@@ -0,0 +1,199 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Iterable, Iterator, Optional
+
+
+class PollTimeoutError(TimeoutError):
+    pass
+
+
+class PollCancelledError(Exception):
+    pass
+
+
+@dataclass
+class PollSchedule:
+    """
+    Adaptive polling schedule: a few fast probes first, then exponential backoff
+    with jitter up to max_interval, bounded by an optional hard deadline.
+    """
+
+    initial_interval: float = 0.25
+    multiplier: float = 1.6
+    max_interval: float = 5.0
+    jitter: float = 0.2  # +/- fraction applied to every interval
+    fast_probes: int = 2  # probes at initial_interval before backing off
+    deadline: Optional[float] = None  # seconds, None means no deadline
+
+    def intervals(self) -> Iterator[float]:
+        interval = self.initial_interval
+        for attempt in itertools.count():
+            if attempt >= self.fast_probes:
+                interval = min(interval * self.multiplier, self.max_interval)
+            spread = interval * self.jitter
+            yield max(0.0, interval + random.uniform(-spread, spread))
+
+
+# Genie answers take seconds to tens of seconds; give up (PollTimeoutError) after 5 minutes
+GENIE_MESSAGE_SCHEDULE = PollSchedule(initial_interval=0.5, multiplier=1.5, max_interval=5.0, deadline=300.0)
+# Statements usually finish inside the POST's wait_timeout, so poll tightly
+STATEMENT_SCHEDULE = PollSchedule(initial_interval=0.2, multiplier=1.5, max_interval=2.0)
+
+
+class AdaptivePoller:
+    def __init__(self, schedule: Optional[PollSchedule] = None):
+        self.schedule = schedule or PollSchedule()
+
+    def poll(
+        self,
+        fetch: Callable[[], Any],
+        is_done: Callable[[Any], bool],
+        deadline: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+        on_poll: Optional[Callable[[int, Any], None]] = None,
+    ) -> Any:
+        """
+        Call fetch() until is_done(result) is true and return that result.
+
+        Args:
+            fetch: Performs one status request
+            is_done: Decides whether a fetched result is terminal
+            deadline: Seconds before PollTimeoutError, overrides the schedule's deadline
+            cancel_event: Setting this event aborts the wait with PollCancelledError
+            on_poll: Called with (round, result) after every fetch
+
+        Raises:
+            PollTimeoutError: If the deadline passes before completion
+            PollCancelledError: If cancel_event is set
+        """
+        deadline = deadline if deadline is not None else self.schedule.deadline
+        expires_at = time.monotonic() + deadline if deadline is not None else None
+        intervals = self.schedule.intervals()
+        for round_ in itertools.count(1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise PollCancelledError("Polling was cancelled")
+            result = fetch()
+            if on_poll is not None:
+                on_poll(round_, result)
+            if is_done(result):
+                return result
+            delay = next(intervals)
+            if expires_at is not None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    raise PollTimeoutError(f"Polling timed out after {deadline} seconds")
+                delay = min(delay, remaining)
+            if cancel_event is not None:
+                # Event.wait returns early as soon as the event is set
+                if cancel_event.wait(delay):
+                    raise PollCancelledError("Polling was cancelled")
+            else:
+                time.sleep(delay)
+
+    async def apoll(
+        self,
+        fetch: Callable[[], Any],
+        is_done: Callable[[Any], bool],
+        deadline: Optional[float] = None,
+        on_poll: Optional[Callable[[int, Any], None]] = None,
+    ) -> Any:
+        """
+        Async version of poll(); fetch must be a coroutine function.
+
+        Cancellation uses the normal asyncio task cancellation.
+        """
+        deadline = deadline if deadline is not None else self.schedule.deadline
+        expires_at = time.monotonic() + deadline if deadline is not None else None
+        intervals = self.schedule.intervals()
+        for round_ in itertools.count(1):
+            result = await fetch()
+            if on_poll is not None:
+                on_poll(round_, result)
+            if is_done(result):
+                return result
+            delay = next(intervals)
+            if expires_at is not None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    raise PollTimeoutError(f"Polling timed out after {deadline} seconds")
+                delay = min(delay, remaining)
+            await asyncio.sleep(delay)
+
+
+class MultiplexedWaiter:
+    """
+    Waits on many pending keys (e.g. (conversation_id, message_id) pairs) in a
+    single loop, each on its own adaptive schedule, and yields them as they
+    complete.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[Hashable], Any],
+        is_done: Callable[[Any], bool],
+        schedule: Optional[PollSchedule] = None,
+    ):
+        self.fetch = fetch
+        self.is_done = is_done
+        self.schedule = schedule or PollSchedule()
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._intervals: dict[Hashable, Iterator[float]] = {}
+        self._counter = itertools.count()
+
+    def add(self, key: Hashable):
+        if key in self._intervals:
+            return
+        self._intervals[key] = self.schedule.intervals()
+        heapq.heappush(self._heap, (time.monotonic(), next(self._counter), key))
+
+    def pending(self) -> int:
+        return len(self._intervals)
+
+    def as_completed(
+        self,
+        keys: Iterable[Hashable] = (),
+        deadline: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Iterator[tuple[Hashable, Any]]:
+        """
+        Yield (key, result) for every tracked key as soon as it is done.
+
+        Raises:
+            PollTimeoutError: If keys are still pending when the deadline passes
+            PollCancelledError: If cancel_event is set
+        """
+        for key in keys:
+            self.add(key)
+        deadline = deadline if deadline is not None else self.schedule.deadline
+        expires_at = time.monotonic() + deadline if deadline is not None else None
+
+        while self._heap:
+            if cancel_event is not None and cancel_event.is_set():
+                raise PollCancelledError("Polling was cancelled")
+            due_at, _, key = self._heap[0]
+            now = time.monotonic()
+            if expires_at is not None and now >= expires_at:
+                raise PollTimeoutError(f"{self.pending()} pending after {deadline} seconds")
+            if due_at > now:
+                delay = due_at - now
+                if expires_at is not None:
+                    delay = min(delay, max(expires_at - now, 0))
+                if cancel_event is not None:
+                    cancel_event.wait(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            heapq.heappop(self._heap)
+            result = self.fetch(key)
+            if self.is_done(result):
+                del self._intervals[key]
+                yield key, result
+            else:
+                next_due = time.monotonic() + next(self._intervals[key])
+                heapq.heappush(self._heap, (next_due, next(self._counter), key))
@@ -0,0 +1,122 @@
+import hashlib
+import re
+import threading
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from cachetools import TTLCache
+
+# Conversation ids handed out for conversations answered purely from the cache
+VIRTUAL_CONVERSATION_PREFIX = "cached-"
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+@dataclass
+class QuestionCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+
+
+class QuestionCache:
+    """
+    Maps a question to the query and description Genie generated for it, so a
+    repeated question skips the Genie round trip and goes straight to SQL.
+
+    Keys combine the space id, the normalised question and, for follow-ups, a
+    fingerprint of the questions asked earlier in the same conversation. Cache
+    hits are not seen by Genie, so the cache remembers them and prepends them
+    as context to the next question it does send in that conversation.
+    """
+
+    def __init__(self, ttl_seconds: float = 24 * 3600, maxsize: int = 4096):
+        self._answers = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        # conversation_id -> [(question, normalized_question, sent_to_genie)]
+        self._conversations = TTLCache(maxsize=maxsize, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self._stats = QuestionCacheStats()
+
+    def key(self, space_id: str, question: str, conversation_id: Optional[str] = None) -> str:
+        context = [normalized for _, normalized, _ in self._conversations.get(conversation_id, [])]
+        fingerprint = hashlib.sha256("\0".join(context).encode()).hexdigest() if context else ""
+        return hashlib.sha256(f"{space_id}\0{fingerprint}\0{normalize_question(question)}".encode()).hexdigest()
+
+    def get(self, space_id: str, question: str, conversation_id: Optional[str] = None) -> Optional[dict]:
+        with self._lock:
+            answer = self._answers.get(self.key(space_id, question, conversation_id))
+            if answer is None:
+                self._stats.misses += 1
+                return None
+            self._stats.hits += 1
+            return dict(answer)
+
+    def put(self, space_id: str, question: str, conversation_id: Optional[str], answer: Optional[dict]):
+        # Only generated queries are cached; text answers may depend on live data
+        if not answer or answer.get("type") != "query":
+            return
+        # Attachment ids point at the original conversation's (expiring) result,
+        # so a cache hit runs the SQL through the result cache instead
+        answer = {field: answer[field] for field in ("type", "message", "description") if field in answer}
+        with self._lock:
+            self._answers[self.key(space_id, question, conversation_id)] = answer
+            self._stats.stores += 1
+
+    def record(
+        self,
+        conversation_id: Optional[str],
+        question: str,
+        genie_conversation_id: Optional[str] = None,
+    ) -> str:
+        """
+        Append a question to a conversation's context.
+
+        Args:
+            conversation_id: The conversation the question was asked in (None for a new one)
+            genie_conversation_id: The real Genie conversation, if the question was sent to
+                Genie; omitted for cache hits
+
+        Returns:
+            The conversation id to use for follow-ups (a virtual id when a new
+            conversation was answered entirely from the cache)
+        """
+        with self._lock:
+            history = list(self._conversations.get(conversation_id, []))
+            if genie_conversation_id is not None:
+                # Genie has now seen everything asked so far in this conversation
+                history = [(q, normalized, True) for q, normalized, _ in history]
+            history.append((question, normalize_question(question), genie_conversation_id is not None))
+
+            new_id = genie_conversation_id or conversation_id or f"{VIRTUAL_CONVERSATION_PREFIX}{uuid.uuid4()}"
+            if conversation_id is not None and conversation_id != new_id:
+                self._conversations.pop(conversation_id, None)
+            self._conversations[new_id] = history
+            return new_id
+
+    @staticmethod
+    def is_virtual(conversation_id: Optional[str]) -> bool:
+        return bool(conversation_id) and conversation_id.startswith(VIRTUAL_CONVERSATION_PREFIX)
+
+    def context_prompt(self, conversation_id: Optional[str], question: str) -> str:
+        """
+        The message to send to Genie: the question, prefixed with any earlier
+        questions of this conversation that were answered from the cache.
+        """
+        with self._lock:
+            unsent = [q for q, _, sent in self._conversations.get(conversation_id, []) if not sent]
+        if not unsent:
+            return question
+        earlier = "\n".join(f"- {q}" for q in unsent)
+        return f"Earlier questions in this conversation:\n{earlier}\n\n{question}"
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = asdict(self._stats)
+            lookups = self._stats.hits + self._stats.misses
+            stats["hit_rate"] = self._stats.hits / lookups if lookups else 0.0
+            stats["entries"] = len(self._answers)
+        return stats
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Callable, Optional
+
+import pyarrow.parquet as pq
+from cachetools import TTLCache
+
+from .columnar import ColumnarResult
+
+logger = logging.getLogger(__name__)
+
+# Quoted literals and identifiers are kept verbatim when normalising SQL
+_QUOTED = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+_LINE_COMMENT = re.compile(r"--[^\n]*")
+_BLOCK_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a statement for cache keys: comments removed, whitespace
+    collapsed, trailing semicolons dropped and everything outside quotes
+    lower-cased.
+    """
+    parts = _QUOTED.split(sql.strip())
+    normalized = []
+    for index, part in enumerate(parts):
+        if index % 2:  # a quoted literal / identifier
+            normalized.append(part)
+            continue
+        part = _BLOCK_COMMENT.sub(" ", _LINE_COMMENT.sub(" ", part))
+        normalized.append(" ".join(part.split()).lower())
+    return re.sub(r"\s*;+\s*$", "", " ".join(p for p in normalized if p)).strip()
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    bypasses: int = 0
+    stores: int = 0
+    disk_evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+class SQLResultCache:
+    """
+    Two-tier cache of SQL results keyed by normalised statement text and warehouse id.
+
+    The memory tier is an LRU bounded by approximate result size in bytes; the
+    disk tier stores one Parquet file per result (manifest kept in the file
+    metadata) and evicts the least recently used files above max_disk_bytes.
+    Both tiers expire entries ttl_seconds after the result was fetched from the
+    warehouse; reads only refresh recency (file mtime), never the expiry.
+    The disk tier's size is tracked as files are written and removed, so the
+    directory is only listed when it is over budget or an expiry sweep is due.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".genie_cache/results",
+        ttl_seconds: float = 15 * 60,
+        max_memory_bytes: int = 256 * 1024**2,
+        max_disk_bytes: int = 2 * 1024**3,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        # key -> (result, manifest, created_at)
+        self._memory = TTLCache(
+            maxsize=max_memory_bytes,
+            ttl=ttl_seconds,
+            getsizeof=lambda entry: entry[0].nbytes(),
+        )
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        # Approximate bytes on disk, corrected whenever the directory is listed
+        self._disk_bytes = 0
+        self._swept_at = 0.0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._evict_disk()
+
+    @staticmethod
+    def key(sql: str, warehouse_id: str) -> str:
+        return hashlib.sha256(f"{warehouse_id}\0{normalize_sql(sql)}".encode()).hexdigest()
+
+    def get(self, sql: str, warehouse_id: str) -> Optional[tuple[ColumnarResult, dict]]:
+        """
+        Returns:
+            (result, manifest) if a fresh entry exists in either tier, else None
+        """
+        key = self.key(sql, warehouse_id)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and not self._expired(entry[2]):
+                self._stats.memory_hits += 1
+                return entry[:2]
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self._stats.misses += 1
+                return None
+            self._stats.disk_hits += 1
+            self._store_memory(key, entry)
+        return entry[:2]
+
+    def put(self, sql: str, warehouse_id: str, result: ColumnarResult, manifest: dict):
+        key = self.key(sql, warehouse_id)
+        created_at = time.time()
+        with self._lock:
+            self._stats.stores += 1
+            self._store_memory(key, (result, manifest, created_at))
+        self._write_disk(key, result, manifest, created_at)
+
+    def get_or_execute(
+        self,
+        sql: str,
+        warehouse_id: str,
+        execute: Callable[[], tuple[ColumnarResult, dict]],
+        bypass: bool = False,
+    ) -> tuple[ColumnarResult, dict]:
+        """
+        Return the cached (result, manifest) for this statement or run execute() and cache it.
+
+        Args:
+            execute: Runs the statement and returns (result, manifest)
+            bypass: Skip the lookup and always execute; the fresh result still refreshes the cache
+        """
+        if bypass:
+            with self._lock:
+                self._stats.bypasses += 1
+        else:
+            cached = self.get(sql, warehouse_id)
+            if cached is not None:
+                return cached
+        result, manifest = execute()
+        if manifest:  # failed statements come back without a manifest and are not cached
+            self.put(sql, warehouse_id, result, manifest)
+        return result, manifest
+
+    def invalidate(self, sql: str, warehouse_id: str):
+        key = self.key(sql, warehouse_id)
+        with self._lock:
+            self._memory.pop(key, None)
+        self._remove(self._path(key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = asdict(self._stats)
+            stats["hit_rate"] = self._stats.hit_rate
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory.currsize
+        return stats
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl_seconds
+
+    def _store_memory(self, key: str, entry: tuple[ColumnarResult, dict, float]):
+        if self._expired(entry[2]):
+            return
+        try:
+            self._memory[key] = entry
+        except ValueError:
+            # Larger than the whole memory tier: keep it on disk only
+            pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    @staticmethod
+    def _created_at(path: str) -> Optional[float]:
+        """Fetch time recorded in the file's metadata (footer only), None if unreadable."""
+        try:
+            metadata = pq.read_schema(path).metadata or {}
+            return float(json.loads(metadata[b"genie_cache"])["created_at"])
+        except Exception:
+            return None
+
+    def _read_disk(self, key: str) -> Optional[tuple[ColumnarResult, dict, float]]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        created_at = self._created_at(path)
+        if created_at is None or self._expired(created_at):
+            self._remove(path)
+            return None
+        try:
+            table = pq.read_table(path)
+        except Exception:
+            return None
+        metadata = json.loads(table.schema.metadata[b"genie_cache"])
+        os.utime(path)  # mark as recently used for eviction; expiry uses created_at
+        return ColumnarResult.from_arrow(table, types=metadata["types"]), metadata["manifest"], created_at
+
+    def _write_disk(self, key: str, result: ColumnarResult, manifest: dict, created_at: float):
+        try:
+            table = result.to_arrow()
+        except Exception:
+            # Columns Arrow cannot represent stay in the memory tier only
+            logger.warning("Result for %s is not cached on disk: Arrow conversion failed", key, exc_info=True)
+            return
+        metadata = json.dumps({"manifest": manifest, "types": result.types, "created_at": created_at})
+        table = table.replace_schema_metadata({"genie_cache": metadata})
+        path = self._path(key)
+        # Unique per write: concurrent puts of the same statement must not share a temp file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            pq.write_table(table, tmp_path)
+            size = os.path.getsize(tmp_path)
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _remove(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes -= size
+
+    def _evict_disk(self):
+        """
+        Remove least recently used files while the tier is over max_disk_bytes and,
+        at most once per ttl_seconds, expired files (the only step that reads footers).
+        """
+        now = time.time()
+        with self._lock:
+            sweep = now - self._swept_at >= self.ttl_seconds
+            if not sweep and self._disk_bytes <= self.max_disk_bytes:
+                return
+            if sweep:
+                self._swept_at = now
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".parquet"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        # Least recently used first
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                if not sweep:
+                    break
+                created_at = self._created_at(path)
+                if created_at is not None and not self._expired(created_at):
+                    continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._stats.disk_evictions += 1
+        with self._lock:
+            self._disk_bytes = total
@@ -0,0 +1,101 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+import pyarrow as pa
+
+from .transport import GenieTransport
+
+T = TypeVar("T")
+
+# Presigned chunk links expire after a few minutes; cloud storage answers 403
+EXPIRED_LINK_STATUSES = (403, 404)
+
+
+def prefetch_ordered(tasks: Iterable[Callable[[], T]], max_workers: int) -> Iterator[T]:
+    """
+    Run tasks on a thread pool with at most max_workers in flight and yield
+    their results in submission order.
+
+    Tasks are only submitted as the consumer advances, so memory stays bounded
+    by max_workers results even for very long task streams.
+    """
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="genie-prefetch")
+    window = deque()
+    tasks = iter(tasks)
+    try:
+        for task in tasks:
+            window.append(pool.submit(task))
+            if len(window) >= max_workers:
+                break
+        while window:
+            result = window.popleft().result()
+            task = next(tasks, None)
+            if task is not None:
+                window.append(pool.submit(task))
+            yield result
+    finally:
+        # Also reached when the consumer stops iterating early
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ArrowResultReader:
+    """
+    Reads EXTERNAL_LINKS + ARROW_STREAM statement results.
+
+    Every result chunk is an Arrow IPC stream behind a presigned URL; chunks are
+    downloaded in parallel and yielded as record batches in result order.
+    """
+
+    def __init__(self, client, max_workers: int = 8):
+        """
+        :param client: GenieClient used to resolve chunk links
+        :param max_workers: Number of chunks downloaded concurrently
+        """
+        self.client = client
+        self.max_workers = max_workers
+        # Presigned links must not carry the workspace bearer token, so they get
+        # their own pooled transport without the client's headers
+        self.transport = GenieTransport(config=client.transport.config)
+
+    def iter_batches(self, response_data: dict) -> Iterator[pa.RecordBatch]:
+        statement_id = response_data["statement_id"]
+        total_chunks = response_data.get("manifest", {}).get("total_chunk_count", 0)
+        links = {
+            link["chunk_index"]: link
+            for link in response_data.get("result", {}).get("external_links", [])
+        }
+        tasks = (
+            partial(self._download_chunk, statement_id, chunk_index, links.get(chunk_index))
+            for chunk_index in range(total_chunks)
+        )
+        try:
+            for batches in prefetch_ordered(tasks, self.max_workers):
+                yield from batches
+        finally:
+            self.transport.close()
+
+    def read_table(self, response_data: dict) -> pa.Table:
+        batches = list(self.iter_batches(response_data))
+        if batches:
+            return pa.Table.from_batches(batches)
+        columns = response_data.get("manifest", {}).get("schema", {}).get("columns", [])
+        return pa.schema([pa.field(column["name"], pa.string()) for column in columns]).empty_table()
+
+    def _download_chunk(self, statement_id: str, chunk_index: int, link: Optional[dict]) -> list[pa.RecordBatch]:
+        if link is None:
+            link = self._chunk_link(statement_id, chunk_index)
+        response = self._get_link(link)
+        if response.status_code in EXPIRED_LINK_STATUSES:
+            response = self._get_link(self._chunk_link(statement_id, chunk_index))
+        response.raise_for_status()
+        with pa.ipc.open_stream(response.content) as reader:
+            return list(reader)
+
+    def _get_link(self, link: dict):
+        # Links can come with headers the storage service requires on the download
+        return self.transport.get(link["external_link"], endpoint="get_result_chunk", headers=link.get("http_headers"))
+
+    def _chunk_link(self, statement_id: str, chunk_index: int) -> dict:
+        return self.client.get_result_chunk(statement_id, chunk_index)["external_links"][0]
@@ -0,0 +1,365 @@
+import re
+from dataclasses import dataclass, field
+from typing import NamedTuple
+
+from .result_cache import normalize_sql
+
+# One token per match: comments, quoted literals / identifiers, words, numbers, punctuation
+_TOKEN = re.compile(
+    r"(?P<comment>--[^\n]*|/\*.*?\*/)"
+    r"|(?P<string>'(?:[^'\\]|\\.|'')*')"
+    r"|(?P<quoted>\"(?:[^\"\\]|\\.)*\"|`[^`]*`)"
+    r"|(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)"
+    r"|(?P<word>[A-Za-z_][\w$]*)"
+    r"|(?P<op><=|>=|<>|!=|==|\|\||::|[(),;.*=<>+\-/%])"
+    r"|(?P<space>\s+)"
+    r"|(?P<other>.)",
+    re.S,
+)
+
+_READ_STATEMENTS = {"select", "with", "values", "table"}
+# Keywords that end the FROM clause of a SELECT block
+_FROM_END = {"where", "group", "having", "order", "limit", "qualify", "window", "union", "intersect",
+             "except", "minus", "offset", "fetch", "lateral", "cluster", "distribute", "sort"}
+_JOIN_MODIFIERS = {"inner", "left", "right", "full", "outer", "cross", "natural", "semi", "anti"}
+_AGGREGATES = {"count", "sum", "avg", "min", "max", "stddev", "variance", "collect_list", "collect_set",
+               "approx_count_distinct", "percentile", "percentile_approx", "array_agg", "string_agg"}
+_COST_CLASSES = ("low", "medium", "high")
+# Words in a WHERE clause that are not column references
+_NON_COLUMN_WORDS = {"and", "or", "not", "is", "in", "between", "like", "ilike", "rlike", "exists", "true", "false",
+                     "null", "case", "when", "then", "else", "end", "interval", "day", "days", "hour", "hours",
+                     "minute", "minutes", "second", "seconds", "week", "weeks", "month", "months", "year", "years",
+                     "date", "timestamp", "current_date", "current_timestamp", "cast", "as"}
+# Clauses that end a WHERE clause
+_WHERE_END = {"group", "having", "order", "limit", "qualify", "window", "cluster", "distribute", "sort"}
+
+
+class SQLGuardError(ValueError):
+    """The statement was rejected by the cost guard."""
+
+
+@dataclass
+class GuardConfig:
+    # LIMIT appended to statements without one, and the cap for larger limits
+    default_limit: int = 10000
+    max_limit: int = 50000
+    # Tables (bare or fully qualified names, lower case) that must not be scanned without a filter
+    large_tables: set[str] = field(default_factory=set)
+    reject_full_scans: bool = True
+    reject_cartesian_joins: bool = True
+    # Columns of known tables, used to replace SELECT * with what the response type needs
+    table_columns: dict[str, list[str]] = field(default_factory=dict)
+    response_columns: dict[str, list[str]] = field(default_factory=lambda: {
+        'spatial': ['id', 'user_name', 'user_id', 'created', 'change_count', 'comment', 'bbox', 'center',
+                    'country', 'tool', 'vandalism_score', 'flags'],
+    })
+
+
+@dataclass
+class GuardResult:
+    sql: str
+    original_sql: str
+    cost_class: str
+    tables: list[str] = field(default_factory=list)
+    warnings: list[str] = field(default_factory=list)
+    # The guard changed what the statement returns (LIMIT added or capped, columns pruned);
+    # whitespace, comments and a trailing semicolon do not count
+    rewritten: bool = False
+
+
+class _Token(NamedTuple):
+    kind: str
+    text: str
+    start: int
+    end: int
+    depth: int
+
+    @property
+    def keyword(self) -> str:
+        return self.text.lower() if self.kind == 'word' else ''
+
+
+@dataclass
+class _Block:
+    """One SELECT ... of the statement, at a given parenthesis depth."""
+    depth: int
+    tokens: list[_Token]
+    start: int = 0
+    # Subquery in FROM / JOIN or a CTE body, so filters of the enclosing query reach it
+    derived: bool = False
+    parent: "_Block | None" = None
+    tables: list[str] = field(default_factory=list)
+    has_filter: bool = False
+    joins: int = 0
+    cartesian: bool = False
+    aggregates: bool = False
+
+
+def _tokenize(sql: str) -> list[_Token]:
+    tokens, depth = [], 0
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ('comment', 'space'):
+            continue
+        text = match.group()
+        if text == ')':
+            depth -= 1
+        tokens.append(_Token(kind, text, match.start(), match.end(), depth))
+        if text == '(':
+            depth += 1
+    return tokens
+
+
+def _split_blocks(tokens: list[_Token]) -> list[_Block]:
+    """Every SELECT block, with only the tokens at its own depth."""
+    blocks = []
+    for index, token in enumerate(tokens):
+        if token.keyword != 'select':
+            continue
+        own = []
+        for other in tokens[index + 1:]:
+            if other.depth < token.depth or (other.depth == token.depth and other.keyword in ('union', 'intersect', 'except', 'minus')):
+                break
+            if other.depth == token.depth:
+                own.append(other)
+        derived = index >= 2 and tokens[index - 1].text == '(' and tokens[index - 2].keyword in ('from', 'join', 'as')
+        blocks.append(_Block(token.depth, own, start=index, derived=derived))
+    for block in blocks:
+        if block.depth == 0:
+            continue
+        # The enclosing SELECT; a CTE body has none before it and feeds the main query after it
+        enclosing = [other for other in blocks if other.depth < block.depth and other.start < block.start]
+        block.parent = enclosing[-1] if enclosing else next(
+            (other for other in blocks if other.depth == 0 and other.start > block.start), None
+        )
+    return blocks
+
+
+def _filtered(block: _Block) -> bool:
+    """Whether the rows a block reads are filtered by its own WHERE or (pushed down) by an enclosing query's."""
+    if block.has_filter:
+        return True
+    return block.derived and not block.aggregates and block.parent is not None and _filtered(block.parent)
+
+
+def _table_name(tokens: list[_Token], index: int) -> tuple[str | None, int]:
+    """Dotted table name starting at tokens[index] (None for a subquery or function) and the index after it."""
+    if index >= len(tokens) or tokens[index].kind not in ('word', 'quoted') or tokens[index].keyword in ('lateral', 'unnest'):
+        return None, index + 1
+    parts = [tokens[index].text.strip('`"')]
+    index += 1
+    while index + 1 < len(tokens) and tokens[index].text == '.' and tokens[index + 1].kind in ('word', 'quoted'):
+        parts.append(tokens[index + 1].text.strip('`"'))
+        index += 2
+    if index < len(tokens) and tokens[index].text == '(':
+        # Table-valued function, e.g. explode(...) / range(...)
+        return None, index
+    return '.'.join(parts).lower(), index
+
+
+def _has_join_predicate(tokens: list[_Token]) -> bool:
+    """Whether a WHERE clause compares two column references (an implicit join condition)."""
+    for index in range(1, len(tokens) - 1):
+        if tokens[index].text == '=' and all(
+            side.kind in ('word', 'quoted') and side.keyword not in ('true', 'false', 'null')
+            for side in (tokens[index - 1], tokens[index + 1])
+        ):
+            return True
+    return False
+
+
+def _references_column(tokens: list[_Token]) -> bool:
+    """Whether a WHERE clause mentions a column at all (WHERE 1=1 / WHERE TRUE filter nothing)."""
+    for index, token in enumerate(tokens):
+        if token.kind == 'quoted':
+            return True
+        if token.kind == 'word' and token.keyword not in _NON_COLUMN_WORDS \
+                and not (index + 1 < len(tokens) and tokens[index + 1].text == '('):
+            return True
+    return False
+
+
+def _analyze_block(block: _Block):
+    tokens = block.tokens
+    keywords = [token.keyword for token in tokens]
+    block.aggregates = any(
+        keyword in _AGGREGATES and index + 1 < len(tokens) and tokens[index + 1].text == '('
+        for index, keyword in enumerate(keywords)
+    ) or 'group' in keywords or 'distinct' in keywords
+
+    if 'from' not in keywords:
+        return
+    index = keywords.index('from') + 1
+    comma_join = natural = lateral = False
+    while index < len(tokens):
+        name, index = _table_name(tokens, index)
+        if name:
+            block.tables.append(name)
+        # Skip alias / subquery body up to the next join, comma or end of the FROM clause
+        condition, on_index = False, None
+        while index < len(tokens) and tokens[index].text != ',' and tokens[index].keyword not in _FROM_END \
+                and tokens[index].keyword not in _JOIN_MODIFIERS and tokens[index].keyword != 'join':
+            if tokens[index].keyword == 'using':
+                condition = True
+            elif tokens[index].keyword == 'on':
+                on_index = index
+            index += 1
+        # ON true / ON 1=1 join nothing
+        condition = condition or (on_index is not None and _references_column(tokens[on_index + 1:index]))
+        if block.joins and not condition and not natural and not lateral:
+            block.cartesian = True
+        if index >= len(tokens) or tokens[index].keyword in _FROM_END:
+            break
+        if tokens[index].text == ',':
+            comma_join = True
+            index += 1
+            continue
+        modifiers = []
+        while index < len(tokens) and tokens[index].keyword in _JOIN_MODIFIERS:
+            modifiers.append(tokens[index].keyword)
+            index += 1
+        index += 1  # JOIN
+        block.joins += 1
+        natural = 'natural' in modifiers
+        lateral = index < len(tokens) and (
+            tokens[index].keyword in ('lateral', 'unnest')
+            or (index + 1 < len(tokens) and tokens[index + 1].text == '(')
+        )
+        if 'cross' in modifiers and not lateral:
+            block.cartesian = True
+
+    if 'where' in keywords:
+        start = keywords.index('where') + 1
+        end = next((index for index in range(start, len(tokens)) if keywords[index] in _WHERE_END), len(tokens))
+        where = tokens[start:end]
+        block.has_filter = _references_column(where)
+        if comma_join and not _has_join_predicate(where):
+            block.cartesian = True
+    elif comma_join:
+        block.cartesian = True
+
+
+def _find_limit(tokens: list[_Token]) -> _Token | None:
+    """The value token of the statement-level LIMIT, or the LIMIT keyword itself if its value is not a number."""
+    for index in range(len(tokens) - 1, -1, -1):
+        if tokens[index].depth == 0 and tokens[index].keyword == 'limit':
+            value = tokens[index + 1] if index + 1 < len(tokens) else tokens[index]
+            return value if value.kind == 'number' else tokens[index]
+    return None
+
+
+def guard_sql(sql: str, response_type: str | None = None, config: GuardConfig | None = None) -> GuardResult:
+    """
+    Check and rewrite a generated SQL statement before it is sent to the warehouse.
+
+    The statement is tokenised locally (quotes and comments respected) and every
+    SELECT block is inspected. The guard:
+
+    - rejects anything but a single read statement,
+    - rejects cartesian joins (CROSS JOIN, joins without ON/USING, comma joins
+      without a join predicate) and unfiltered scans of configured large tables
+      that a LIMIT cannot bound (aggregations, joins, subqueries, ORDER BY
+      without a LIMIT of at most default_limit); a WHERE clause that mentions
+      no column does not count as a filter, one on an enclosing query counts
+      for the subqueries in its FROM clause,
+    - replaces SELECT * on a known table with the columns response_type needs,
+    - appends a LIMIT when there is none and caps a larger one,
+    - estimates a cost class ('low', 'medium' or 'high').
+
+    Args:
+        sql: Statement to check
+        response_type: Response the result feeds ('spatial', 'table', ...), used for column pruning
+        config: Guard settings; defaults to GuardConfig()
+
+    Returns:
+        GuardResult with the statement to execute
+
+    Raises:
+        SQLGuardError: if the statement is rejected
+    """
+    config = config or GuardConfig()
+    original_sql = sql
+    sql = sql.strip()
+    tokens = _tokenize(sql)
+    while tokens and tokens[-1].text == ';':
+        sql = sql[:tokens[-1].start].rstrip()
+        tokens.pop()
+    if not tokens:
+        raise SQLGuardError("Empty statement")
+    if any(token.text == ';' and token.depth == 0 for token in tokens):
+        raise SQLGuardError("Only a single statement can be executed")
+    first = next((token for token in tokens if token.text != '('), tokens[0])
+    if first.keyword not in _READ_STATEMENTS:
+        raise SQLGuardError(f"Only read queries can be executed, got {first.text.upper()}")
+
+    blocks = _split_blocks(tokens)
+    for block in blocks:
+        _analyze_block(block)
+    warnings = []
+    large = {name.lower() for name in config.large_tables}
+
+    def is_large(name: str) -> bool:
+        return name in large or name.rsplit('.', 1)[-1] in large
+
+    if config.reject_cartesian_joins and any(block.cartesian for block in blocks):
+        raise SQLGuardError("Cartesian join: every join needs a join condition")
+
+    main = [block for block in blocks if block.depth == 0]
+    set_operation = len(main) > 1
+    limit = _find_limit(tokens)
+    # Top-N queries (ORDER BY ... LIMIT n) are allowed when n is small, but still read every row
+    top_n = limit is not None and limit.kind == 'number' and float(limit.text) <= config.default_limit
+    cost = 0
+    for block in blocks:
+        for name in block.tables:
+            if not is_large(name):
+                continue
+            if _filtered(block):
+                cost = max(cost, 1)
+                continue
+            ordered = any(token.keyword == 'order' for token in block.tokens)
+            plain = block.depth == 0 and not set_operation and not block.aggregates and not block.joins
+            if not (plain and (not ordered or top_n)) and config.reject_full_scans:
+                raise SQLGuardError(f"Full scan of large table {name}: add a filter on it")
+            # Only a plain projection stops reading once the LIMIT is reached
+            cost = max(cost, 1 if plain and not ordered else 2)
+            warnings.append(f"{name} is read without a filter")
+        if block.joins >= 3:
+            cost = min(cost + 1, 2)
+
+    edits = []  # (start, end, replacement) in the stripped statement
+    if main and not set_operation and len(main[0].tables) == 1 and not main[0].joins:
+        block = main[0]
+        star = block.tokens[0] if block.tokens else None
+        if star is not None and star.text == '*' and len(block.tokens) > 1 and block.tokens[1].keyword == 'from':
+            table = block.tables[0]
+            known = config.table_columns.get(table) or config.table_columns.get(table.rsplit('.', 1)[-1])
+            needed = config.response_columns.get(response_type or '')
+            if known and needed:
+                columns = [column for column in known if column in needed]
+                if columns:
+                    edits.append((star.start, star.end, ', '.join(columns)))
+            if not edits:
+                warnings.append("SELECT * returns every column")
+
+    if limit is None:
+        edits.append((len(sql), len(sql), f"\nLIMIT {config.default_limit}"))
+    elif limit.kind == 'number':
+        if float(limit.text) > config.max_limit:
+            edits.append((limit.start, limit.end, str(config.max_limit)))
+            warnings.append(f"LIMIT {limit.text} capped at {config.max_limit}")
+    else:
+        # LIMIT ALL / LIMIT <expression>: replace the value, keeping any OFFSET
+        offset = next((token for token in tokens if token.start > limit.start
+                       and token.depth == 0 and token.keyword == 'offset'), None)
+        edits.append((limit.end, offset.start if offset else len(sql), f" {config.max_limit}" + (" " if offset else "")))
+        warnings.append(f"LIMIT capped at {config.max_limit}")
+
+    for start, end, replacement in sorted(edits, reverse=True):
+        sql = sql[:start] + replacement + sql[end:]
+
+    tables = list(dict.fromkeys(name for block in blocks for name in block.tables))
+    return GuardResult(
+        sql, original_sql, _COST_CLASSES[cost], tables, warnings,
+        rewritten=normalize_sql(sql) != normalize_sql(original_sql),
+    )
@@ -0,0 +1,97 @@
+import queue
+import threading
+from typing import Iterator, Optional
+
+_DONE = object()
+
+
+class StatementChunkStream:
+    """
+    Lazily walks every INLINE result chunk of a finished statement.
+
+    The first chunk comes with the statement response; the rest are fetched by
+    following next_chunk_index on a background thread that stays at most
+    `prefetch` chunks ahead of the consumer, so network fetches overlap with
+    processing while memory stays bounded.
+    """
+
+    def __init__(self, client, response_data: dict, prefetch: int = 2):
+        """
+        :param client: GenieClient used to fetch further chunks
+        :param response_data: Final statement JSON returned by run_statement
+        :param prefetch: Maximum number of chunks buffered ahead of the consumer
+        """
+        self.client = client
+        self.response_data = response_data
+        self.statement_id = response_data.get("statement_id")
+        self.manifest = response_data.get("manifest", {})
+        self.prefetch = max(prefetch, 1)
+
+    @property
+    def columns(self) -> list[str]:
+        return [column["name"] for column in self.manifest.get("schema", {}).get("columns", [])]
+
+    def iter_chunks(self) -> Iterator[dict]:
+        """
+        Yields:
+            Chunk dicts (chunk_index, row_offset, row_count, data_array) in order
+        """
+        first_chunk = self.response_data.get("result")
+        if not first_chunk:
+            return
+        yield first_chunk
+        if first_chunk.get("next_chunk_index") is None:
+            return
+
+        # Per call, so the stream can be iterated again after an earlier pass stopped its producer
+        buffer: queue.Queue = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        producer = threading.Thread(
+            target=self._produce,
+            args=(first_chunk["next_chunk_index"], buffer, stop),
+            name=f"genie-chunks-{self.statement_id}",
+            daemon=True,
+        )
+        producer.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Consumer finished or stopped early: let the producer exit
+            stop.set()
+
+    def _produce(self, chunk_index: Optional[int], buffer: queue.Queue, stop: threading.Event):
+        try:
+            while chunk_index is not None and not stop.is_set():
+                chunk = self.client.get_result_chunk(self.statement_id, chunk_index)
+                self._put(buffer, chunk, stop)
+                chunk_index = chunk.get("next_chunk_index")
+            self._put(buffer, _DONE, stop)
+        except Exception as e:
+            self._put(buffer, e, stop)
+
+    @staticmethod
+    def _put(buffer: queue.Queue, item, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def iter_row_batches(self) -> Iterator[list[list]]:
+        """
+        Yields:
+            The rows of one chunk at a time
+        """
+        for chunk in self.iter_chunks():
+            yield chunk.get("data_array", [])
+
+    def iter_rows(self) -> Iterator[list]:
+        for rows in self.iter_row_batches():
+            yield from rows
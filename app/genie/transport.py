@@ -0,0 +1,168 @@
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Statuses that are worth retrying. 429 is Databricks rate limiting, the 5xx
+# family covers transient gateway / warehouse hiccups.
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# A POST is only retried when we know the server did not act on it, otherwise
+# a retried start-conversation could create a duplicate Genie message.
+POST_RETRYABLE_STATUSES = (429, 503)
+
+
+@dataclass
+class TransportConfig:
+    pool_connections: int = 4
+    pool_maxsize: int = 16
+    pool_block: bool = False
+    keep_alive: bool = True
+    max_retries: int = 4
+    backoff_base: float = 0.5
+    backoff_max: float = 20.0
+    default_timeout: tuple[float, float] = (5.0, 30.0)
+    # (connect, read) timeouts per Genie / SQL endpoint
+    timeouts: dict[str, tuple[float, float]] = field(
+        default_factory=lambda: {
+            "start_conversation": (5.0, 30.0),
+            "ask_follow_up": (5.0, 30.0),
+            "get_message": (5.0, 15.0),
+            "get_query_result": (5.0, 60.0),
+            "execute_statement": (5.0, 60.0),
+            "get_statement": (5.0, 15.0),
+            "cancel_statement": (5.0, 15.0),
+            "get_result_chunk": (5.0, 60.0),
+        }
+    )
+
+    def timeout_for(self, endpoint: Optional[str]) -> tuple[float, float]:
+        return self.timeouts.get(endpoint, self.default_timeout)
+
+
+class GenieTransport:
+    """
+    Pooled keep-alive HTTP transport shared by all GenieClient calls.
+
+    Wraps a single requests.Session so consecutive polls reuse the same TCP/TLS
+    connection, applies per-endpoint (connect, read) timeouts and retries
+    429/5xx responses with jittered exponential backoff.
+    """
+
+    def __init__(self, headers: Optional[dict] = None, config: Optional[TransportConfig] = None):
+        self.config = config or TransportConfig()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=self.config.pool_maxsize,
+            pool_block=self.config.pool_block,
+            max_retries=0,  # retries are handled in request() so they can be counted
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+        if headers:
+            self.session.headers.update(headers)
+        if not self.config.keep_alive:
+            self.session.headers["Connection"] = "close"
+
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "retries": 0, "errors": 0}
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        endpoint: Optional[str] = None,
+        timeout: Optional[tuple[float, float] | float] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Send a request through the pooled session, retrying retryable failures.
+
+        Args:
+            method: HTTP method, e.g. "GET" or "POST"
+            url: Absolute URL to call
+            endpoint: Logical endpoint name used to look up the timeout
+            timeout: Explicit timeout overriding the endpoint default
+
+        Returns:
+            The final requests.Response (raise_for_status is left to the caller)
+        """
+        method = method.upper()
+        retry_statuses = RETRYABLE_STATUSES if method == "GET" else POST_RETRYABLE_STATUSES
+        timeout = timeout if timeout is not None else self.config.timeout_for(endpoint)
+
+        attempt = 0
+        while True:
+            self._count("requests")
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                # A timed out POST may still have been processed server-side
+                if attempt >= self.config.max_retries or method != "GET":
+                    self._count("errors")
+                    raise
+                self._sleep_before_retry(attempt, None)
+                attempt += 1
+                continue
+
+            if response.status_code in retry_statuses and attempt < self.config.max_retries:
+                self._sleep_before_retry(attempt, response.headers.get("Retry-After"))
+                response.close()
+                attempt += 1
+                continue
+
+            if response.status_code >= 400:
+                self._count("errors")
+            return response
+
+    def get(self, url: str, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request("GET", url, endpoint=endpoint, **kwargs)
+
+    def post(self, url: str, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
+        return self.request("POST", url, endpoint=endpoint, **kwargs)
+
+    def _sleep_before_retry(self, attempt: int, retry_after: Optional[str]):
+        self._count("retries")
+        delay = None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = None
+        if delay is None:
+            # "Full jitter": spreads retries from concurrent callers over the window
+            delay = random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2**attempt))
+        time.sleep(min(delay, self.config.backoff_max))
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self) -> dict:
+        """
+        Return request / retry counters and how many connections were reused.
+
+        Connections opened are read from urllib3's per-host pools, so
+        `connections_reused` is the number of requests that did not need a new
+        TCP+TLS handshake.
+        """
+        pools = self._adapter.poolmanager.pools
+        connections_opened = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections_opened += pool.num_connections
+        with self._lock:
+            counters = dict(self._counters)
+        counters["connections_opened"] = connections_opened
+        counters["connections_reused"] = max(counters["requests"] - connections_opened, 0)
+        return counters
+
+    def close(self):
+        self.session.close()
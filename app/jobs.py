@@ -0,0 +1,122 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class Job:
+    """
+    Handle for a query running on the JobExecutor.
+
+    The worker reports progress through update(); the page reads snapshot()
+    on every refresh and can request cancellation with cancel().
+    """
+
+    def __init__(self, description: str = ""):
+        self.id = str(uuid.uuid4())
+        self.description = description
+        self.status = QUEUED
+        self.progress: dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.cancel_event = threading.Event()
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._future: Optional[Future] = None
+        self._lock = threading.Lock()
+
+    def update(self, **progress):
+        with self._lock:
+            self.progress.update(progress)
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self._future is not None and self._future.cancel():
+            # Never started: no worker will pick it up
+            self._finish(CANCELLED)
+
+    def done(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def elapsed(self) -> float:
+        start = self.started_at or self.submitted_at
+        return (self.finished_at or time.time()) - start
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "id": self.id,
+                "description": self.description,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "elapsed": self.elapsed(),
+            }
+
+    def _finish(self, status: str, result: Any = None, error: Optional[BaseException] = None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+
+
+class JobExecutor:
+    """
+    Process-wide executor that runs Genie + SQL round trips off the Streamlit
+    script thread. Finished jobs are kept for retention_seconds so a session
+    can pick up its result on a later rerun.
+    """
+
+    def __init__(self, max_workers: int = 8, retention_seconds: float = 3600):
+        self.retention_seconds = retention_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="query-job")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, description: str = "", **kwargs) -> Job:
+        """
+        Run fn(*args, job=job, **kwargs) in the background.
+
+        fn receives its Job so it can report progress and watch job.cancel_event.
+        """
+        job = Job(description)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job._future = self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_jobs(self) -> list[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.done()]
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: dict):
+        if job.cancel_event.is_set():
+            job._finish(CANCELLED)
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            result = fn(*args, job=job, **kwargs)
+        except Exception as e:
+            job._finish(CANCELLED if job.cancel_event.is_set() else FAILED, error=e)
+        else:
+            job._finish(CANCELLED if job.cancel_event.is_set() else SUCCEEDED, result=result)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done() and job.finished_at < cutoff]:
+            del self._jobs[job_id]
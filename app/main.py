@@ -1,18 +1,35 @@
 import streamlit as st
 import folium
-from folium import plugins
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import json
+import os
 import requests
 from streamlit_folium import st_folium
 import random
-from shapely import wkt
-from shapely.geometry import Point, Polygon, LineString
 import numpy as np
+from genie.columnar import ColumnarResult
 from genie.genie_client import GenieClient
+from genie.polling import PollCancelledError
+from genie.question_cache import QuestionCache
+from genie.result_cache import SQLResultCache
+from genie.sql_guard import GuardConfig, SQLGuardError, guard_sql
+from jobs import JobExecutor
+from osm.api import OSMClient
+from osm.scoring import INDICATORS, UserScoreCache, changesets_frame, score_changesets, weekly_activity
+from osm.store import ChangesetStore
+from spatial.aggregation import ChangesetAggregator, resolution_for_zoom
+from spatial.geometry import attach_geometries, ensure_geometries
+from spatial.index import ChangesetIndex
+from spatial.rendering import (
+    MapRenderConfig,
+    add_changeset_layers,
+    add_grid_layer,
+    add_heatmap_layer,
+    add_time_heatmap_layer,
+)
 
 st.set_page_config(
     page_title="OSM Vandalism Validator",
@@ -20,72 +37,149 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+
+WAREHOUSE_ID = "df28ac49a1cee3e9"
+
+# Generated SQL may only read these tables (comma-separated, e.g. "osm.changesets") with a filter
+SQL_GUARD_CONFIG = GuardConfig(
+    large_tables={name.strip().lower() for name in os.getenv("SQL_GUARD_LARGE_TABLES", "").split(",") if name.strip()}
+)
+
+SPATIAL_QUERY_WORDS = ['show', 'visualize', 'map', 'where', 'location', 'area']
+
+MAP_MODES = ["Auto", "Changesets", "Heatmap", "Grid", "Heatmap over time"]
+
+
+@st.cache_resource
+def get_result_cache():
+    """Process-wide SQL result cache shared by all sessions"""
+    return SQLResultCache()
+
+
+@st.cache_resource
+def get_osm_client():
+    """Process-wide OSM API client; its changeset / user caches are shared by all sessions
+
+    Changesets are read from the local store filled by `python -m osm.ingest` first.
+    """
+    return OSMClient(store=ChangesetStore(os.getenv("OSM_STORE_DIR", ".osm_store/changesets")))
+
+
+@st.cache_resource
+def get_user_scores():
+    """Process-wide per-user changeset history and vandalism scores"""
+    return UserScoreCache()
+
+
+def refresh_user_scores(uids):
+    """
+    Brings the cached scores of `uids` up to date, fetching only changesets
+    newer than what is already known for each user.
+    """
+    scores = get_user_scores()
+    stale = scores.stale(uids)
+    if stale:
+        histories = get_osm_client().get_user_changesets(stale)
+        frame = changesets_frame(changeset for changesets in histories.values() for changeset in changesets)
+        scores.update(frame, uids=stale)
+    return scores
+
+
+@st.cache_resource
+def get_question_cache():
+    """Process-wide cache of Genie-generated SQL for repeated questions"""
+    return QuestionCache()
+
+
+@st.cache_resource
+def get_genie_client():
+    """Process-wide Genie client; its pooled keep-alive session is reused for every question"""
+    return GenieClient(
+        workspace_url="https://adb-2516823083981110.10.azuredatabricks.net",
+        auth_token="",
+        space_id="01f04140c25a1a47b5365212d84699f2",
+        question_cache=get_question_cache(),
+    )
+
+def build_osm_user_profile(changeset_id, lookup, scores):
+    """
+    Formats one OSMClient.lookup() entry (changeset + user) and the user's
+    computed scores for the display_user_profile function. Returns None if the
+    user record is unusable.
+    """
+    changeset_details = lookup['changeset']
+    osm_user = changeset_details.get('user', 'N/A')
+    user_id = changeset_details.get('uid')
+    user_details = lookup.get('user') or {}
+    account_created_str = user_details.get('account_created')
+    
+    if not user_id or not account_created_str:
+        return None
+
+    account_created_dt = datetime.fromisoformat(account_created_str.replace('Z', '+00:00'))
+    days_active = (datetime.now(account_created_dt.tzinfo) - account_created_dt).days
+    user_scores = scores.get(user_id) or {}
+    history = scores.history(user_id)
+    activity = weekly_activity(history)
+    
+    return {
+        'response_type': 'user_profile',
+        'data': {
+            'user_id': user_id,
+            'user_name': osm_user,
+            'registration_date': account_created_dt.strftime('%Y-%m-%d'),
+            'days_active': days_active,
+            'total_changesets': user_details.get('changesets', {}).get('count', 0),
+            'total_edits': int(user_scores.get('total_edits', 0)),
+            'countries_edited': ['Germany', 'Poland'],
+            'preferred_tools': scores.editors(user_id) or ['Unknown'],
+            'avg_changes_per_changeset': round(float(user_scores.get('avg_changes_per_changeset', 0.0)), 1),
+            'received_messages': int(user_scores.get('discussion_comments', 0)),
+            'blocks_received': (user_details.get('blocks') or {}).get('received', {}).get('count', 0),
+            'block_history': [],
+            'community_reports': int(user_scores.get('discussed_changesets', 0)),
+            'organized_editing': False,
+            'vandalism_score': round(float(user_scores.get('vandalism_score', 0.0)), 2),
+            'vandalism_indicators': {
+                indicator: bool(user_scores.get(indicator, False)) for indicator in INDICATORS
+            },
+            'weekly_activity': {
+                'weeks': activity.index.tolist(),
+                'changesets': activity['changesets'].tolist(),
+            },
+        },
+        'summary': f"Generated live profile for user '{osm_user}' from changeset '{changeset_id}'"
+    }
+
+def fetch_osm_user_profiles(changeset_ids):
+    """
+    Fetches user profiles for many changesets with one bulk OSM lookup and one
+    batched scoring pass over the authors' recent changesets.
+    Returns a list aligned with changeset_ids (None where the changeset or its
+    user could not be resolved).
+    """
+    lookups = get_osm_client().lookup(changeset_ids)
+    scores = refresh_user_scores({lookup['changeset']['uid'] for lookup in lookups if lookup and lookup['changeset'].get('uid')})
+    return [
+        build_osm_user_profile(changeset_id, lookup, scores) if lookup else None
+        for changeset_id, lookup in zip(changeset_ids, lookups)
+    ]
+
 def fetch_real_osm_user_data(changeset_id):
     """
     Fetches real user data from the OSM API given a changeset ID.
     Returns a dictionary formatted for the display_user_profile function.
     """
     try:
-        changeset_url = f"https://api.openstreetmap.org/api/0.6/changeset/{changeset_id}.json"
-        changeset_response = requests.get(changeset_url, headers={'Accept': 'application/json'})
-        changeset_response.raise_for_status()
-        changeset_data = changeset_response.json()
-
-        if 'changeset' in changeset_data and changeset_data['changeset']:
-            changeset_details = changeset_data['changeset']
-            osm_user = changeset_details.get('user', 'N/A')
-            user_id = changeset_details.get('uid')
-
-            if not user_id:
-                st.error("Could not find a user ID in the changeset data.")
-                return None
-        else:
-            st.error(f"Unexpected API response for changeset {changeset_id}. The 'elements' key was not found.")
-            st.json(changeset_data)
-            return None
-
-        user_url = f"https://api.openstreetmap.org/api/0.6/user/{user_id}.json"
-        user_response = requests.get(user_url)
-        user_response.raise_for_status()
-        user_data_response = user_response.json()
-        
-        user_details = user_data_response.get('user', {})
-        account_created_str = user_details.get('account_created')
-        
-        if not account_created_str:
-            st.error(f"Could not find account creation date for user {user_id}.")
-            return None
-
-        account_created_dt = datetime.fromisoformat(account_created_str.replace('Z', '+00:00'))
-        days_active = (datetime.now(account_created_dt.tzinfo) - account_created_dt).days
-        
-        profile_data = {
-            'response_type': 'user_profile',
-            'data': {
-                'user_id': user_id,
-                'user_name': osm_user,
-                'registration_date': account_created_dt.strftime('%Y-%m-%d'),
-                'days_active': days_active,
-                'total_changesets': user_details.get('changesets', {}).get('count', 0),
-                'total_edits': random.randint(500, 5000),
-                'countries_edited': ['Germany', 'Poland'],
-                'preferred_tools': ['iD', 'JOSM'],
-                'avg_changes_per_changeset': round(random.uniform(10, 60), 1),
-                'received_messages': random.randint(0, 5),
-                'blocks_received': 0,
-                'block_history': [],
-                'community_reports': random.randint(0, 10),
-                'organized_editing': False,
-                'vandalism_indicators': {
-                    'rapid_editing': random.choice([True, False]),
-                    'pattern_repetition': random.choice([True, False]),
-                    'ignores_community_feedback': random.choice([True, False])
-                }
-            },
-            'summary': f"Generated live profile for user '{osm_user}' from changeset '{changeset_id}'"
-        }
+        profile_data = fetch_osm_user_profiles([int(changeset_id)])[0]
+        if profile_data is None:
+            st.error(f"Could not find changeset {changeset_id} or its user in the OSM API.")
+            st.info("This can happen if the changeset ID does not exist or has been deleted.")
         return profile_data
 
+    except ValueError:
+        st.error(f"'{changeset_id}' is not a valid changeset ID.")
+        return None
     except requests.exceptions.HTTPError as e:
         st.error(f"Failed to fetch data from OSM API. HTTP Status: {e.response.status_code}. Please check the changeset ID.")
         st.info("This can happen if the changeset ID does not exist or has been deleted.")
@@ -100,255 +194,131 @@ def fetch_real_osm_user_data(changeset_id):
         st.error(f"An unexpected error occurred: {e}")
         return None
 
+def fetch_osm_changeset_table(changeset_ids):
+    """
+    Looks up many changesets at once and returns a 'table' response with one
+    row per changeset and its author.
+    """
+    try:
+        lookups = get_osm_client().lookup(changeset_ids)
+        found_changesets = [lookup['changeset'] for lookup in lookups if lookup]
+        scores = refresh_user_scores({changeset['uid'] for changeset in found_changesets if changeset.get('uid')})
+    except requests.exceptions.RequestException as e:
+        st.error(f"Failed to fetch data from OSM API: {e}")
+        return None
+    records = []
+    for changeset_id, lookup in zip(changeset_ids, lookups):
+        changeset = (lookup or {}).get('changeset') or {}
+        user = (lookup or {}).get('user') or {}
+        records.append({
+            'id': changeset_id,
+            'user_name': changeset.get('user', 'N/A'),
+            'uid': changeset.get('uid'),
+            'created_at': changeset.get('created_at'),
+            'changes_count': changeset.get('changes_count'),
+            'comment': (changeset.get('tags') or {}).get('comment'),
+            'account_created': user.get('account_created'),
+            'total_changesets': (user.get('changesets') or {}).get('count'),
+        })
+    if found_changesets:
+        # One vectorized pass scores the whole batch
+        frame = changesets_frame(found_changesets)
+        changeset_scores = dict(zip(frame['id'].tolist(), score_changesets(frame, scores.scores()).round(2).tolist()))
+        for record in records:
+            record['vandalism_score'] = changeset_scores.get(record['id'])
+    found = len(found_changesets)
+    return {
+        'response_type': 'table',
+        'data': ColumnarResult.from_records(records),
+        'summary': f"Found {found} of {len(changeset_ids)} changesets in the OSM API"
+    }
+
 def parse_genie_response(response):
     pass
 
-def call_genie_api(query, conversation_id=None):
+def call_genie_api(query, conversation_id=None, bypass_cache=False, reuse_attachment=True, job=None):
     """Mock function to simulate Databricks Genie API responses with conversation support
     
     Args:
         query: The user's query
         conversation_id: Optional conversation ID for follow-up questions
+        bypass_cache: Re-run the generated SQL even if a cached result exists
+        reuse_attachment: Use the result Genie already computed for its query, falling
+            back to executing the SQL when it is missing or expired
+        job: Optional background Job to report progress to and take cancellation from
         
     Returns:
-        dict: Response with data and conversation context
+        dict: Response with data and conversation context; query responses carry
+            'result_source' ('cache', 'genie_attachment' or 'warehouse') and the
+            'sql_cost' class and 'sql_warnings' of the cost guard
     """
 
-    query_lower = query.lower()
-    
-
-    genie_client = GenieClient(
-        workspace_url="https://adb-2516823083981110.10.azuredatabricks.net",
-        auth_token="",
-        space_id="01f04140c25a1a47b5365212d84699f2",
-    )
+    genie_client = get_genie_client()
         
 
-    response_data, conversation_id = genie_client.ask_question(query, conversation_id)
+    cancel_event = job.cancel_event if job else None
+
+    def report_poll(poll_round, message):
+        if job:
+            job.update(stage='genie', genie_status=message['status'], poll_round=poll_round)
+
+    response_data, conversation_id = genie_client.ask_question(
+        query, conversation_id, cancel_event=cancel_event, on_poll=report_poll
+    )
     
     if response_data["type"] == "query":
         try:
-
-            result = genie_client.execute_sql_query(
-                warehouse_id="df28ac49a1cee3e9", 
-                query=response_data["message"]
+            # Bound and check the generated SQL before it can reach the warehouse; a rejection only
+            # matters if the statement has to be executed (Genie's own result is reused first)
+            response_type = 'spatial' if any(word in query.lower() for word in SPATIAL_QUERY_WORDS) else None
+            try:
+                guarded, guard_error = guard_sql(response_data["message"], response_type, SQL_GUARD_CONFIG), None
+            except SQLGuardError as e:
+                guarded, guard_error = None, e
+
+            result_source = 'cache'
+
+            def run_query():
+                nonlocal result_source
+                stream = None
+                # Genie already executed its query: reuse that result unless it is missing or expired
+                if reuse_attachment and response_data.get('attachment_id') and response_data.get('message_id'):
+                    stream = genie_client.stream_attachment_result(
+                        response_data.get('conversation_id') or conversation_id,
+                        response_data['message_id'],
+                        response_data['attachment_id']
+                    )
+                result_source = 'genie_attachment'
+                if stream is None:
+                    if guard_error is not None:
+                        raise guard_error
+                    result_source = 'warehouse'
+                    if job:
+                        job.update(stage='sql')
+                    stream = genie_client.stream_sql_query(
+                        warehouse_id=WAREHOUSE_ID, 
+                        query=guarded.sql,
+                        cancel_event=cancel_event
+                    )
+                # Build the typed columnar result once; every branch below reads from it
+                return ColumnarResult.from_statement(stream.manifest, track_rows(stream.iter_row_batches(), job)), stream.manifest
+
+            # Keyed on Genie's SQL: the result is either Genie's own or that of its guarded form
+            result, manifest = get_result_cache().get_or_execute(
+                response_data["message"], WAREHOUSE_ID, run_query, bypass=bypass_cache
             )
+            response, conversation_id = build_query_response(query, result, manifest, response_data, conversation_id)
+            response['result_source'] = result_source
+            response['sql_cost'] = guarded.cost_class if guarded else 'high'
+            response['sql_warnings'] = guarded.warnings if guarded else [str(guard_error)]
+            return response, conversation_id
             
-
-            if 'manifest' in result and 'data_array' in result:
-
-                if any(word in query_lower for word in ['show', 'visualize', 'map', 'where', 'location', 'area']):
-                    
-                    if result['data_array'] and len(result['data_array']) > 0:
-
-                        columns = [col['name'] for col in result['manifest'].get('schema', {}).get('columns', [])]
-                        data = []
-                        for row in result['data_array']:
-                            data.append(dict(zip(columns, row)))
-                        
-                        validated_data = []
-                        for item in data:
-                            if 'bbox' not in item or not item['bbox']:
-
-                                if 'center' in item and item['center']:
-
-                                    try:
-
-                                        point_str = item['center'].replace('POINT(', '').replace(')', '')
-                                        lon, lat = map(float, point_str.split())
-
-                                        bbox = f"POLYGON(({lon-0.005} {lat-0.005}, {lon+0.005} {lat-0.005}, {lon+0.005} {lat+0.005}, {lon-0.005} {lat+0.005}, {lon-0.005} {lat-0.005}))"
-                                        item['bbox'] = bbox
-                                    except:
-
-                                        continue
-                                else:
-
-                                    continue
-                            validated_data.append(item)
-                        
-                        if validated_data:
-                            return {
-                                'response_type': 'spatial',
-                                'data': validated_data,
-                                'manifest': result['manifest'],
-                                'description': response_data['description'],
-                                'summary': f'Found {len(validated_data)} spatial features matching: {query}'
-                            }, conversation_id
-                        else:
-                            return {
-                                'response_type': 'table',
-                                'data': data,
-                                'manifest': result['manifest'],
-                                'description': response_data['description'],
-                                'summary': f'Found {len(data)} spatial features matching: {query}'
-                            }, conversation_id
-                    
-
-                    return {
-                        'response_type': 'spatial',
-                        'data': [
-                            {
-                                'id': 145623789,
-                                'user_name': 'mapper_suspicious',
-                                'user_id': 12345,
-                                'created': '2024-06-15T14:30:00Z',
-                                'change_count': 156,
-                                'comment': 'Adding buildings',
-                                'bbox': 'POLYGON((13.3888 52.5170, 13.4888 52.5170, 13.4888 52.4170, 13.3888 52.4170, 13.3888 52.5170))',
-                                'center': 'POINT(13.4388 52.4670)',
-                                'country': 'Germany',
-                                'tool': 'iD',
-                                'vandalism_score': 0.85,
-                                'flags': ['suspicious_editing_pattern', 'high_change_velocity']
-                            }
-                        ],
-                        'description': response_data['description'],
-                        'summary': f'Found 1 changeset matching: {query}'
-                    }, conversation_id
-                
-
-                elif any(word in query_lower for word in ['editor', 'mapper', 'who', 'history']):
-                    # Convert data_array to list of dicts using manifest column names
-                    columns = [col['name'] for col in result['manifest'].get('schema', {}).get('columns', [])]
-                    data = [dict(zip(columns, row)) for row in result['data_array']] if result['data_array'] else []
-                    
-
-                    valid_profiles = [
-                        profile for profile in data 
-                        if 'user_id' in profile and 'user_name' in profile
-                    ]
-                    
-                    if valid_profiles:
-
-                        profile = valid_profiles[0]
-                        
-
-                        profile.setdefault('registration_date', '2024-01-01')
-                        profile.setdefault('days_active', 100)
-                        profile.setdefault('total_changesets', 50)
-                        profile.setdefault('total_edits', 2500)
-                        profile.setdefault('countries_edited', ['Unknown'])
-                        profile.setdefault('preferred_tools', ['iD', 'JOSM'])
-                        profile.setdefault('received_messages', 0)
-                        profile.setdefault('blocks_received', 0)
-                        profile.setdefault('block_history', [])
-                        profile.setdefault('community_reports', 0)
-                        profile.setdefault('organized_editing', False)
-                        profile.setdefault('vandalism_indicators', {
-                            'rapid_editing': False,
-                            'pattern_repetition': False,
-                            'ignores_community_feedback': False
-                        })
-                        
-                        return {
-                            'response_type': 'user_profile',
-                            'data': profile,
-                            'manifest': result['manifest'],
-                            'description': response_data['description'],
-                            'summary': f'User profile for: {profile.get("user_name", "Unknown User")}'
-                        }, conversation_id
-                    
-
-                    return {
-                        'response_type': 'user_profile',
-                        'data': {
-                            'user_id': 12345,
-                            'user_name': 'mock_user',
-                            'registration_date': '2024-01-01',
-                            'days_active': 100,
-                            'total_changesets': 50,
-                            'total_edits': 2500,
-                            'countries_edited': ['Unknown'],
-                            'preferred_tools': ['iD', 'JOSM'],
-                            'received_messages': 0,
-                            'blocks_received': 0,
-                            'block_history': [],
-                            'community_reports': 0,
-                            'organized_editing': False,
-                            'vandalism_indicators': {
-                                'rapid_editing': False,
-                                'pattern_repetition': False,
-                                'ignores_community_feedback': False
-                            }
-                        },
-                        'description': response_data['description'],
-                        'summary': 'User profile'
-                    }, conversation_id
-                
-
-                elif any(word in query_lower for word in ['chart', 'graph', 'trend', 'pattern', 'statistics', 'count']):
-                    # Convert data_array to list of dicts using manifest column names
-                    columns = [col['name'] for col in result['manifest'].get('schema', {}).get('columns', [])]
-                    data = [dict(zip(columns, row)) for row in result['data_array']] if result['data_array'] else []
-                    
-                    if len(data) > 1 and 'date' in data[0] and 'count' in data[0]:
-                        dates = [item['date'] for item in data]
-                        counts = [item['count'] for item in data]
-                        return {
-                            'response_type': 'analytics',
-                            'data': {
-                                'chart_type': 'line',
-                                'title': 'Analytics Results',
-                                'x_values': dates,
-                                'y_values': counts,
-                                'x_label': 'Date',
-                                'y_label': 'Count',
-                                'additional_data': {
-                                    'total_records': len(data),
-                                    'min_value': min(counts) if counts else 0,
-                                    'max_value': max(counts) if counts else 0,
-                                    'avg_value': sum(counts)/len(counts) if counts else 0
-                                }
-                            },
-                            'manifest': result['manifest'],
-                            'description': response_data['description'],
-                            'summary': f'Analytics for: {query}'
-                        }, conversation_id
-                    
-
-                    dates = pd.date_range('2024-06-01', '2024-06-15', freq='D')
-                    return {
-                        'response_type': 'analytics',
-                        'data': {
-                            'chart_type': 'line',
-                            'title': 'Vandalism Detection Trends',
-                            'x_values': [d.strftime('%Y-%m-%d') for d in dates],
-                            'y_values': [random.randint(10, 50) for _ in dates],
-                            'x_label': 'Date',
-                            'y_label': 'Count',
-                            'additional_data': {
-                                'total_changesets_analyzed': 1247,
-                                'flagged_as_suspicious': 89,
-                                'confirmed_vandalism': 23,
-                                'false_positives': 12
-                            }
-                        },
-                        'description': response_data['description'],
-                        'summary': f'Analytics for: {query}'
-                    }, conversation_id
-                
-                elif (word in query_lower for word in ['how many']):
-                    # Treat this as a text response and show the answer in the chat box only
-                    return {
-                        'response_type': 'text',
-                        'description': result['data_array'][0][0],
-                        'summary': f'Response from Genie for: {query}'
-                    }, conversation_id
-
-                else:
-                    # Convert data_array to list of dicts using manifest column names
-                    columns = [col['name'] for col in result['manifest'].get('schema', {}).get('columns', [])]
-                    data = [dict(zip(columns, row)) for row in result['data_array']] if result['data_array'] else []
-                    
-                    return {
-                        'response_type': 'table',
-                        'data': data,
-                        'manifest': result['manifest'],
-                        'description': response_data['description'],
-                        'summary': f'Query returned {len(data)} rows'
-                    }, conversation_id
-            
+        except SQLGuardError as e:
+            return {
+                'response_type': 'error',
+                'data': f'Query rejected: {str(e)}',
+                'summary': 'The generated SQL was blocked to protect the warehouse'
+            }, conversation_id
         except Exception as e:
             return {
                 'response_type': 'error',
@@ -363,23 +333,212 @@ def call_genie_api(query, conversation_id=None):
         'summary': f'Response from Genie for: {query}'
     }, conversation_id
 
-def create_map_with_changesets(changesets_data):
-    """Create a folium map with changeset data"""
-    
-    
-    if changesets_data:
-        if 'center' in changesets_data[0]:
-            # If center exists, use it
-            first_center = wkt.loads(changesets_data[0]['center'])
-            center_lat, center_lon = first_center.y, first_center.x
-        elif 'bbox' in changesets_data[0]:
-            # If only bbox exists, use its centroid
-            bbox = wkt.loads(changesets_data[0]['bbox'])
-            center = bbox.centroid
-            center_lat, center_lon = center.y, center.x
-        else:
-            # Default to Berlin if no valid geometry is found
-            center_lat, center_lon = 52.5200, 13.4050
+def track_rows(row_batches, job):
+    """Pass row batches through while reporting rows fetched to the job"""
+    rows_fetched = 0
+    for rows in row_batches:
+        if job:
+            if job.cancel_event.is_set():
+                # Raise rather than stop so a partial result never reaches the cache
+                raise PollCancelledError("Query was cancelled")
+            rows_fetched += len(rows)
+            job.update(stage='fetch', rows_fetched=rows_fetched)
+        yield rows
+
+def build_query_response(query, result, manifest, response_data, conversation_id):
+    """Pick the response type for a query result based on the question wording"""
+
+    query_lower = query.lower()
+
+    if any(word in query_lower for word in SPATIAL_QUERY_WORDS):
+        
+        if result:
+
+            validated_data = attach_geometries(result)
+            
+            if validated_data:
+                return {
+                    'response_type': 'spatial',
+                    'data': validated_data,
+                    'manifest': manifest,
+                    'description': response_data['description'],
+                    'summary': f'Found {len(validated_data)} spatial features matching: {query}'
+                }, conversation_id
+            else:
+                return {
+                    'response_type': 'table',
+                    'data': result,
+                    'manifest': manifest,
+                    'description': response_data['description'],
+                    'summary': f'Found {len(result)} spatial features matching: {query}'
+                }, conversation_id
+        
+
+        return {
+            'response_type': 'spatial',
+            'data': ColumnarResult.from_records([
+                {
+                    'id': 145623789,
+                    'user_name': 'mapper_suspicious',
+                    'user_id': 12345,
+                    'created': '2024-06-15T14:30:00Z',
+                    'change_count': 156,
+                    'comment': 'Adding buildings',
+                    'bbox': 'POLYGON((13.3888 52.5170, 13.4888 52.5170, 13.4888 52.4170, 13.3888 52.4170, 13.3888 52.5170))',
+                    'center': 'POINT(13.4388 52.4670)',
+                    'country': 'Germany',
+                    'tool': 'iD',
+                    'vandalism_score': 0.85,
+                    'flags': ['suspicious_editing_pattern', 'high_change_velocity']
+                }
+            ]),
+            'description': response_data['description'],
+            'summary': f'Found 1 changeset matching: {query}'
+        }, conversation_id
+    
+
+    elif any(word in query_lower for word in ['editor', 'mapper', 'who', 'history']):
+
+        if result and 'user_id' in result and 'user_name' in result:
+
+            profile = result.row(0)
+            
+
+            profile.setdefault('registration_date', '2024-01-01')
+            profile.setdefault('days_active', 100)
+            profile.setdefault('total_changesets', 50)
+            profile.setdefault('total_edits', 2500)
+            profile.setdefault('countries_edited', ['Unknown'])
+            profile.setdefault('preferred_tools', ['iD', 'JOSM'])
+            profile.setdefault('received_messages', 0)
+            profile.setdefault('blocks_received', 0)
+            profile.setdefault('block_history', [])
+            profile.setdefault('community_reports', 0)
+            profile.setdefault('organized_editing', False)
+            profile.setdefault('vandalism_indicators', {
+                'rapid_editing': False,
+                'pattern_repetition': False,
+                'ignores_community_feedback': False
+            })
+            
+            return {
+                'response_type': 'user_profile',
+                'data': profile,
+                'manifest': manifest,
+                'description': response_data['description'],
+                'summary': f'User profile for: {profile.get("user_name", "Unknown User")}'
+            }, conversation_id
+        
+
+        return {
+            'response_type': 'user_profile',
+            'data': {
+                'user_id': 12345,
+                'user_name': 'mock_user',
+                'registration_date': '2024-01-01',
+                'days_active': 100,
+                'total_changesets': 50,
+                'total_edits': 2500,
+                'countries_edited': ['Unknown'],
+                'preferred_tools': ['iD', 'JOSM'],
+                'received_messages': 0,
+                'blocks_received': 0,
+                'block_history': [],
+                'community_reports': 0,
+                'organized_editing': False,
+                'vandalism_indicators': {
+                    'rapid_editing': False,
+                    'pattern_repetition': False,
+                    'ignores_community_feedback': False
+                }
+            },
+            'description': response_data['description'],
+            'summary': 'User profile'
+        }, conversation_id
+    
+
+    elif any(word in query_lower for word in ['chart', 'graph', 'trend', 'pattern', 'statistics', 'count']):
+        
+        if len(result) > 1 and 'date' in result and 'count' in result:
+            dates = result['date']
+            counts = result['count']
+            return {
+                'response_type': 'analytics',
+                'data': {
+                    'chart_type': 'line',
+                    'title': 'Analytics Results',
+                    'x_values': dates,
+                    'y_values': counts,
+                    'x_label': 'Date',
+                    'y_label': 'Count',
+                    'additional_data': {
+                        'total_records': len(result),
+                        'min_value': float(np.nanmin(counts)),
+                        'max_value': float(np.nanmax(counts)),
+                        'avg_value': float(np.nanmean(counts))
+                    }
+                },
+                'manifest': manifest,
+                'description': response_data['description'],
+                'summary': f'Analytics for: {query}'
+            }, conversation_id
+        
+
+        dates = pd.date_range('2024-06-01', '2024-06-15', freq='D')
+        return {
+            'response_type': 'analytics',
+            'data': {
+                'chart_type': 'line',
+                'title': 'Vandalism Detection Trends',
+                'x_values': [d.strftime('%Y-%m-%d') for d in dates],
+                'y_values': [random.randint(10, 50) for _ in dates],
+                'x_label': 'Date',
+                'y_label': 'Count',
+                'additional_data': {
+                    'total_changesets_analyzed': 1247,
+                    'flagged_as_suspicious': 89,
+                    'confirmed_vandalism': 23,
+                    'false_positives': 12
+                }
+            },
+            'description': response_data['description'],
+            'summary': f'Analytics for: {query}'
+        }, conversation_id
+    
+    elif any(word in query_lower for word in ['how many']) and result:
+        # Treat this as a text response and show the answer in the chat box only
+        return {
+            'response_type': 'text',
+            'description': str(result[result.columns[0]][0]),
+            'summary': f'Response from Genie for: {query}'
+        }, conversation_id
+
+    else:
+        return {
+            'response_type': 'table',
+            'data': result,
+            'manifest': manifest,
+            'description': response_data['description'],
+            'summary': f'Query returned {len(result)} rows'
+        }, conversation_id
+
+def create_map_with_changesets(changesets_data, zoom=None, render_config=None, center=None):
+    """Create a folium map with changeset data (a ColumnarResult)
+    
+    Changesets are drawn as a handful of GeoJSON / cluster layers rather than one
+    element per changeset, simplified for `zoom` (the zoom the user last viewed).
+    `center` ({"lat", "lng"}) keeps the user's current view instead of jumping
+    to the first changeset.
+    """
+    
+    # Geometries are parsed once for the whole result, not per changeset
+    changesets_data = ensure_geometries(changesets_data)
+    
+    if center:
+        center_lat, center_lon = center['lat'], center['lng']
+    elif changesets_data:
+        # Center on the first changeset (its bbox centroid if it has no center)
+        center_lat, center_lon = changesets_data['lat'][0], changesets_data['lon'][0]
     else:
         # Default to Berlin if no data
         center_lat, center_lon = 52.5200, 13.4050
@@ -387,60 +546,40 @@ def create_map_with_changesets(changesets_data):
 
     m = folium.Map(
         location=[center_lat, center_lon],
-        zoom_start=12,
+        zoom_start=zoom or 12,
         tiles='OpenStreetMap'
     )
     
+    add_changeset_layers(m, changesets_data, zoom=zoom, config=render_config)
+    
+    return m
 
-    for changeset in changesets_data:
-
-        try:
-            bbox_geom = wkt.loads(changeset['bbox'])
-            center_geom = wkt.loads(changeset['center'])
-            
-
-            vandalism_score = changeset.get('vandalism_score', 0)
-            if vandalism_score > 0.7:
-                color = 'red'
-                fillColor = 'red'
-            elif vandalism_score > 0.4:
-                color = 'orange'
-                fillColor = 'orange'
-            else:
-                color = 'green'
-                fillColor = 'green'
-            
-
-            if bbox_geom.geom_type == 'Polygon':
-                coords = [[point[1], point[0]] for point in bbox_geom.exterior.coords]
-                folium.Polygon(
-                    locations=coords,
-                    color=color,
-                    fillColor=fillColor,
-                    fillOpacity=0.3,
-                    weight=2,
-                    popup=f"""
-                    <b>Changeset {changeset.get('id', 'Unknown')}</b><br>
-                    User: {changeset.get('user_name', 'Unknown')}<br>
-                    Changes: {changeset.get('change_count', 'Unknown')}<br>
-                    Score: {vandalism_score:.2f}<br>
-                    Comment: {changeset.get('comment', 'Unknown')}<br>
-                    Flags: {', '.join(changeset.get('flags', []))}
-                    """
-                ).add_to(m)
-            
-
-            folium.CircleMarker(
-                location=[center_geom.y, center_geom.x],
-                radius=8,
-                color=color,
-                fillColor=fillColor,
-                fillOpacity=0.8,
-                popup=f"Changeset {changeset['id']}"
-            ).add_to(m)
-            
-        except Exception as e:
-            st.error(f"Error parsing geometry for changeset {changeset['id']}: {e}")
+def create_aggregate_map(aggregator, mode, zoom=None, center=None, bounds=None):
+    """Create a folium map of a spatial result aggregated to grid cells
+    
+    Used for results too large to draw changeset by changeset. The grid
+    resolution follows `zoom`; per-resolution grids are cached on the aggregator.
+    """
+    resolution = resolution_for_zoom(zoom)
+    if center:
+        center_lat, center_lon = center['lat'], center['lng']
+    elif len(aggregator):
+        center_lat, center_lon = float(np.median(aggregator.lat)), float(np.median(aggregator.lon))
+    else:
+        center_lat, center_lon = 52.5200, 13.4050
+    
+    m = folium.Map(
+        location=[center_lat, center_lon],
+        zoom_start=zoom or 8,
+        tiles='OpenStreetMap'
+    )
+    
+    if mode == 'Heatmap over time':
+        add_time_heatmap_layer(m, aggregator.time_sliced(resolution, 'D'))
+    elif mode == 'Heatmap':
+        add_heatmap_layer(m, aggregator.grid(resolution).within(bounds))
+    else:
+        add_grid_layer(m, aggregator.grid(resolution).within(bounds))
     
     return m
 
@@ -461,16 +600,18 @@ def display_user_profile(user_data):
         st.subheader("📊 Activity Analysis")
         
 
-        st.write("**Vandalism Risk Indicators (Beta):**")
+        if 'vandalism_score' in user_data:
+            st.metric("Vandalism Score", f"{user_data['vandalism_score']:.2f}")
+        st.write("**Vandalism Risk Indicators:**")
         indicators = user_data.get('vandalism_indicators', {})
         for indicator, value in indicators.items():
             icon = "🔴" if value else "🟢"
             st.write(f"{icon} {indicator.replace('_', ' ').title()}: {'Yes' if value else 'No'}")
         
 
-        st.write("**Community Interaction (Beta):**")
-        st.write(f"• Messages received: {user_data['received_messages']}")
-        st.write(f"• Community reports: {user_data['community_reports']}")
+        st.write("**Community Interaction:**")
+        st.write(f"• Discussion comments received: {user_data['received_messages']}")
+        st.write(f"• Discussed changesets: {user_data['community_reports']}")
         st.write(f"• Blocks received: {user_data['blocks_received']}")
         
 
@@ -480,13 +621,12 @@ def display_user_profile(user_data):
                 st.warning(f"🚫 {block['date']}: {block['reason']} ({block['duration']})")
     
 
-    st.subheader("📈 Editing Timeline (Beta)")
-    dates = pd.date_range(end=datetime.now(), periods=26, freq='W') # More realistic dates
-    activity = [random.randint(0, user_data['total_changesets'] // 20 + 5) for _ in dates]
+    st.subheader("📈 Editing Timeline")
+    activity = user_data.get('weekly_activity') or {'weeks': [], 'changesets': []}
     
     fig = px.line(
-        x=dates, 
-        y=activity,
+        x=activity['weeks'], 
+        y=activity['changesets'],
         title="Weekly Editing Activity",
         labels={'x': 'Date', 'y': 'Number of Changesets'}
     )
@@ -561,6 +701,76 @@ def display_chat_message(role, content):
         """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def get_job_executor():
+    """Process-wide executor so Genie round trips never block a script thread"""
+    return JobExecutor(max_workers=16)
+
+
+def submit_query(query):
+    """Start answering a question in the background and remember the job in the session"""
+    cancel_active_job()
+    st.session_state.conversation_history.append(("user", query))
+    job = get_job_executor().submit(
+        call_genie_api,
+        query,
+        st.session_state.current_conversation_id,
+        bypass_cache=st.session_state.bypass_cache,
+        description=query
+    )
+    st.session_state.active_job_id = job.id
+
+
+def cancel_active_job():
+    job = get_job_executor().get(st.session_state.get('active_job_id'))
+    if job and not job.done():
+        job.cancel()
+    st.session_state.active_job_id = None
+
+
+@st.fragment(run_every=1.0)
+def show_active_job():
+    """Progress panel for the running query; refreshes itself until the job finishes"""
+    job = get_job_executor().get(st.session_state.active_job_id)
+    if job is None:
+        st.session_state.active_job_id = None
+        return
+
+    if job.done():
+        st.session_state.active_job_id = None
+        if job.status == 'succeeded':
+            response, conversation_id = job.result
+            st.session_state.query_response = response
+            st.session_state.pop('changeset_map', None)
+            st.session_state.current_conversation_id = conversation_id
+            st.session_state.conversation_history.append(("assistant", response.get('description', 'No response')))
+        elif job.status == 'failed':
+            st.session_state.query_response = {
+                'response_type': 'error',
+                'data': f'Error processing query: {job.error}',
+                'summary': 'An error occurred while processing your query'
+            }
+            st.session_state.conversation_history.append(("assistant", f"Error: {job.error}"))
+        st.rerun()
+
+    snapshot = job.snapshot()
+    progress = snapshot['progress']
+    stage = progress.get('stage', 'queued' if snapshot['status'] == 'queued' else 'genie')
+    details = {
+        'genie': f"Genie status: {progress.get('genie_status', 'SUBMITTED')} (poll {progress.get('poll_round', 0)})",
+        'sql': "Running SQL on the warehouse",
+        'fetch': f"Fetched {progress.get('rows_fetched', 0):,} rows",
+        'queued': "Waiting for a free worker",
+    }
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.info(f"🧠 {snapshot['description']} — {details.get(stage, stage)} · {snapshot['elapsed']:.0f}s")
+    with col2:
+        if st.button("Cancel", key=f"cancel_{job.id}", use_container_width=True):
+            cancel_active_job()
+            st.rerun()
+
+
 def main():
     st.title("🗺️ OSM Vandalism Validator")
     st.markdown("*Natural language interface for OpenStreetMap vandalism detection and validation*")
@@ -572,6 +782,10 @@ def main():
         st.session_state.current_conversation_id = None
     if 'query_response' not in st.session_state:
         st.session_state.query_response = None
+    if 'bypass_cache' not in st.session_state:
+        st.session_state.bypass_cache = False
+    if 'active_job_id' not in st.session_state:
+        st.session_state.active_job_id = None
     
 
     with st.sidebar:
@@ -588,6 +802,7 @@ def main():
                 st.info("💡 Start a new chat by asking a question or using the sample queries below")
         
         if st.button("🔄 New Chat", use_container_width=True, key="new_chat_sidebar"):
+            cancel_active_job()
             st.session_state.conversation_history = []
             st.session_state.current_conversation_id = None
             st.session_state.query_response = None
@@ -615,18 +830,8 @@ def main():
                     st.rerun()
             
             if submitted and query.strip():
-                with st.spinner("🧠 Analyzing your question..."):
-                    st.session_state.conversation_history.append(("user", query))
-                    
-                    response, conversation_id = call_genie_api(query, st.session_state.current_conversation_id)
-                    
-                    st.session_state.query_response = response
-                    st.session_state.current_conversation_id = conversation_id
-                    
-                    response_text = response.get('description', 'No response')
-                    st.session_state.conversation_history.append(("assistant", response_text))
-                    
-                    st.rerun()
+                submit_query(query)
+                st.rerun()
         
         st.markdown("---")
         
@@ -641,23 +846,34 @@ def main():
         
         for query in sample_queries:
             if st.button(query, key=f"sample_{query}", use_container_width=True):
-                with st.spinner("🧠 Analyzing your query..."):
-                    response, conversation_id = call_genie_api(query, st.session_state.current_conversation_id)
-                    st.session_state.query_response = response
-                    st.session_state.current_conversation_id = conversation_id
-                    st.session_state.conversation_history.append(("user", query))
-                    st.session_state.conversation_history.append(("assistant", response.get('description', 'No response')))
-                    st.rerun()
+                submit_query(query)
+                st.rerun()
+        
+        st.markdown("---")
+        
+        st.checkbox("Bypass result cache", key="bypass_cache", help="Always re-run the generated SQL on the warehouse")
+        cache_stats = get_result_cache().stats()
+        st.caption(
+            f"Result cache: {cache_stats['memory_hits'] + cache_stats['disk_hits']} hits, "
+            f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)"
+        )
         
         st.markdown("---")
         
         st.header("🔬 Lookup Changeset")
-        changeset_id_input = st.text_input("Enter OSM Changeset ID:", placeholder="e.g., 152735738")
+        changeset_id_input = st.text_input("Enter OSM Changeset ID(s):", placeholder="e.g., 152735738, 152735739")
         
         if st.button("Fetch Live Changeset Data", use_container_width=True):
-            if changeset_id_input.strip():
+            changeset_ids = changeset_id_input.replace(',', ' ').split()
+            if changeset_ids:
                 with st.spinner(f"Fetching data for changeset {changeset_id_input}..."):
-                    response = fetch_real_osm_user_data(changeset_id_input)
+                    if len(changeset_ids) == 1:
+                        response = fetch_real_osm_user_data(changeset_ids[0])
+                    elif all(changeset_id.isdigit() for changeset_id in changeset_ids):
+                        response = fetch_osm_changeset_table([int(changeset_id) for changeset_id in changeset_ids])
+                    else:
+                        response = None
+                        st.error("Changeset IDs must be numbers.")
                     st.session_state.query_response = response
                     st.session_state.conversation_history.append(("user", f"Show me changeset {changeset_id_input}"))
                     st.session_state.conversation_history.append(("assistant", f"Here's the data for changeset {changeset_id_input}"))
@@ -666,10 +882,19 @@ def main():
             else:
                 st.warning("Please enter a changeset ID!")
  
+    if st.session_state.active_job_id:
+        show_active_job()
+
     if st.session_state.query_response:
         response = st.session_state.query_response
         
         st.info(response['summary'])
+        if response.get('result_source'):
+            st.caption(f"Result source: {response['result_source'].replace('_', ' ')}")
+        if response.get('sql_cost'):
+            st.caption(f"Estimated query cost: {response['sql_cost']}")
+            for warning in response.get('sql_warnings', []):
+                st.caption(f"⚠️ {warning}")
         
         response_type = response['response_type']
         
@@ -677,11 +902,49 @@ def main():
             st.subheader("🗺️ Spatial Results")
             changesets_data = response['data']
             if changesets_data:
-                folium_map = create_map_with_changesets(changesets_data)
-                st_folium(folium_map, width=700, height=500, use_container_width=True)
+                # Built once per result set and kept with the response across reruns
+                if 'index' not in response:
+                    response['index'] = ChangesetIndex(changesets_data)
+                index = response['index']
+                
+                map_mode = st.selectbox("Map mode", MAP_MODES, key='map_mode')
+                if map_mode == 'Auto':
+                    map_mode = 'Grid' if len(index) > MapRenderConfig().aggregate_threshold else 'Changesets'
+                
+                # Only render what intersects the current view (plus a margin); the map
+                # component's last reported view is in session state before it is drawn
+                map_view = st.session_state.get('changeset_map') or {}
+                visible_data = index.query_viewport(map_view.get('bounds'))
+                if map_mode == 'Changesets':
+                    folium_map = create_map_with_changesets(
+                        visible_data, zoom=map_view.get('zoom'), center=map_view.get('center'),
+                    )
+                else:
+                    # Aggregated once per result; grids are cached per resolution
+                    if 'aggregator' not in response:
+                        response['aggregator'] = ChangesetAggregator(index.changesets)
+                    folium_map = create_aggregate_map(
+                        response['aggregator'], map_mode, zoom=map_view.get('zoom'),
+                        center=map_view.get('center'), bounds=map_view.get('bounds'),
+                    )
+                    if map_mode == 'Heatmap over time' and response['aggregator'].created is None:
+                        st.caption("No `created` timestamps in this result to slice by.")
+                map_state = st_folium(
+                    folium_map, key='changeset_map', width=700, height=500, use_container_width=True,
+                    returned_objects=['zoom', 'bounds', 'center', 'last_clicked']
+                )
+                clicked = (map_state or {}).get('last_clicked')
+                if clicked:
+                    nearest = index.nearest(clicked['lng'], clicked['lat'])
+                    if nearest:
+                        st.caption(
+                            f"Nearest changeset to click: {nearest.get('id', 'Unknown')} "
+                            f"by {nearest.get('user_name', 'Unknown')}"
+                        )
+                
                 st.subheader("📋 User Details")
-                df = pd.DataFrame(changesets_data)
-                display_df = df[['id', 'user_name', 'change_count', 'comment']].copy()
+                st.caption(f"{len(visible_data):,} of {len(index):,} changesets in view")
+                display_df = visible_data.to_pandas(['id', 'user_name', 'change_count', 'comment'])
                 st.dataframe(display_df, use_container_width=True)
             else:
                 st.warning("No spatial data found for this query.")
@@ -695,7 +958,7 @@ def main():
             display_analytics(response['data'])
         elif response_type == 'table':
             st.subheader("📋 Table Results")
-            st.dataframe(response['data'], use_container_width=True)
+            st.dataframe(response['data'].to_pandas(), use_container_width=True)
         elif response_type == 'general':
             st.subheader("💬 General Response")
             st.write(response['data'])
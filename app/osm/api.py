@@ -0,0 +1,291 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+
+from cachetools import LRUCache
+
+from genie.transport import GenieTransport, TransportConfig
+
+from .store import ChangesetStore
+
+OSM_API_URL = "https://api.openstreetmap.org/api/0.6"
+
+# The multi-id endpoints accept at most this many ids per call
+MAX_IDS_PER_REQUEST = 100
+
+
+@dataclass
+class OSMClientConfig:
+    max_workers: int = 4
+    # Polite default for the public API; shared by all worker threads
+    requests_per_second: float = 2.0
+    batch_size: int = MAX_IDS_PER_REQUEST
+    # User records are served from cache for this long, then revalidated with If-None-Match
+    user_ttl_seconds: float = 3600
+    max_cached_users: int = 10000
+    max_cached_changesets: int = 50000
+    user_agent: str = "osm-vandalism-validator/0.1"
+    # (connect, read) timeout and retries of 429/5xx for every OSM API call
+    timeout: tuple[float, float] = (5.0, 30.0)
+    max_retries: int = 3
+
+    def transport_config(self) -> TransportConfig:
+        """Transport settings for the OSM API, independent of the Genie endpoint timeouts."""
+        return TransportConfig(
+            pool_connections=1,
+            pool_maxsize=self.max_workers,
+            max_retries=self.max_retries,
+            default_timeout=self.timeout,
+            timeouts={},
+        )
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / rate seconds apart across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _batches(ids: list[int], size: int) -> list[list[int]]:
+    return [ids[start:start + size] for start in range(0, len(ids), size)]
+
+
+class OSMClient:
+    """
+    Bulk, cached lookups against the OSM API.
+
+    Changesets and users are fetched through the multi-id endpoints
+    (`/changesets?changesets=...`, `/users?users=...`) in batches that run
+    concurrently under one shared rate limit; closed changesets found in the
+    local ChangesetStore (if given) skip the API. Closed changesets never change
+    and are cached for good; user records are cached for user_ttl_seconds and
+    then revalidated with a conditional request, so an unchanged user costs a 304.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OSM_API_URL,
+        config: Optional[OSMClientConfig] = None,
+        transport: Optional[GenieTransport] = None,
+        store: Optional[ChangesetStore] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.config = config or OSMClientConfig()
+        self.transport = transport or GenieTransport(
+            headers={"Accept": "application/json", "User-Agent": self.config.user_agent},
+            config=self.config.transport_config(),
+        )
+        self.store = store
+        self._limiter = RateLimiter(self.config.requests_per_second)
+        self._pool = ThreadPoolExecutor(max_workers=self.config.max_workers, thread_name_prefix="osm-api")
+        # changeset id -> changeset dict (closed changesets only)
+        self._changesets: LRUCache = LRUCache(maxsize=self.config.max_cached_changesets)
+        # uid -> (user dict, etag, fetched_at)
+        self._users: LRUCache = LRUCache(maxsize=self.config.max_cached_users)
+        self._lock = threading.Lock()
+        self._counters = {"changeset_hits": 0, "store_hits": 0, "user_hits": 0, "user_revalidated": 0, "api_calls": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+        self.transport.close()
+
+    def get_changesets(self, changeset_ids: Iterable[int | str]) -> dict[int, dict]:
+        """
+        Fetch changeset metadata for many ids.
+
+        Returns:
+            {changeset id: changeset dict}; ids the API does not know are left out
+        """
+        ids = list(dict.fromkeys(int(changeset_id) for changeset_id in changeset_ids))
+        found = {}
+        with self._lock:
+            for changeset_id in ids:
+                changeset = self._changesets.get(changeset_id)
+                if changeset is not None:
+                    found[changeset_id] = changeset
+            self._counters["changeset_hits"] += len(found)
+        missing = [changeset_id for changeset_id in ids if changeset_id not in found]
+
+        if missing and self.store is not None:
+            # Open changesets in the store may have changed since they were ingested
+            for changeset_id, changeset in self.store.get_changesets(missing).items():
+                if not changeset.get("open"):
+                    found[changeset_id] = changeset
+                    with self._lock:
+                        self._changesets[changeset_id] = changeset
+                        self._counters["store_hits"] += 1
+            missing = [changeset_id for changeset_id in missing if changeset_id not in found]
+
+        for changesets in self._pool.map(self._fetch_changesets, _batches(missing, self.config.batch_size)):
+            for changeset in changesets:
+                found[changeset["id"]] = changeset
+                if not changeset.get("open"):
+                    with self._lock:
+                        self._changesets[changeset["id"]] = changeset
+        return found
+
+    def get_users(self, uids: Iterable[int | str]) -> dict[int, dict]:
+        """
+        Fetch user records for many uids.
+
+        Fresh cache entries are returned as is, expired ones are revalidated
+        one by one with If-None-Match and unknown users are fetched in bulk.
+
+        Returns:
+            {uid: user dict}; deleted / unknown users are left out
+        """
+        uids = list(dict.fromkeys(int(uid) for uid in uids))
+        now = time.time()
+        found, stale = {}, []
+        with self._lock:
+            for uid in uids:
+                entry = self._users.get(uid)
+                if entry is None:
+                    continue
+                user, etag, fetched_at = entry
+                if now - fetched_at < self.config.user_ttl_seconds:
+                    found[uid] = user
+                elif etag:
+                    stale.append((uid, user, etag))
+            self._counters["user_hits"] += len(found)
+
+        for uid, user in zip([uid for uid, _, _ in stale], self._pool.map(self._revalidate_user, stale)):
+            if user is not None:
+                found[uid] = user
+
+        missing = [uid for uid in uids if uid not in found]
+        for users, etag in self._pool.map(self._fetch_users, _batches(missing, self.config.batch_size)):
+            fetched_at = time.time()
+            for user in users:
+                found[user["id"]] = user
+                with self._lock:
+                    # A batch ETag covers the whole batch, so only single-user responses can be revalidated
+                    self._users[user["id"]] = (user, etag if len(users) == 1 else None, fetched_at)
+        return found
+
+    def lookup(self, changeset_ids: Iterable[int | str]) -> list[Optional[dict]]:
+        """
+        Changeset plus its author for many changeset ids, in input order.
+
+        Returns:
+            One {"changeset": ..., "user": ...} per id (user is None for deleted
+            accounts), or None where the changeset does not exist
+        """
+        ids = [int(changeset_id) for changeset_id in changeset_ids]
+        changesets = self.get_changesets(ids)
+        users = self.get_users({changeset["uid"] for changeset in changesets.values() if changeset.get("uid")})
+        results = []
+        for changeset_id in ids:
+            changeset = changesets.get(changeset_id)
+            if changeset is None:
+                results.append(None)
+            else:
+                results.append({"changeset": changeset, "user": users.get(changeset.get("uid"))})
+        return results
+
+    def get_user_changesets(self, since: dict[int, Optional[datetime]]) -> dict[int, list[dict]]:
+        """
+        Recent changesets of many users, for scoring.
+
+        Args:
+            since: {uid: only changesets closed after this time, or None for the most recent ones}
+
+        Returns:
+            {uid: changeset dicts}; from the local store when it has any for the user,
+            otherwise one rate-limited `/changesets?user=` call per user (the
+            API returns at most 100 changesets per call)
+        """
+        found: dict[int, list[dict]] = {uid: [] for uid in since}
+        if self.store is not None:
+            stored = self.store.get_user_changesets(
+                since, since=min((value for value in since.values() if value is not None), default=None)
+            )
+            for changeset in stored:
+                found[changeset["uid"]].append(changeset)
+        remote = [(uid, value) for uid, value in since.items() if not found[uid]]
+        for uid, changesets in zip([uid for uid, _ in remote], self._pool.map(self._fetch_user_changesets, remote)):
+            found[uid] = changesets
+        return found
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["cached_changesets"] = len(self._changesets)
+            counters["cached_users"] = len(self._users)
+        return counters
+
+    def _get(self, path: str, params: dict, headers: Optional[dict] = None):
+        self._limiter.wait()
+        with self._lock:
+            self._counters["api_calls"] += 1
+        return self.transport.get(f"{self.base_url}/{path}", params=params, headers=headers)
+
+    def _fetch_changesets(self, ids: list[int]) -> list[dict]:
+        response = self._get("changesets.json", {"changesets": ",".join(map(str, ids))})
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return response.json().get("changesets", [])
+
+    def _fetch_user_changesets(self, query: tuple[int, Optional[datetime]]) -> list[dict]:
+        uid, since = query
+        params = {"user": uid}
+        if since is not None:
+            params["time"] = since.strftime("%Y-%m-%dT%H:%M:%SZ")
+        response = self._get("changesets.json", params)
+        if response.status_code == 404:
+            return []
+        response.raise_for_status()
+        return response.json().get("changesets", [])
+
+    def _fetch_users(self, uids: list[int]) -> tuple[list[dict], Optional[str]]:
+        response = self._get("users.json", {"users": ",".join(map(str, uids))})
+        if response.status_code == 404:
+            # One deleted or unknown uid fails the whole batch; split it to keep the others
+            if len(uids) == 1:
+                return [], None
+            middle = len(uids) // 2
+            first, _ = self._fetch_users(uids[:middle])
+            second, _ = self._fetch_users(uids[middle:])
+            return first + second, None
+        response.raise_for_status()
+        users = [entry.get("user", entry) for entry in response.json().get("users", [])]
+        return users, response.headers.get("ETag")
+
+    def _revalidate_user(self, stale: tuple[int, dict, str]) -> Optional[dict]:
+        uid, user, etag = stale
+        response = self._get(f"user/{uid}.json", {}, headers={"If-None-Match": etag})
+        if response.status_code == 304:
+            with self._lock:
+                self._users[uid] = (user, etag, time.time())
+                self._counters["user_revalidated"] += 1
+            return user
+        if response.status_code in (404, 410):
+            with self._lock:
+                self._users.pop(uid, None)
+            return None
+        response.raise_for_status()
+        user = response.json().get("user", {})
+        with self._lock:
+            self._users[uid] = (user, response.headers.get("ETag"), time.time())
+        return user
@@ -0,0 +1,214 @@
+import argparse
+import bz2
+import gzip
+import os
+import re
+import sys
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import IO, Iterator, Optional
+
+import requests
+from colorama import Fore
+
+from .store import ChangesetStore
+
+REPLICATION_URL = "https://planet.osm.org/replication/changesets"
+
+_SEQUENCE = re.compile(r"^sequence:\s*(\d+)", re.M)
+
+
+def _timestamp(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")) if value else None
+
+
+def _number(value: Optional[str], cast=int):
+    return cast(value) if value not in (None, "") else None
+
+
+def open_source(path: str) -> IO[bytes]:
+    """Open a dump or replication file, decompressing .bz2 / .gz on the fly."""
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def parse_changesets(source: IO[bytes], min_id: int = 0) -> Iterator[dict]:
+    """
+    Stream <changeset> elements out of a changeset dump or replication file.
+
+    Elements are parsed incrementally and cleared as soon as they are read, so
+    memory stays constant however large the file is.
+
+    Args:
+        source: Binary file object with (decompressed) OSM changeset XML
+        min_id: Changesets with an id at or below this watermark are skipped
+
+    Yields:
+        One dict per changeset, with the columns of osm.store.CHANGESET_SCHEMA
+    """
+    context = ET.iterparse(source, events=("start", "end"))
+    _, root = next(context)
+    for event, elem in context:
+        if event != "end" or elem.tag != "changeset":
+            continue
+        changeset_id = int(elem.get("id"))
+        if changeset_id > min_id:
+            yield {
+                "id": changeset_id,
+                "created_at": _timestamp(elem.get("created_at")),
+                "closed_at": _timestamp(elem.get("closed_at")),
+                "open": elem.get("open") == "true",
+                "user": elem.get("user"),
+                "uid": _number(elem.get("uid")),
+                "min_lat": _number(elem.get("min_lat"), float),
+                "min_lon": _number(elem.get("min_lon"), float),
+                "max_lat": _number(elem.get("max_lat"), float),
+                "max_lon": _number(elem.get("max_lon"), float),
+                "changes_count": _number(elem.get("num_changes")),
+                "comments_count": _number(elem.get("comments_count")),
+                "tags": [(tag.get("k"), tag.get("v")) for tag in elem.iter("tag")],
+            }
+        # Drop the element and everything the root has accumulated so far
+        elem.clear()
+        root.clear()
+
+
+def ingest_stream(
+    store: ChangesetStore,
+    source: IO[bytes],
+    min_id: int = 0,
+    batch_size: int = 50000,
+    dump: bool = False,
+    sequence: Optional[int] = None,
+) -> tuple[int, int]:
+    """
+    Write the changesets of one file to the store in batches.
+
+    Args:
+        dump: Advance the dump id watermark with every batch, so an interrupted
+            dump resumes after the last committed batch
+        sequence: Replication sequence committed with the file's last batch
+
+    Returns:
+        (changesets written, highest changeset id seen)
+    """
+    written, max_id, batch = 0, min_id, []
+    for changeset in parse_changesets(source, min_id=min_id):
+        batch.append(changeset)
+        max_id = max(max_id, changeset["id"])
+        if len(batch) >= batch_size:
+            store.write(batch, dump_max_id=max_id if dump else None)
+            written += len(batch)
+            batch = []
+    store.write(batch, dump_max_id=max_id if dump else None, sequence=sequence)
+    return written + len(batch), max_id
+
+
+def ingest_dump(store: ChangesetStore, path: str, batch_size: int = 50000) -> int:
+    """
+    Ingest a `changesets-*.osm.bz2` dump. Dumps are ordered by id, so anything
+    at or below the store's dump id watermark is skipped and a re-run (or a
+    restart after a crash) only adds newer changesets. Replication does not
+    move this watermark.
+    """
+    with open_source(path) as source:
+        written, _ = ingest_stream(
+            store, source, min_id=store.watermark()["dump_max_id"], batch_size=batch_size, dump=True
+        )
+    return written
+
+
+def replication_url(sequence: int, base_url: str = REPLICATION_URL) -> str:
+    """URL of a replication file, e.g. sequence 6234567 -> .../006/234/567.osm.gz"""
+    digits = f"{sequence:09d}"
+    return f"{base_url}/{digits[:3]}/{digits[3:6]}/{digits[6:]}.osm.gz"
+
+
+def latest_sequence(session: requests.Session, base_url: str = REPLICATION_URL) -> int:
+    response = session.get(f"{base_url}/state.yaml", timeout=(5.0, 30.0))
+    response.raise_for_status()
+    match = _SEQUENCE.search(response.text)
+    if not match:
+        raise ValueError(f"No sequence in {base_url}/state.yaml")
+    return int(match.group(1))
+
+
+def ingest_replication(
+    store: ChangesetStore,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    base_url: str = REPLICATION_URL,
+    batch_size: int = 50000,
+) -> int:
+    """
+    Ingest minutely changeset replication files from `start` (default: the
+    sequence after the store's watermark) up to `end` (default: the latest).
+
+    Replication files also carry updates to changesets the store already has
+    (e.g. when they close), so they are written regardless of the dump id
+    watermark; the sequence watermark is committed with the last batch of
+    every file.
+    """
+    with requests.Session() as session:
+        watermark = store.watermark()
+        if start is None:
+            if watermark.get("sequence") is None:
+                raise ValueError("No replication sequence in the store yet; pass a start sequence")
+            start = watermark["sequence"] + 1
+        end = end if end is not None else latest_sequence(session, base_url)
+
+        total = 0
+        for sequence in range(start, end + 1):
+            response = session.get(replication_url(sequence, base_url), stream=True, timeout=(5.0, 60.0))
+            response.raise_for_status()
+            with gzip.GzipFile(fileobj=response.raw) as source:
+                written, _ = ingest_stream(store, source, batch_size=batch_size, sequence=sequence)
+            total += written
+        return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest OSM changeset dumps and replication files into the local store.")
+    parser.add_argument(
+        "--store", default=os.getenv("OSM_STORE_DIR", ".osm_store/changesets"), help="Store directory"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    dump_parser = subparsers.add_parser("dump", help="Ingest a changesets-*.osm.bz2 dump")
+    dump_parser.add_argument("path", help="Path to the dump file")
+
+    replication_parser = subparsers.add_parser("replication", help="Ingest minutely changeset replication files")
+    replication_parser.add_argument("--start", type=int, help="First sequence (default: after the watermark)")
+    replication_parser.add_argument("--end", type=int, help="Last sequence (default: latest)")
+
+    subparsers.add_parser("compact", help="Rewrite each day partition as a single file")
+
+    args = parser.parse_args()
+    store = ChangesetStore(args.store)
+
+    try:
+        if args.command == "compact":
+            compacted = store.compact()
+            print(Fore.GREEN + f"✅ Compacted {compacted} partitions" + Fore.RESET)
+            return
+        if args.command == "dump":
+            written = ingest_dump(store, args.path)
+        else:
+            written = ingest_replication(store, start=args.start, end=args.end)
+    except (OSError, ValueError, requests.exceptions.RequestException) as e:
+        print(Fore.RED + f"❌ Ingest failed: {e}" + Fore.RESET, file=sys.stderr)
+        sys.exit(1)
+
+    watermark = store.watermark()
+    print(
+        Fore.GREEN
+        + f"✅ Wrote {written} changesets (dump id {watermark['dump_max_id']}, sequence {watermark['sequence']})"
+        + Fore.RESET
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+FRAME_COLUMNS = ["id", "uid", "user", "created_at", "closed_at", "changes_count", "comments_count", "comment", "editor"]
+
+INDICATORS = ["rapid_editing", "pattern_repetition", "high_change_velocity", "ignores_community_feedback"]
+
+
+@dataclass
+class ScoringConfig:
+    # Changesets opened less than this many seconds after the previous one count as rapid
+    rapid_gap_seconds: float = 60.0
+    rapid_share: float = 0.5
+    # Share of a user's changesets carrying their most common (non-empty) comment
+    repetition_share: float = 0.6
+    # Rate indicators need at least this many changesets to be meaningful
+    min_changesets: int = 5
+    # Changes per hour over the span from the user's first to last changeset (at least one hour)
+    velocity_per_hour: float = 1000.0
+    # Changesets opened after the user's first discussed changeset, once several were discussed
+    feedback_edits_after: int = 5
+    feedback_min_discussed: int = 2
+    # A single changeset this large is suspicious on its own
+    large_changeset: int = 5000
+    # History kept per user for scoring
+    history_days: int = 90
+    weights: dict[str, float] = field(
+        default_factory=lambda: {
+            "rapid_editing": 0.3,
+            "pattern_repetition": 0.2,
+            "high_change_velocity": 0.25,
+            "ignores_community_feedback": 0.25,
+        }
+    )
+
+
+def changesets_frame(changesets: Iterable[dict]) -> pd.DataFrame:
+    """
+    Build the scoring frame from changeset dicts as returned by the OSM API or
+    the ChangesetStore (one row per changeset, FRAME_COLUMNS).
+    """
+    frame = pd.DataFrame.from_records(list(changesets))
+    for column in FRAME_COLUMNS + ["tags"]:
+        if column not in frame:
+            frame[column] = None
+    tags = frame["tags"].map(lambda value: value if isinstance(value, dict) else {})
+    frame["comment"] = tags.map(lambda value: value.get("comment") or "")
+    frame["editor"] = tags.map(lambda value: value.get("created_by") or "unknown")
+    frame["created_at"] = pd.to_datetime(frame["created_at"], utc=True, errors="coerce")
+    frame["closed_at"] = pd.to_datetime(frame["closed_at"], utc=True, errors="coerce")
+    for column in ("id", "uid", "changes_count", "comments_count"):
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").fillna(0).astype(np.int64)
+    return frame[FRAME_COLUMNS]
+
+
+def user_indicators(frame: pd.DataFrame, config: Optional[ScoringConfig] = None) -> pd.DataFrame:
+    """
+    Compute the vandalism indicators and vandalism_score for every user in
+    `frame` at once with group operations (no per-user Python loop).
+
+    Returns:
+        One row per uid with activity statistics, the boolean INDICATORS and vandalism_score
+    """
+    config = config or ScoringConfig()
+    if frame.empty:
+        return pd.DataFrame(columns=["user", "changesets", "total_edits", *INDICATORS, "vandalism_score"])
+
+    frame = frame.sort_values(["uid", "created_at"])
+    by_user = frame.groupby("uid", sort=False)
+    gaps = by_user["created_at"].diff().dt.total_seconds()
+    discussed = frame["comments_count"] > 0
+    first_discussed = frame["created_at"].where(discussed).groupby(frame["uid"]).transform("min")
+
+    stats = frame.assign(
+        rapid=gaps < config.rapid_gap_seconds,
+        activity_end=frame["closed_at"].fillna(frame["created_at"]),
+        open_created=frame["created_at"].where(frame["closed_at"].isna()),
+        discussed=discussed,
+        after_feedback=frame["created_at"] > first_discussed,
+    ).groupby("uid").agg(
+        user=("user", "last"),
+        changesets=("id", "size"),
+        total_edits=("changes_count", "sum"),
+        avg_changes_per_changeset=("changes_count", "mean"),
+        max_changes=("changes_count", "max"),
+        rapid_share=("rapid", "mean"),
+        first_created=("created_at", "min"),
+        activity_end=("activity_end", "max"),
+        discussion_comments=("comments_count", "sum"),
+        discussed_changesets=("discussed", "sum"),
+        edits_after_feedback=("after_feedback", "sum"),
+        last_closed=("closed_at", "max"),
+        first_open=("open_created", "min"),
+        last_id=("id", "max"),
+    )
+    # Users who never write a comment do not repeat a pattern
+    commented = frame[frame["comment"].fillna("").str.strip() != ""]
+    stats["repetition_share"] = (
+        commented.groupby(["uid", "comment"]).size().groupby(level=0).max().reindex(stats.index).fillna(0)
+        / stats["changesets"]
+    )
+    # Rate over wall-clock activity: iD and JOSM close changesets seconds after opening them
+    stats["active_hours"] = (
+        (stats["activity_end"] - stats["first_created"]).dt.total_seconds().fillna(0).clip(lower=3600) / 3600
+    )
+    stats["change_velocity"] = stats["total_edits"] / stats["active_hours"]
+
+    enough = stats["changesets"] >= config.min_changesets
+    stats["rapid_editing"] = enough & (stats["rapid_share"] >= config.rapid_share)
+    stats["pattern_repetition"] = enough & (stats["repetition_share"] >= config.repetition_share)
+    stats["high_change_velocity"] = (enough & (stats["change_velocity"] >= config.velocity_per_hour)) | (
+        stats["max_changes"] >= config.large_changeset
+    )
+    # Changeset metadata only carries comment counts, not who wrote them, so a single discussion
+    # (possibly the user's own comment) is not enough
+    stats["ignores_community_feedback"] = (
+        enough
+        & (stats["discussed_changesets"] >= config.feedback_min_discussed)
+        & (stats["edits_after_feedback"] >= config.feedback_edits_after)
+    )
+
+    weights = np.array([config.weights.get(name, 0.0) for name in INDICATORS])
+    stats["vandalism_score"] = np.clip(stats[INDICATORS].to_numpy(dtype=np.float64) @ weights, 0.0, 1.0)
+    return stats
+
+
+def score_changesets(frame: pd.DataFrame, users: pd.DataFrame, config: Optional[ScoringConfig] = None) -> np.ndarray:
+    """
+    Per-changeset vandalism_score: the author's score plus changeset-level
+    signals (very large edits, missing comment), for a whole batch at once.
+    """
+    config = config or ScoringConfig()
+    user_score = frame["uid"].map(users["vandalism_score"]).fillna(0.0).to_numpy(dtype=np.float64)
+    large = (frame["changes_count"] >= config.large_changeset).to_numpy(dtype=np.float64)
+    no_comment = (frame["comment"].str.strip() == "").to_numpy(dtype=np.float64)
+    return np.clip(0.6 * user_score + 0.25 * large + 0.15 * no_comment, 0.0, 1.0)
+
+
+def weekly_activity(history: pd.DataFrame, weeks: int = 26) -> pd.DataFrame:
+    """Changesets and changes per week over the last `weeks` weeks of a user's history."""
+    index = pd.date_range(end=pd.Timestamp.now(tz="UTC").normalize(), periods=weeks, freq="W")
+    recent = history[history["created_at"] > index[0] - pd.Timedelta(weeks=1)]
+    activity = recent.set_index("created_at").resample("W").agg({"id": "size", "changes_count": "sum"})
+    activity = activity.reindex(index, fill_value=0)
+    return activity.rename(columns={"id": "changesets", "changes_count": "changes"})
+
+
+class UserScoreCache:
+    """
+    Per-user changeset history and scores, refreshed incrementally.
+
+    update() merges newly seen changesets into the kept history and rescores
+    only the users they belong to; stale() tells the caller which users are due
+    for a history refresh and from when (in "closed after" terms, so changesets
+    that were still open at the last refresh are fetched again).
+    """
+
+    def __init__(self, config: Optional[ScoringConfig] = None, ttl_seconds: float = 3600):
+        self.config = config or ScoringConfig()
+        self.ttl_seconds = ttl_seconds
+        self._history = changesets_frame([])
+        self._scores = user_indicators(self._history, self.config)
+        self._refreshed_at: dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    def stale(self, uids: Iterable[int]) -> dict[int, Optional[pd.Timestamp]]:
+        """
+        Users whose scores are missing or older than ttl_seconds.
+
+        Returns:
+            {uid: fetch changesets closed after this time, or None if nothing is known}:
+            the newest closed_at, or the creation of the oldest changeset still open
+            if that is earlier
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                uid: self._since(uid)
+                for uid in uids
+                if now - self._refreshed_at.get(uid, 0.0) >= self.ttl_seconds
+            }
+
+    def _since(self, uid: int) -> Optional[pd.Timestamp]:
+        if uid not in self._scores.index:
+            return None
+        bounds = [self._scores.at[uid, "last_closed"], self._scores.at[uid, "first_open"]]
+        bounds = [bound for bound in bounds if not pd.isna(bound)]
+        return min(bounds) if bounds else None
+
+    def update(self, frame: pd.DataFrame, uids: Iterable[int] = ()) -> pd.DataFrame:
+        """
+        Merge new changesets and rescore the users they (or `uids`) belong to.
+
+        Returns:
+            The new indicator rows of the rescored users
+        """
+        touched = set(frame["uid"].unique().tolist()) | set(uids)
+        with self._lock:
+            history = pd.concat([self._history, frame], ignore_index=True)
+            # A changeset seen again (e.g. now closed) replaces its older version
+            history = history.drop_duplicates("id", keep="last")
+            cutoff = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=self.config.history_days)
+            self._history = history[history["created_at"] >= cutoff]
+            rescored = user_indicators(self._history[self._history["uid"].isin(touched)], self.config)
+            kept = self._scores.drop(index=list(touched), errors="ignore")
+            self._scores = rescored if kept.empty else pd.concat([kept, rescored])
+            now = time.time()
+            for uid in touched:
+                self._refreshed_at[uid] = now
+        return rescored
+
+    def get(self, uid: int) -> Optional[dict]:
+        with self._lock:
+            if uid not in self._scores.index:
+                return None
+            return self._scores.loc[uid].to_dict()
+
+    def scores(self) -> pd.DataFrame:
+        with self._lock:
+            return self._scores.copy()
+
+    def history(self, uid: int) -> pd.DataFrame:
+        with self._lock:
+            return self._history[self._history["uid"] == uid].copy()
+
+    def editors(self, uid: int, top: int = 2) -> list[str]:
+        history = self.history(uid)
+        return history["editor"].value_counts().head(top).index.tolist()
@@ -0,0 +1,288 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+CHANGESET_SCHEMA = pa.schema(
+    [
+        ("id", pa.int64()),
+        ("created_at", pa.timestamp("s", tz="UTC")),
+        ("closed_at", pa.timestamp("s", tz="UTC")),
+        ("open", pa.bool_()),
+        ("user", pa.string()),
+        ("uid", pa.int64()),
+        ("min_lat", pa.float64()),
+        ("min_lon", pa.float64()),
+        ("max_lat", pa.float64()),
+        ("max_lon", pa.float64()),
+        ("changes_count", pa.int64()),
+        ("comments_count", pa.int64()),
+        ("tags", pa.map_(pa.string(), pa.string())),
+        ("day", pa.string()),
+    ]
+)
+
+_FILE_SCHEMA = CHANGESET_SCHEMA.remove(CHANGESET_SCHEMA.get_field_index("day"))
+
+WATERMARK_FILE = "_watermark.json"
+# Batches are written here first; names starting with "_" are ignored by lookups
+STAGING_DIR = "_staging"
+# Files are sorted by uid, so per-user lookups skip row groups by their statistics
+ROW_GROUP_SIZE = 16384
+# A partition reaching this many files is compacted after a write
+COMPACT_FILES = 16
+
+_EPOCH = datetime.fromtimestamp(0, timezone.utc)
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ") if value is not None else None
+
+
+def _version(row: dict) -> tuple:
+    return (not row["open"], row["closed_at"] or _EPOCH)
+
+
+def _write_partitions(table: pa.Table, directory: str, basename: str):
+    """Write `table` under `directory` as one `day=` partition file per day, sorted by uid and id."""
+    table = table.sort_by([("uid", "ascending"), ("id", "ascending")])
+    for day in pc.unique(table["day"]).to_pylist():
+        partition = os.path.join(directory, f"day={day}")
+        os.makedirs(partition, exist_ok=True)
+        rows = table.filter(pc.equal(table["day"], day)).select(_FILE_SCHEMA.names)
+        pq.write_table(rows, os.path.join(partition, f"{basename}.parquet"), row_group_size=ROW_GROUP_SIZE)
+
+
+class ChangesetStore:
+    """
+    Local Parquet store of changeset metadata, partitioned by creation day
+    (hive layout, `day=YYYY-MM-DD`), filled by osm.ingest from changeset dumps
+    and replication files.
+
+    Ingest is append-only: a changeset that was open in one replication file and
+    closed in a later one has several rows, and lookups keep the most recent.
+    `_watermark.json` records, separately, the highest changeset id ingested
+    from dumps and the last replication sequence ingested. Each batch and its
+    watermark update are committed together (see write()). Partitions that
+    accumulate many small replication files are compacted (see compact()).
+    """
+
+    def __init__(self, root: str = ".osm_store/changesets"):
+        self.root = root
+        self._lock = threading.Lock()
+        # (watermark file stamp, dataset); see _dataset()
+        self._cached: Optional[tuple] = None
+        with self._lock:
+            self._recover()
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.root) and any(name.startswith("day=") for name in os.listdir(self.root))
+
+    def watermark(self) -> dict:
+        """
+        Returns:
+            {"dump_max_id": highest id ingested from dumps, "sequence": last replication sequence or None}
+        """
+        try:
+            with open(os.path.join(self.root, WATERMARK_FILE)) as f:
+                watermark = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            watermark = {}
+        # Stores from before the dump and replication watermarks were split only have "max_id"
+        watermark.setdefault("dump_max_id", watermark.pop("max_id", 0) or 0)
+        watermark.setdefault("sequence", None)
+        return watermark
+
+    def write(self, records: list[dict], dump_max_id: Optional[int] = None, sequence: Optional[int] = None):
+        """
+        Append a batch of parsed changesets (see osm.ingest.parse_changesets) and
+        advance the watermarks in one transaction.
+
+        The batch is written to a staging directory first. Saving the watermark
+        with the batch marked as pending is the commit point; the files are then
+        moved into their partitions. A crash before the commit drops the batch,
+        a crash after it is completed when the store is next opened or written.
+
+        Args:
+            dump_max_id: New dump id watermark (dump ingest)
+            sequence: New replication sequence (last batch of a replication file)
+        """
+        for record in records:
+            record["day"] = record["created_at"].strftime("%Y-%m-%d")
+        with self._lock:
+            self._recover()
+            batch = None
+            if records:
+                batch = uuid.uuid4().hex
+                _write_partitions(
+                    pa.Table.from_pylist(records, schema=CHANGESET_SCHEMA),
+                    os.path.join(self.root, STAGING_DIR, batch),
+                    f"part-{batch}",
+                )
+            watermark = self.watermark()
+            if dump_max_id is not None:
+                watermark["dump_max_id"] = max(dump_max_id, watermark["dump_max_id"])
+            if sequence is not None:
+                watermark["sequence"] = sequence
+            watermark["pending"] = batch
+            watermark["updated_at"] = _isoformat(datetime.now(timezone.utc))
+            self._save_watermark(watermark)
+            self._recover()
+            days = sorted({record["day"] for record in records})
+            if any([self._compact(day, COMPACT_FILES) for day in days]):
+                self._save_watermark(self.watermark())
+
+    def compact(self, min_files: int = 2) -> int:
+        """
+        Rewrite every partition with at least `min_files` files as a single file
+        holding only the latest version of each changeset.
+
+        Returns:
+            Number of partitions compacted
+        """
+        if not self.exists():
+            return 0
+        with self._lock:
+            self._recover()
+            days = [name[len("day=") :] for name in sorted(os.listdir(self.root)) if name.startswith("day=")]
+            compacted = sum(self._compact(day, min_files) for day in days)
+            if compacted:
+                self._save_watermark(self.watermark())
+        return compacted
+
+    def _compact(self, day: str, min_files: int) -> bool:
+        """
+        The compacted file is staged, then moved into the partition before the old
+        files are removed: a crash in between only leaves duplicate rows, which
+        lookups already resolve to the latest version.
+        """
+        partition = os.path.join(self.root, f"day={day}")
+        paths = [os.path.join(partition, name) for name in sorted(os.listdir(partition)) if name.endswith(".parquet")]
+        if len(paths) < min_files:
+            return False
+        latest: dict[int, dict] = {}
+        for row in ds.dataset(paths, format="parquet", schema=_FILE_SCHEMA).to_table().to_pylist():
+            previous = latest.get(row["id"])
+            if previous is None or _version(row) > _version(previous):
+                latest[row["id"]] = row
+        for row in latest.values():
+            row["day"] = day
+        name = f"part-{uuid.uuid4().hex}"
+        staging = os.path.join(self.root, STAGING_DIR, name)
+        _write_partitions(pa.Table.from_pylist(list(latest.values()), schema=CHANGESET_SCHEMA), staging, name)
+        os.replace(os.path.join(staging, f"day={day}", f"{name}.parquet"), os.path.join(partition, f"{name}.parquet"))
+        shutil.rmtree(staging, ignore_errors=True)
+        for path in paths:
+            os.remove(path)
+        return True
+
+    def _save_watermark(self, watermark: dict):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".{WATERMARK_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(watermark, f)
+        os.replace(tmp_path, os.path.join(self.root, WATERMARK_FILE))
+        self._cached = None
+
+    def _recover(self):
+        """Move the files of the committed batch into place and drop staged batches that were never committed."""
+        staging = os.path.join(self.root, STAGING_DIR)
+        watermark = self.watermark()
+        pending = watermark.get("pending")
+        if os.path.isdir(staging):
+            for batch in os.listdir(staging):
+                batch_dir = os.path.join(staging, batch)
+                if batch == pending:
+                    for directory, _, files in os.walk(batch_dir):
+                        target = os.path.join(self.root, os.path.relpath(directory, batch_dir))
+                        os.makedirs(target, exist_ok=True)
+                        for name in files:
+                            os.replace(os.path.join(directory, name), os.path.join(target, name))
+                shutil.rmtree(batch_dir, ignore_errors=True)
+        if pending:
+            watermark["pending"] = None
+            self._save_watermark(watermark)
+
+    def get_changesets(self, changeset_ids: Iterable[int]) -> dict[int, dict]:
+        """
+        Look changesets up by id.
+
+        Returns:
+            {changeset id: changeset dict shaped like the OSM API's JSON}; ids
+            not in the store are left out
+        """
+        ids = list(dict.fromkeys(int(changeset_id) for changeset_id in changeset_ids))
+        if not ids or not self.exists():
+            return {}
+        found = self._scan(pc.field("id").isin(ids))
+        return {changeset_id: self._to_api(row) for changeset_id, row in found.items()}
+
+    def get_user_changesets(self, uids: Iterable[int], since: Optional[datetime] = None) -> list[dict]:
+        """
+        All stored changesets of the given users, optionally only those closed after `since`
+        (or still open), like the OSM API's `time=` parameter.
+
+        Returns:
+            Changeset dicts shaped like the OSM API's JSON (latest version of each)
+        """
+        uids = list(dict.fromkeys(int(uid) for uid in uids))
+        if not uids or not self.exists():
+            return []
+        condition = pc.field("uid").isin(uids)
+        if since is not None:
+            since = pa.scalar(since, type=pa.timestamp("s", tz="UTC"))
+            condition = condition & ((pc.field("closed_at") > since) | pc.field("open"))
+        return [self._to_api(row) for row in self._scan(condition).values()]
+
+    def _dataset(self) -> ds.Dataset:
+        """
+        The store as a dataset. Listing every partition is slow on a large store, so the
+        dataset is kept until the watermark file is rewritten: every commit and compaction,
+        in this process or another (a running ingest), does that.
+        Files starting with "_" or "." (staging, the watermark) are ignored.
+        """
+        try:
+            info = os.stat(os.path.join(self.root, WATERMARK_FILE))
+            stamp = (info.st_ino, info.st_mtime_ns, info.st_size)
+        except OSError:
+            stamp = None
+        cached = self._cached
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, ds.dataset(self.root, format="parquet", partitioning="hive", schema=CHANGESET_SCHEMA))
+            self._cached = cached
+        return cached[1]
+
+    def _scan(self, condition: pc.Expression) -> dict[int, dict]:
+        """
+        Returns:
+            {changeset id: row} for the rows matching `condition`, keeping the closed /
+            most recently closed version of each changeset
+        """
+        try:
+            table = self._dataset().to_table(filter=condition)
+        except OSError:
+            # Files listed before a compaction in another process were removed
+            self._cached = None
+            table = self._dataset().to_table(filter=condition)
+        found: dict[int, dict] = {}
+        for row in table.to_pylist():
+            previous = found.get(row["id"])
+            if previous is None or _version(row) > _version(previous):
+                found[row["id"]] = row
+        return found
+
+    @staticmethod
+    def _to_api(row: dict) -> dict:
+        changeset = {name: value for name, value in row.items() if name != "day"}
+        changeset["created_at"] = _isoformat(row["created_at"])
+        changeset["closed_at"] = _isoformat(row["closed_at"])
+        changeset["tags"] = dict(row["tags"] or [])
+        return changeset
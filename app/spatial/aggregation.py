@@ -0,0 +1,162 @@
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from .geometry import ensure_geometries
+
+# Grid cell sizes in degrees, coarse to fine
+RESOLUTIONS = (1.0, 0.25, 0.05, 0.01, 0.002)
+
+# Roughly how many screen pixels a grid cell should cover
+TARGET_CELL_PIXELS = 24
+
+
+def resolution_for_zoom(zoom: Optional[float]) -> float:
+    """Pick the grid resolution whose cells are closest to TARGET_CELL_PIXELS at `zoom`."""
+    if zoom is None:
+        return RESOLUTIONS[1]
+    wanted = 360.0 / (256 * 2 ** zoom) * TARGET_CELL_PIXELS
+    return min(RESOLUTIONS, key=lambda resolution: abs(np.log(resolution / wanted)))
+
+
+@dataclass
+class GridAggregate:
+    """Per-cell counts and mean vandalism_score for the occupied cells of one grid."""
+
+    resolution: float
+    cell_x: np.ndarray
+    cell_y: np.ndarray
+    counts: np.ndarray
+    mean_score: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def center_lon(self) -> np.ndarray:
+        return (self.cell_x + 0.5) * self.resolution
+
+    @property
+    def center_lat(self) -> np.ndarray:
+        return (self.cell_y + 0.5) * self.resolution
+
+    def cell_polygons(self) -> np.ndarray:
+        return shapely.box(
+            self.cell_x * self.resolution,
+            self.cell_y * self.resolution,
+            (self.cell_x + 1) * self.resolution,
+            (self.cell_y + 1) * self.resolution,
+        )
+
+    def within(self, bounds: Optional[dict], margin: float = 0.25) -> "GridAggregate":
+        """Cells whose center lies in a Leaflet viewport (st_folium bounds), grown by `margin`."""
+        south_west = (bounds or {}).get("_southWest") or {}
+        north_east = (bounds or {}).get("_northEast") or {}
+        if None in (south_west.get("lat"), south_west.get("lng"), north_east.get("lat"), north_east.get("lng")):
+            return self
+        dx = (north_east["lng"] - south_west["lng"]) * margin
+        dy = (north_east["lat"] - south_west["lat"]) * margin
+        lon, lat = self.center_lon, self.center_lat
+        mask = (
+            (lon >= south_west["lng"] - dx) & (lon <= north_east["lng"] + dx)
+            & (lat >= south_west["lat"] - dy) & (lat <= north_east["lat"] + dy)
+        )
+        return GridAggregate(
+            self.resolution, self.cell_x[mask], self.cell_y[mask], self.counts[mask], self.mean_score[mask]
+        )
+
+
+def _bin(lon: np.ndarray, lat: np.ndarray, scores: np.ndarray, resolution: float, keys: Optional[np.ndarray] = None):
+    """
+    Bin points into grid cells (optionally split by an extra integer key such
+    as a time period) with np.unique + np.bincount.
+
+    Returns:
+        (unique key rows, counts, mean scores)
+    """
+    columns = [np.floor(lon / resolution).astype(np.int64), np.floor(lat / resolution).astype(np.int64)]
+    if keys is not None:
+        columns.insert(0, keys)
+    cells, inverse = np.unique(np.column_stack(columns), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    counts = np.bincount(inverse, minlength=len(cells))
+    has_score = ~np.isnan(scores)
+    score_sums = np.bincount(inverse, weights=np.where(has_score, scores, 0.0), minlength=len(cells))
+    score_counts = np.bincount(inverse, weights=has_score.astype(np.float64), minlength=len(cells))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_score = np.where(score_counts > 0, score_sums / score_counts, np.nan)
+    return cells, counts, mean_score
+
+
+class ChangesetAggregator:
+    """
+    Grid aggregation of a spatial result for overview rendering (heatmap /
+    choropleth). Aggregates are computed on first use and cached per
+    resolution (and per time slicing).
+    """
+
+    def __init__(self, changesets):
+        """
+        :param changesets: ColumnarResult with center/bbox columns (geometries are attached if missing)
+        """
+        changesets = ensure_geometries(changesets)
+        count = len(changesets)
+        self.lon = np.asarray(changesets["lon"], dtype=np.float64)
+        self.lat = np.asarray(changesets["lat"], dtype=np.float64)
+        self.scores = np.asarray(changesets.get("vandalism_score", np.full(count, np.nan)), dtype=np.float64)
+        created = changesets.get("created")
+        self.created = None
+        if created is not None:
+            # Naive UTC so NULLs become NaT instead of breaking the cast; rows without a time are left out of time slices
+            created = pd.DatetimeIndex(pd.to_datetime(created, errors="coerce", utc=True)).tz_convert(None)
+            created = created.to_numpy("datetime64[s]")
+            if not np.isnat(created).all():
+                self.created = created
+        self._grids: dict[float, GridAggregate] = {}
+        self._time_slices: dict[tuple[float, str], dict[str, GridAggregate]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.lon)
+
+    def grid(self, resolution: float) -> GridAggregate:
+        with self._lock:
+            if resolution not in self._grids:
+                cells, counts, mean_score = _bin(self.lon, self.lat, self.scores, resolution)
+                self._grids[resolution] = GridAggregate(resolution, cells[:, 0], cells[:, 1], counts, mean_score)
+            return self._grids[resolution]
+
+    def time_sliced(self, resolution: float, period: str = "D") -> dict[str, GridAggregate]:
+        """
+        One grid per time period of the `created` column.
+
+        Args:
+            period: NumPy datetime unit for the slices, e.g. "h", "D", "W" or "M"
+
+        Returns:
+            {period label: GridAggregate} in chronological order (empty without `created`)
+        """
+        if self.created is None:
+            return {}
+        with self._lock:
+            key = (resolution, period)
+            if key not in self._time_slices:
+                valid = ~np.isnat(self.created)
+                periods = self.created[valid].astype(f"datetime64[{period}]")
+                cells, counts, mean_score = _bin(
+                    self.lon[valid], self.lat[valid], self.scores[valid], resolution,
+                    keys=periods.astype(np.int64),
+                )
+                slices = {}
+                for period_value in np.unique(cells[:, 0]):
+                    mask = cells[:, 0] == period_value
+                    label = str(np.datetime64(int(period_value), period))
+                    slices[label] = GridAggregate(
+                        resolution, cells[mask, 1], cells[mask, 2], counts[mask], mean_score[mask]
+                    )
+                self._time_slices[key] = slices
+            return self._time_slices[key]
@@ -0,0 +1,62 @@
+import numpy as np
+import shapely
+
+# Half the side of the box synthesised around a changeset that only has a center
+FALLBACK_HALF_SIZE = 0.005
+
+GEOMETRY_COLUMNS = ("center_geom", "bbox_geom", "lon", "lat")
+
+
+def parse_wkt(values, count: int) -> np.ndarray:
+    """
+    Parse a column of WKT strings in one vectorized call.
+
+    Missing columns, NULLs and unparsable strings all become None.
+    """
+    if values is None:
+        return np.full(count, None, dtype=object)
+    # None stays None; empty or malformed strings are "invalid" and ignored
+    return shapely.from_wkt(np.asarray(values, dtype=object), on_invalid="ignore")
+
+
+def attach_geometries(changesets):
+    """
+    Parse the `center` and `bbox` columns of a ColumnarResult at once and add
+    geometry columns: center_geom / bbox_geom (shapely arrays) and lon / lat.
+
+    Changesets without a bbox get a small box around their center, changesets
+    without a center use their bbox centroid, and rows with neither are dropped.
+    """
+    count = len(changesets)
+    centers = parse_wkt(changesets.get("center"), count)
+    bboxes = parse_wkt(changesets.get("bbox"), count)
+
+    missing_center = shapely.is_missing(centers)
+    missing_bbox = shapely.is_missing(bboxes)
+
+    centers = np.where(missing_center & ~missing_bbox, shapely.centroid(bboxes), centers)
+    lon = shapely.get_x(centers)
+    lat = shapely.get_y(centers)
+
+    needs_box = missing_bbox & ~missing_center
+    if needs_box.any():
+        bboxes = bboxes.copy()
+        bboxes[needs_box] = shapely.box(
+            lon[needs_box] - FALLBACK_HALF_SIZE,
+            lat[needs_box] - FALLBACK_HALF_SIZE,
+            lon[needs_box] + FALLBACK_HALF_SIZE,
+            lat[needs_box] + FALLBACK_HALF_SIZE,
+        )
+
+    keep = ~shapely.is_missing(bboxes) & ~np.isnan(lon) & ~np.isnan(lat)
+    return (
+        changesets.with_column("center_geom", centers)
+        .with_column("bbox_geom", bboxes)
+        .with_column("lon", lon)
+        .with_column("lat", lat)
+        .take(keep)
+    )
+
+
+def ensure_geometries(changesets):
+    return changesets if "bbox_geom" in changesets else attach_geometries(changesets)
@@ -0,0 +1,73 @@
+from typing import Optional
+
+import numpy as np
+import shapely
+
+from .geometry import ensure_geometries
+
+
+class ChangesetIndex:
+    """
+    STRtree over the bbox geometries of a spatial result, built once per result
+    set and used to answer viewport and nearest-changeset queries.
+    """
+
+    def __init__(self, changesets):
+        """
+        :param changesets: ColumnarResult with center/bbox columns (geometries are attached if missing)
+        """
+        self.changesets = ensure_geometries(changesets)
+        self.tree = shapely.STRtree(self.changesets["bbox_geom"])
+
+    def __len__(self) -> int:
+        return len(self.changesets)
+
+    def query_bbox(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float, margin: float = 0.0) -> np.ndarray:
+        """
+        Indices of changesets whose bbox intersects the box, grown on every side
+        by `margin` times its width / height.
+        """
+        dx = (max_lon - min_lon) * margin
+        dy = (max_lat - min_lat) * margin
+        window = shapely.box(min_lon - dx, min_lat - dy, max_lon + dx, max_lat + dy)
+        return np.sort(self.tree.query(window, predicate="intersects"))
+
+    def query_viewport(self, bounds: Optional[dict], margin: float = 0.25):
+        """
+        Changesets intersecting a Leaflet viewport as returned by st_folium
+        ({"_southWest": {"lat", "lng"}, "_northEast": {"lat", "lng"}}).
+
+        Returns:
+            The filtered ColumnarResult; everything when bounds are unknown
+        """
+        south_west = (bounds or {}).get("_southWest") or {}
+        north_east = (bounds or {}).get("_northEast") or {}
+        if None in (south_west.get("lat"), south_west.get("lng"), north_east.get("lat"), north_east.get("lng")):
+            return self.changesets
+        indices = self.query_bbox(
+            south_west["lng"], south_west["lat"], north_east["lng"], north_east["lat"], margin=margin
+        )
+        return self.changesets.take(indices)
+
+    def nearest(self, lon: float, lat: float, max_distance: Optional[float] = None) -> Optional[dict]:
+        """
+        The changeset whose bbox is closest to a point (distance 0 if inside it).
+
+        Returns:
+            The changeset row plus its `distance` in degrees, or None if nothing
+            lies within max_distance
+        """
+        if not len(self):
+            return None
+        indices, distances = self.tree.query_nearest(
+            shapely.Point(lon, lat), max_distance=max_distance, return_distance=True
+        )
+        if not len(indices):
+            return None
+        row = {
+            name: value
+            for name, value in self.changesets.row(int(indices[0])).items()
+            if name not in ("center_geom", "bbox_geom")
+        }
+        row["distance"] = float(distances[0])
+        return row
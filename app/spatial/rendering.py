@@ -0,0 +1,214 @@
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+import folium
+import numpy as np
+import shapely
+from folium.plugins import FastMarkerCluster, HeatMap, HeatMapWithTime
+
+from .aggregation import GridAggregate
+from .geometry import ensure_geometries
+
+POPUP_FIELDS = ["id", "user_name", "change_count", "vandalism_score", "comment", "flags"]
+POPUP_ALIASES = ["Changeset", "User", "Changes", "Score", "Comment", "Flags"]
+
+# Colors the map has always used for low / medium / high vandalism scores
+SCORE_COLORS = ("green", "orange", "red")
+
+CLUSTER_CALLBACK = """
+function (row) {
+    var color = row[2] > 0.7 ? 'red' : (row[2] > 0.4 ? 'orange' : 'green');
+    var marker = L.circleMarker(new L.LatLng(row[0], row[1]),
+        {radius: 6, color: color, fillColor: color, fillOpacity: 0.8, weight: 1});
+    marker.bindPopup('Changeset ' + row[3]);
+    return marker;
+}
+"""
+
+
+@dataclass
+class MapRenderConfig:
+    # Above this many changesets centers are drawn with FastMarkerCluster
+    cluster_threshold: int = 2000
+    # Above this many changesets the bbox polygon layer is left out entirely
+    max_polygon_features: int = 20000
+    # Simplification tolerance in screen pixels at the current zoom
+    simplify_pixels: float = 1.5
+    # In "auto" map mode, above this many changesets the map shows grid cells instead
+    aggregate_threshold: int = 50000
+
+
+def score_colors(scores: np.ndarray) -> np.ndarray:
+    return np.select([scores > 0.7, scores > 0.4], [SCORE_COLORS[2], SCORE_COLORS[1]], SCORE_COLORS[0])
+
+
+def degrees_per_pixel(zoom: float) -> float:
+    """Approximate size of one screen pixel in degrees on a 256px web-mercator tile."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def simplify_for_zoom(geometries: np.ndarray, zoom: Optional[float], pixels: float) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Simplify polygons to the detail visible at `zoom` and flag the ones that
+    would be smaller than a pixel (their center marker already shows them).
+
+    Returns:
+        (simplified geometries, mask of geometries worth drawing)
+    """
+    if zoom is None:
+        return geometries, np.ones(len(geometries), dtype=bool)
+    tolerance = degrees_per_pixel(zoom) * pixels
+    bounds = shapely.bounds(geometries)
+    extent = np.fmax(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1])
+    visible = extent >= tolerance
+    return shapely.simplify(geometries, tolerance, preserve_topology=True), visible
+
+
+def feature_collection(geometries: np.ndarray, properties: dict[str, list]) -> str:
+    """
+    Serialise geometries plus per-feature properties to a GeoJSON FeatureCollection.
+
+    Geometries are converted with one vectorized shapely.to_geojson call.
+    """
+    names = list(properties)
+    features = [
+        '{"type":"Feature","geometry":%s,"properties":%s}'
+        % (geometry, json.dumps(dict(zip(names, values)), default=str))
+        for geometry, *values in zip(shapely.to_geojson(geometries), *(properties[name] for name in names))
+    ]
+    return '{"type":"FeatureCollection","features":[%s]}' % ",".join(features)
+
+
+def changeset_properties(changesets, scores: np.ndarray, colors: np.ndarray) -> dict[str, list]:
+    count = len(changesets)
+    unknown = np.full(count, "Unknown", dtype=object)
+    flags = changesets.get("flags", np.full(count, None, dtype=object))
+    return {
+        "id": changesets.get("id", unknown).tolist(),
+        "user_name": changesets.get("user_name", unknown).tolist(),
+        "change_count": changesets.get("change_count", unknown).tolist(),
+        "vandalism_score": np.round(scores, 2).tolist(),
+        "comment": changesets.get("comment", unknown).tolist(),
+        "flags": [value if isinstance(value, str) else ", ".join(value or []) for value in flags],
+        "color": colors.tolist(),
+    }
+
+
+def _feature_style(feature: dict) -> dict:
+    color = feature["properties"]["color"]
+    return {"color": color, "fillColor": color, "fillOpacity": 0.3, "weight": 2}
+
+
+def _marker_style(feature: dict) -> dict:
+    color = feature["properties"]["color"]
+    return {"color": color, "fillColor": color, "fillOpacity": 0.8, "radius": 8}
+
+
+def add_changeset_layers(
+    m: folium.Map,
+    changesets,
+    zoom: Optional[float] = None,
+    config: Optional[MapRenderConfig] = None,
+) -> folium.Map:
+    """
+    Add changesets to a map as a few layers instead of one element per changeset:
+
+    - bbox polygons as a single GeoJSON layer styled by vandalism_score and
+      simplified for the current zoom (omitted above max_polygon_features)
+    - centers as a single GeoJSON point layer, or FastMarkerCluster above
+      cluster_threshold
+    """
+    config = config or MapRenderConfig()
+    changesets = ensure_geometries(changesets)
+    count = len(changesets)
+    if not count:
+        return m
+
+    scores = np.nan_to_num(np.asarray(changesets.get("vandalism_score", np.zeros(count)), dtype=np.float64))
+    colors = score_colors(scores)
+    properties = changeset_properties(changesets, scores, colors)
+
+    if count <= config.max_polygon_features:
+        polygons, visible = simplify_for_zoom(changesets["bbox_geom"], zoom, config.simplify_pixels)
+        if visible.any():
+            visible_properties = {name: [v for v, keep in zip(values, visible) if keep] for name, values in properties.items()}
+            folium.GeoJson(
+                feature_collection(polygons[visible], visible_properties),
+                name="Changeset areas",
+                style_function=_feature_style,
+                popup=folium.GeoJsonPopup(fields=POPUP_FIELDS, aliases=POPUP_ALIASES),
+            ).add_to(m)
+
+    if count > config.cluster_threshold:
+        data = np.column_stack([changesets["lat"], changesets["lon"], scores]).tolist()
+        for row, changeset_id in zip(data, properties["id"]):
+            row.append(changeset_id)
+        FastMarkerCluster(data, callback=CLUSTER_CALLBACK, name="Changesets").add_to(m)
+    else:
+        folium.GeoJson(
+            feature_collection(changesets["center_geom"], properties),
+            name="Changesets",
+            marker=folium.CircleMarker(radius=8, fill=True),
+            style_function=_marker_style,
+            popup=folium.GeoJsonPopup(fields=["id"], aliases=["Changeset"]),
+        ).add_to(m)
+
+    return m
+
+
+def heat_points(aggregate: GridAggregate) -> list[list[float]]:
+    """[lat, lon, weight] per occupied cell, weights scaled to 0..1 by cell count."""
+    if not len(aggregate):
+        return []
+    weights = aggregate.counts / aggregate.counts.max()
+    return np.column_stack([aggregate.center_lat, aggregate.center_lon, weights]).tolist()
+
+
+def add_heatmap_layer(m: folium.Map, aggregate: GridAggregate) -> folium.Map:
+    """One HeatMap layer over the grid cell centers, weighted by changeset count."""
+    if len(aggregate):
+        HeatMap(heat_points(aggregate), name="Changeset density", radius=18, blur=12).add_to(m)
+    return m
+
+
+def add_grid_layer(m: folium.Map, aggregate: GridAggregate) -> folium.Map:
+    """
+    Grid cells as a single GeoJSON choropleth layer: fill color from the mean
+    vandalism_score of the cell, opacity from its changeset count.
+    """
+    if not len(aggregate):
+        return m
+    scores = np.nan_to_num(aggregate.mean_score)
+    opacity = 0.2 + 0.6 * np.log1p(aggregate.counts) / np.log1p(aggregate.counts.max())
+    properties = {
+        "changesets": aggregate.counts.tolist(),
+        "mean_score": np.round(scores, 2).tolist(),
+        "color": score_colors(scores).tolist(),
+        "opacity": np.round(opacity, 2).tolist(),
+    }
+    folium.GeoJson(
+        feature_collection(aggregate.cell_polygons(), properties),
+        name="Changeset grid",
+        style_function=_cell_style,
+        tooltip=folium.GeoJsonTooltip(fields=["changesets", "mean_score"], aliases=["Changesets", "Mean score"]),
+    ).add_to(m)
+    return m
+
+
+def add_time_heatmap_layer(m: folium.Map, slices: dict[str, GridAggregate]) -> folium.Map:
+    """A HeatMapWithTime layer with one frame per time slice of the grid."""
+    if slices:
+        HeatMapWithTime(
+            [heat_points(aggregate) for aggregate in slices.values()],
+            index=list(slices),
+            name="Changeset density over time",
+            radius=18,
+            auto_play=False,
+        ).add_to(m)
+    return m
+
+
+def _cell_style(feature: dict) -> dict:
+    properties = feature["properties"]
+    return {"color": properties["color"], "fillColor": properties["color"], "fillOpacity": properties["opacity"], "weight": 0.5}
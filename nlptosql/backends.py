@@ -0,0 +1,182 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+
+class NoBackendAvailable(requests.exceptions.ConnectionError):
+    """No healthy Ollama backend has the configured model."""
+
+
+@dataclass
+class Backend:
+    url: str
+    healthy: bool = False
+    # The model is pulled on this backend (/api/tags) / currently in memory (/api/ps)
+    has_model: bool = False
+    model_loaded: bool = False
+    digest: Optional[str] = None
+    outstanding: int = 0
+    requests: int = 0
+    failures: int = 0
+    # 5xx responses in a row, reset by a successful request or health check
+    server_errors: int = 0
+    checked_at: float = 0.0
+
+
+def _model_entry(models: List[Dict], model_name: str) -> Optional[Dict]:
+    for model in models:
+        if model.get("name") in (model_name, f"{model_name}:latest") or model.get("model") in (model_name, f"{model_name}:latest"):
+            return model
+    return None
+
+
+class BackendPool:
+    """
+    Routes requests over several Ollama servers.
+
+    Each request goes to the healthy backend with the fewest requests in flight
+    among those that have the model; on a tie, a backend where the model is
+    already loaded wins. Backends are health-checked (/api/tags, /api/ps) by a
+    background thread every health_check_interval seconds (started on the
+    first acquire() or by start()). A backend that cannot be reached, or that
+    answers max_server_errors requests in a row with a 5xx, is taken out of
+    rotation until its next successful check.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        model_name: str,
+        session: requests.Session,
+        health_check_interval: float = 15.0,
+        timeout: tuple = (2.0, 5.0),
+        on_digest_change: Optional[Callable[[Backend, str], None]] = None,
+        max_server_errors: int = 2
+    ):
+        """
+        :param max_server_errors: 5xx responses in a row after which a backend leaves the rotation
+        :param on_digest_change: Called with (backend, new digest) when a health check finds the model
+            digest changed, e.g. the model was re-pulled under the same tag
+        """
+        self.backends = [Backend(url.rstrip("/")) for url in urls]
+        self.model_name = model_name
+        self.session = session
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.on_digest_change = on_digest_change
+        self.max_server_errors = max_server_errors
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self, backend: Backend) -> Backend:
+        """Refresh one backend's health and model availability."""
+        try:
+            tags = self.session.get(f"{backend.url}/api/tags", timeout=self.timeout)
+            tags.raise_for_status()
+            entry = _model_entry(tags.json().get("models", []), self.model_name)
+            loaded = False
+            if entry is not None:
+                running = self.session.get(f"{backend.url}/api/ps", timeout=self.timeout)
+                loaded = running.ok and _model_entry(running.json().get("models", []), self.model_name) is not None
+            digest = entry.get("digest") if entry else None
+            with self._lock:
+                changed = digest is not None and backend.digest is not None and digest != backend.digest
+                backend.healthy = True
+                backend.server_errors = 0
+                backend.has_model = entry is not None
+                backend.model_loaded = loaded
+                backend.digest = digest
+        except (requests.exceptions.RequestException, ValueError):
+            with self._lock:
+                backend.healthy = False
+            changed = False
+        backend.checked_at = time.monotonic()
+        if changed and self.on_digest_change:
+            self.on_digest_change(backend, digest)
+        return backend
+
+    def start(self):
+        """Start the background health checks (no-op if already running)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            self.check_all()
+
+    def check_all(self) -> List[Backend]:
+        threads = [threading.Thread(target=self.check, args=(backend,)) for backend in self.backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.backends
+
+    def acquire(self, exclude: Optional[List[Backend]] = None, prefer: Optional[Backend] = None) -> Backend:
+        """
+        Reserve the least loaded usable backend (`prefer` if it is usable).
+
+        Raises:
+            NoBackendAvailable: if no healthy backend has the model
+        """
+        if all(backend.checked_at == 0.0 for backend in self.backends):
+            # Nothing known yet: the first request has to wait for the checks
+            self.check_all()
+        self.start()
+        with self._lock:
+            candidates = [
+                backend for backend in self.backends
+                if backend.healthy and backend.has_model and backend not in (exclude or [])
+            ]
+            if not candidates:
+                raise NoBackendAvailable(f"No healthy Ollama backend has model '{self.model_name}'")
+            if prefer in candidates:
+                backend = prefer
+            else:
+                backend = min(candidates, key=lambda backend: (backend.outstanding, not backend.model_loaded))
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, failed: bool = False, server_error: bool = False):
+        """
+        :param failed: The backend could not be reached (connection error or timeout)
+        :param server_error: The backend answered with a 5xx
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            if failed or server_error:
+                backend.failures += 1
+                backend.server_errors += server_error
+                if failed or backend.server_errors >= self.max_server_errors:
+                    backend.healthy = False
+            else:
+                backend.server_errors = 0
+                # A successful generation leaves the model in memory
+                backend.model_loaded = True
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {
+                    "url": backend.url,
+                    "healthy": backend.healthy,
+                    "has_model": backend.has_model,
+                    "model_loaded": backend.model_loaded,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "failures": backend.failures,
+                }
+                for backend in self.backends
+            ]
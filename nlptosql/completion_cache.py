@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Collection, Dict, Optional
+
+
+@dataclass
+class CompletionCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+
+class CompletionCache:
+    """
+    Two-tier cache of LLM completions: an in-process LRU in front of a SQLite file.
+
+    Entries are keyed on a hash of model name, generation options, system
+    prompt and prompt, expire after ttl_seconds, and remember the digest of the
+    model that produced them so they can be dropped when the model is replaced
+    under the same name. Several digests can be current at once (backends
+    serving different pulls of the same tag) without invalidating each other.
+    """
+
+    def __init__(
+        self,
+        path: str = ".nlptosql_cache/completions.sqlite",
+        ttl_seconds: float = 7 * 86400,
+        max_memory_entries: int = 1024,
+        max_disk_entries: int = 100000,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._stats = CompletionCacheStats()
+        # key -> (response, model, digest, created_at)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, digest TEXT, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed_at)")
+        self._db.commit()
+        # Upper bound on the rows on disk (replacements count as inserts); recounted when it passes
+        # max_disk_entries so put() does not run COUNT(*) every time
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    @staticmethod
+    def key(model: str, options: Dict, system: str, prompt: str) -> str:
+        material = json.dumps([model, options, system, prompt], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key: str, digests: Optional[Collection[str]] = None) -> Optional[str]:
+        """
+        Cached completion for key, or None.
+
+        Args:
+            digests: Current digests of the model; entries made by any other digest
+                are treated as missing. None / empty skips the check (digests not known yet).
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._valid(entry[2], entry[3], digests, now):
+                self._memory.move_to_end(key)
+                self._stats.memory_hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            row = self._db.execute(
+                "SELECT response, model, digest, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or not self._valid(row[2], row[3], digests, now):
+                if row is not None:
+                    self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._disk_entries -= 1
+                self._stats.misses += 1
+                return None
+            self._db.execute("UPDATE completions SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, tuple(row))
+            self._stats.disk_hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: str, digest: Optional[str] = None):
+        """
+        Args:
+            digest: Digest of the model (on the backend) that produced the response
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, (response, model, digest, now))
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, model, digest, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, digest, response, now, now),
+            )
+            self._stats.stores += 1
+            self._disk_entries += 1
+            if self._disk_entries > self.max_disk_entries:
+                self._evict_disk()
+            self._db.commit()
+
+    def invalidate_model(self, model: str, digests: Optional[Collection[str]] = None) -> int:
+        """
+        Drop the entries of `model` that were not produced by one of `digests`
+        (all of them when digests is None).
+
+        Returns:
+            Number of entries removed from disk
+        """
+        digests = list(digests) if digests is not None else []
+        with self._lock:
+            for key in [key for key, entry in self._memory.items() if entry[1] == model and entry[2] not in digests]:
+                del self._memory[key]
+            if not digests:
+                cursor = self._db.execute("DELETE FROM completions WHERE model = ?", (model,))
+            else:
+                cursor = self._db.execute(
+                    "DELETE FROM completions WHERE model = ? AND (digest IS NULL OR digest NOT IN "
+                    f"({', '.join('?' * len(digests))}))",
+                    (model, *digests),
+                )
+            self._db.commit()
+            self._stats.invalidations += cursor.rowcount
+            self._disk_entries -= cursor.rowcount
+            return cursor.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM completions")
+            self._db.commit()
+            self._disk_entries = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = asdict(self._stats)
+            stats["hit_rate"] = self._stats.hit_rate
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _valid(
+        self, entry_digest: Optional[str], created_at: float, digests: Optional[Collection[str]], now: float
+    ) -> bool:
+        if now - created_at >= self.ttl_seconds:
+            return False
+        return not digests or entry_digest is None or entry_digest in digests
+
+    def _remember(self, key: str, entry: tuple):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        count = self._db.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            cursor = self._db.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            self._stats.evictions += cursor.rowcount
+            count -= cursor.rowcount
+        self._disk_entries = count
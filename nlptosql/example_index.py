@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from scipy import sparse
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_QUOTED = re.compile(r"'[^']*'|\"[^\"]*\"")
+_ENTITY_WORD = re.compile(r"[\w'-]+")
+# Relative time words change the answer as much as a place name or number does
+_TIME_WORDS = {"today", "yesterday", "tomorrow", "last", "past", "next", "this", "recent", "latest", "hour", "hours",
+               "day", "days", "week", "weeks", "month", "months", "year", "years"}
+
+
+class Example(NamedTuple):
+    question: str
+    sql: str
+    score: float
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(_NON_WORD.sub(" ", question.lower()).split())
+
+
+def entities(question: str) -> frozenset:
+    """
+    Literal parts of a question that must match before a stored SQL is reused:
+    quoted strings, capitalised words after the first (place and user names),
+    tokens with digits (ids, numbers, dates) and relative time words.
+    """
+    found = {quoted.strip("'\"").lower() for quoted in _QUOTED.findall(question)}
+    for position, word in enumerate(_ENTITY_WORD.findall(_QUOTED.sub(" ", question))):
+        lower = word.lower()
+        if (position > 0 and word[0].isupper()) or any(char.isdigit() for char in word) or lower in _TIME_WORDS:
+            found.add(lower)
+    return frozenset(found)
+
+
+def features(question: str, ngram: int = 3) -> Dict[str, int]:
+    """Word and character n-gram counts of a normalized question."""
+    text = normalize_question(question)
+    counts: Dict[str, int] = {}
+    for word in text.split():
+        counts["w:" + word] = counts.get("w:" + word, 0) + 1
+    padded = f" {text} "
+    for i in range(len(padded) - ngram + 1):
+        gram = padded[i:i + ngram]
+        counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class ExampleIndex:
+    """
+    TF-IDF index over accepted (question, SQL) pairs for nearest-question lookup.
+
+    Questions are represented by word and character trigram features (robust to
+    rephrasing and typos). The index is a sparse (feature x question) matrix,
+    so a lookup slices the postings of the query's own features and scores
+    every pair with one sparse matrix-vector product. Query features the index
+    has never seen still count towards the query norm (at the highest idf), so
+    new words lower the similarity. It is rebuilt lazily after additions.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: Optional JSONL file the pairs are loaded from and appended to
+        """
+        self.path = path
+        self.questions: List[str] = []
+        self.sqls: List[str] = []
+        self._features: List[Dict[str, int]] = []
+        self._keys: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._dirty = True
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        pair = json.loads(line)
+                        self._add(pair["question"], pair["sql"])
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def add(self, question: str, sql: str):
+        """Record an accepted pair; a question seen before gets its SQL replaced."""
+        with self._lock:
+            self._add(question, sql)
+            if self.path:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"question": question, "sql": sql}) + "\n")
+
+    def search(self, question: str, k: int = 3) -> List[Example]:
+        """The k most similar stored questions by cosine similarity, best first."""
+        with self._lock:
+            if not self.questions:
+                return []
+            if self._dirty:
+                self._build()
+            ids, weights, norm = [], [], 0.0
+            for feature, count in features(question).items():
+                feature_id = self._vocabulary.get(feature)
+                weight = (1.0 + np.log(count)) * (self._idf[feature_id] if feature_id is not None else self._max_idf)
+                norm += weight ** 2
+                if feature_id is not None:
+                    ids.append(feature_id)
+                    weights.append(weight)
+            if not ids:
+                return []
+            scores = self._matrix[ids].T @ (np.asarray(weights) / np.sqrt(norm))
+            k = min(k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [Example(self.questions[i], self.sqls[i], float(scores[i])) for i in best if scores[i] > 0]
+
+    def _add(self, question: str, sql: str):
+        key = normalize_question(question)
+        if key in self._keys:
+            self.sqls[self._keys[key]] = sql
+            return
+        self._keys[key] = len(self.questions)
+        self.questions.append(question)
+        self.sqls.append(sql)
+        self._features.append(features(question))
+        self._dirty = True
+
+    def _build(self):
+        self._vocabulary: Dict[str, int] = {}
+        feature_ids, docs, counts = [], [], []
+        for doc, doc_features in enumerate(self._features):
+            for feature, count in doc_features.items():
+                feature_ids.append(self._vocabulary.setdefault(feature, len(self._vocabulary)))
+                docs.append(doc)
+                counts.append(count)
+        feature_ids = np.asarray(feature_ids, dtype=np.int64)
+        docs = np.asarray(docs, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.float64)
+
+        document_frequency = np.bincount(feature_ids, minlength=len(self._vocabulary))
+        self._idf = np.log((1.0 + len(self._features)) / (1.0 + document_frequency)) + 1.0
+        weights = (1.0 + np.log(counts)) * self._idf[feature_ids]
+        norms = np.sqrt(np.bincount(docs, weights=weights ** 2, minlength=len(self._features)))
+        weights /= norms[docs]
+
+        self._max_idf = np.log(1.0 + len(self._features)) + 1.0
+        # Row f holds the postings of feature f
+        self._matrix = sparse.csr_matrix(
+            (weights.astype(np.float32), (feature_ids, docs)), shape=(len(self._vocabulary), len(self._features))
+        )
+        self._dirty = False
@@ -1,10 +1,25 @@
 import os
 import json
+import time
+import asyncio
+import threading
 import requests
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Callable, Dict, Iterator, List, Optional, Union
 from dataclasses import dataclass
 from enum import Enum
 
+from backends import BackendPool
+from completion_cache import CompletionCache
+from example_index import Example, ExampleIndex, entities
+from schema_index import SchemaIndex
+
+SYSTEM_PROMPT = """
+        You are a SQL expert that converts natural language to SQL.
+        Respond with ONLY the SQL query, no explanations or markdown formatting.
+        """
+
 class ModelType(Enum):
     OLLAMA = "ollama"
 
@@ -13,72 +28,550 @@ class NLToSQLConfig:
     model_type: ModelType = ModelType.OLLAMA
     model_name: str = "deepseek"
     ollama_base_url: str = "http://localhost:11434"
+    # Several Ollama servers to balance over; ollama_base_url is used when unset
+    ollama_base_urls: Optional[List[str]] = None
+    health_check_interval: float = 15.0
     temperature: float = 0.1
     max_tokens: int = 1000
+    # (connect, read) timeout for generation requests; read applies per streamed chunk
+    request_timeout: tuple = (5.0, 120.0)
+    # How long Ollama keeps the model loaded after a request (Ollama duration string)
+    keep_alive: str = "30m"
+    # Upper bound on concurrent requests from to_sql_many; also sizes the connection pool
+    max_concurrency: int = 4
+    # Schema pruning when a SchemaIndex is used
+    schema_max_tables: int = 5
+    schema_max_columns: int = 12
+    # Start-up: Ollama is checked in the background, retrying until startup_timeout
+    validate_in_background: bool = True
+    startup_timeout: float = 60.0
+    # Load the model into memory right after validation so the first question does not pay for it
+    warm_up: bool = False
+    # Completion cache (memory LRU + SQLite); None disables it
+    cache_path: Optional[str] = ".nlptosql_cache/completions.sqlite"
+    cache_ttl_seconds: float = 7 * 86400
+    # Past question / SQL pairs: reuse the SQL above this similarity, otherwise add the closest as examples
+    example_match_threshold: float = 0.9
+    few_shot_examples: int = 3
+
+
+class StatementScanner:
+    """
+    Finds the end of the first SQL statement in text that arrives in pieces.
+
+    Tracks quotes and comments across chunks so each character is looked at
+    once; the statement ends at a `;` outside quotes / comments, or at a closing
+    markdown fence when the model wrapped the query in one.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._quote: Optional[str] = None
+        self._comment: Optional[str] = None
+        self._in_fence = False
+
+    def feed(self, chunk: str) -> Optional[int]:
+        """Append a chunk; returns the end offset of the statement once it is complete."""
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text):
+            i = self._pos
+            c = text[i]
+            if self._comment == "--":
+                if c == "\n":
+                    self._comment = None
+            elif self._comment == "/*":
+                if text.startswith("*/", i):
+                    self._comment = None
+                    self._pos += 1
+            elif self._quote:
+                if c == self._quote:
+                    self._quote = None
+            elif c == "`" and len(text) - i < 3 and "```".startswith(text[i:]):
+                # Could be the start of a fence; wait for the next chunk
+                return None
+            elif text.startswith("```", i):
+                if self._in_fence:
+                    return i
+                # Skip the fence and its language tag
+                newline = text.find("\n", i)
+                if newline == -1:
+                    return None
+                self._in_fence = True
+                self._pos = newline
+            elif c in ("'", '"', "`"):
+                self._quote = c
+            elif text.startswith("--", i):
+                self._comment = "--"
+            elif text.startswith("/*", i):
+                self._comment = "/*"
+            elif c == ";":
+                return i + 1
+            self._pos += 1
+        return None
+
+
+@dataclass
+class StreamStats:
+    time_to_first_token: Optional[float] = None
+    total_time: Optional[float] = None
+    tokens: int = 0
+    stopped_early: bool = False
+
+
+class SQLStream:
+    """
+    Iterator over the tokens of one streamed generation.
+
+    Iterating yields text pieces as Ollama produces them and stops as soon as
+    the SQL statement is complete, closing the connection so Ollama stops
+    generating. `sql` and `stats` are filled in as the stream is consumed;
+    when a `guard` is set, `sql` is the statement it returned (the tokens are
+    the raw generation).
+    """
+
+    def __init__(
+        self,
+        response: Optional[requests.Response],
+        started_at: float,
+        on_complete: Optional[Callable[[str], None]] = None,
+        on_close: Optional[Callable[[bool], None]] = None
+    ):
+        self._response = response
+        self._started_at = started_at
+        self._on_complete = on_complete
+        # Called with True if the connection failed mid-stream (releases the backend)
+        self._on_close = on_close
+        self._scanner = StatementScanner()
+        self.stats = StreamStats()
+        self.sql = ""
+        self.guard: Optional[Callable[[str], str]] = None
+
+    @classmethod
+    def from_cache(cls, sql: str) -> "SQLStream":
+        """A stream that yields an already known SQL statement at once."""
+        stream = cls(None, time.monotonic())
+        stream.sql = sql
+        return stream
+
+    def __iter__(self) -> Iterator[str]:
+        if self._response is None:
+            self.stats.time_to_first_token = self.stats.total_time = time.monotonic() - self._started_at
+            if self.guard and self.sql:
+                self.sql = self.guard(self.sql)
+            yield self.sql
+            return
+        completed = False
+        failed = False
+        try:
+            for line in self._response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                token = chunk.get("response", "")
+                if token:
+                    if self.stats.time_to_first_token is None:
+                        self.stats.time_to_first_token = time.monotonic() - self._started_at
+                    self.stats.tokens += 1
+                    end = self._scanner.feed(token)
+                    if end is not None:
+                        # Only yield what belongs to the statement
+                        consumed = len(self._scanner.text) - len(token)
+                        self._scanner.text = self._scanner.text[:end]
+                        if end > consumed:
+                            yield token[:end - consumed]
+                        self.stats.stopped_early = not chunk.get("done", False)
+                        break
+                    yield token
+                if chunk.get("done"):
+                    self.stats.tokens = chunk.get("eval_count", self.stats.tokens)
+                    break
+            completed = True
+        except requests.exceptions.RequestException:
+            failed = True
+            raise
+        finally:
+            self._response.close()
+            if self._on_close:
+                self._on_close(failed)
+            self.stats.total_time = time.monotonic() - self._started_at
+            self.sql = _clean_sql(self._scanner.text)
+        if completed and self.sql and self._on_complete:
+            self._on_complete(self.sql)
+        if completed and self.sql and self.guard:
+            self.sql = self.guard(self.sql)
+
+    def read(self) -> str:
+        """Consume the rest of the stream and return the SQL."""
+        for _ in self:
+            pass
+        return self.sql
+
+
+@dataclass
+class SQLResult:
+    question: str
+    sql: Optional[str] = None
+    error: Optional[Exception] = None
+    elapsed: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _clean_sql(text: str) -> str:
+    """Strip markdown fences and surrounding whitespace from generated SQL."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+    end = text.find("```")
+    if end != -1:
+        text = text[:end]
+    return text.strip()
 
 class NLToSQL:    
-    def __init__(self, config: Optional[NLToSQLConfig] = None):
+    def __init__(
+        self,
+        config: Optional[NLToSQLConfig] = None,
+        schema_index: Optional[SchemaIndex] = None,
+        cache: Optional[CompletionCache] = None,
+        examples: Optional[ExampleIndex] = None,
+        sql_guard: Optional[Callable[[str], str]] = None
+    ):
         self.config = config or NLToSQLConfig()
+        # Checks / rewrites every returned statement (e.g. adds a LIMIT); raises to reject it.
+        # Cached completions and accepted pairs are stored unguarded.
+        self.sql_guard = sql_guard
+        # Used for every question that comes without its own schema_info
+        self.schema_index = schema_index
+        # Accepted question / SQL pairs, see accept()
+        self.examples = examples
+        # One pooled keep-alive session for every call, sized for to_sql_many
+        self.session = requests.Session()
+        urls = self.config.ollama_base_urls or [self.config.ollama_base_url]
+        adapter = HTTPAdapter(pool_connections=len(urls), pool_maxsize=self.config.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.backends = BackendPool(
+            urls, self.config.model_name, self.session, health_check_interval=self.config.health_check_interval,
+            on_digest_change=lambda backend, digest: self._update_model_digests()
+        )
+        
+        if cache is None and self.config.cache_path:
+            cache = CompletionCache(self.config.cache_path, ttl_seconds=self.config.cache_ttl_seconds)
+        self.cache = cache
+        # Digests of the configured model across the backends, as reported by /api/tags
+        self.model_digests: frozenset = frozenset()
+        
+        self.startup_error: Optional[Exception] = None
+        self._ready = threading.Event()
+        self._startup_done = threading.Event()
         
         if self.config.model_type == ModelType.OLLAMA:
-            self._validate_ollama_connection()
+            if self.config.validate_in_background:
+                threading.Thread(target=self._start_up, name="nl-to-sql-startup", daemon=True).start()
+            else:
+                self._validate_ollama_connection()
+                if self.config.warm_up:
+                    self.warm_up()
+                self._ready.set()
+                self._startup_done.set()
     
-    def _validate_ollama_connection(self):
+    def _start_up(self):
+        """Validate Ollama (retrying while it comes up) and optionally warm the model, off the caller's thread."""
+        deadline = time.monotonic() + self.config.startup_timeout
+        delay = 0.5
         try:
-            response = requests.get(f"{self.config.ollama_base_url}/api/tags")
+            while True:
+                try:
+                    self._validate_ollama_connection(quiet=time.monotonic() + delay < deadline)
+                    break
+                except requests.exceptions.RequestException:
+                    if time.monotonic() + delay >= deadline:
+                        raise
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+            if self.config.warm_up:
+                self.warm_up()
+            self._ready.set()
+        except Exception as e:
+            self.startup_error = e
+        finally:
+            self._startup_done.set()
+    
+    def warm_up(self):
+        """Ask every backend that has the model to load it, without generating anything (a request with no prompt)."""
+        def load(backend):
+            response = self.session.post(
+                f"{backend.url}/api/generate",
+                json={"model": self.config.model_name, "keep_alive": self.config.keep_alive},
+                timeout=(self.config.request_timeout[0], max(self.config.request_timeout[1], self.config.startup_timeout))
+            )
             response.raise_for_status()
-            
-            models = [model["name"] for model in response.json().get("models", [])]
-            if self.config.model_name not in models:
-                print(f"Warning: Model '{self.config.model_name}' not found in Ollama. "
-                      f"Available models: {', '.join(models)}")
-                print(f"You can pull it with: ollama pull {self.config.model_name}")
-                
-        except requests.exceptions.RequestException as e:
-            print(f"Error connecting to Ollama at {self.config.ollama_base_url}")
-            print("Make sure Ollama is running and the base URL is correct.")
-            raise
+            backend.model_loaded = True
+        
+        backends = [backend for backend in self.backends.backends if backend.healthy and backend.has_model]
+        with ThreadPoolExecutor(max_workers=max(1, len(backends))) as pool:
+            list(pool.map(load, backends))
     
-    def _generate_sql_with_ollama(self, prompt: str) -> str:
-        url = f"{self.config.ollama_base_url}/api/generate"
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+    
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until start-up has finished (or timeout seconds passed).
         
-        system_prompt = """
-        You are a SQL expert that converts natural language to SQL.
-        Respond with ONLY the SQL query, no explanations or markdown formatting.
+        Returns True if Ollama was reachable (and the model warmed up, if
+        configured); on failure the exception is in self.startup_error.
         """
+        self._startup_done.wait(timeout)
+        return self._ready.is_set()
+    
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Awaitable readiness probe, see wait_until_ready."""
+        return await asyncio.to_thread(self.wait_until_ready, timeout)
+    
+    def _validate_ollama_connection(self, quiet: bool = False):
+        backends = self.backends.check_all()
+        healthy = [backend for backend in backends if backend.healthy]
+        if not healthy:
+            if not quiet:
+                print(f"Error connecting to Ollama at {', '.join(backend.url for backend in backends)}")
+                print("Make sure Ollama is running and the base URL is correct.")
+            raise requests.exceptions.ConnectionError("No Ollama backend is reachable")
         
-        payload = {
+        self._update_model_digests()
+        if not any(backend.has_model for backend in healthy):
+            print(f"Warning: Model '{self.config.model_name}' not found in Ollama.")
+            print(f"You can pull it with: ollama pull {self.config.model_name}")
+    
+    def _update_model_digests(self):
+        """
+        Record the model digests the backends report. Backends may serve different pulls of
+        the same tag, so completions are only dropped once no backend has their digest.
+        """
+        digests = frozenset(backend.digest for backend in self.backends.backends if backend.digest)
+        if digests and digests != self.model_digests:
+            self.model_digests = digests
+            if self.cache is not None:
+                # Completions of a replaced model (same name, new weights) are stale
+                self.cache.invalidate_model(self.config.model_name, digests)
+    
+    def _post_generate(self, payload: Dict, stream: bool = False):
+        """
+        Send a generate request to the least loaded backend, failing over to the
+        next one on connection errors and timeouts. A 5xx is retried once on the
+        same backend before failing over; the pool decides when repeated 5xx take
+        a backend out of rotation.
+        
+        Returns:
+            (response, backend); the caller releases the backend when done with the response
+        """
+        tried = []
+        retry = None
+        while True:
+            backend = self.backends.acquire(exclude=tried, prefer=retry)
+            retry = None
+            try:
+                response = self.session.post(
+                    f"{backend.url}/api/generate", json=payload, stream=stream, timeout=self.config.request_timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                self.backends.release(backend, failed=True)
+                tried.append(backend)
+                continue
+            if response.status_code >= 500:
+                response.close()
+                self.backends.release(backend, server_error=True)
+                if backend.server_errors == 1:
+                    retry = backend
+                else:
+                    tried.append(backend)
+                continue
+            if response.status_code >= 400:
+                self.backends.release(backend)
+                response.raise_for_status()
+            return response, backend
+    
+    def _generate_payload(self, prompt: str, stream: bool = False) -> Dict:
+        return {
             "model": self.config.model_name,
             "prompt": prompt,
-            "system": system_prompt,
-            "stream": False,
+            "system": SYSTEM_PROMPT,
+            "stream": stream,
+            "keep_alive": self.config.keep_alive,
             "options": {
                 "temperature": self.config.temperature,
                 "max_tokens": self.config.max_tokens
             }
         }
+    
+    def _cache_key(self, prompt: str) -> str:
+        payload = self._generate_payload(prompt)
+        return CompletionCache.key(payload["model"], payload["options"], payload["system"], prompt)
+    
+    def _generate_sql_with_ollama(self, prompt: str) -> str:
+        payload = self._generate_payload(prompt)
+        
+        if self.cache is not None:
+            key = self._cache_key(prompt)
+            cached = self.cache.get(key, self.model_digests)
+            if cached is not None:
+                return cached
         
         try:
-            response = requests.post(url, json=payload)
-            response.raise_for_status()
-            return response.json().get("response", "").strip()
+            response, backend = self._post_generate(payload)
+            try:
+                sql = response.json().get("response", "").strip()
+            finally:
+                self.backends.release(backend)
+        except Exception as e:
+            print(f"Error generating SQL: {str(e)}")
+            raise
+        if self.cache is not None and sql:
+            self.cache.put(key, sql, self.config.model_name, backend.digest)
+        return sql
+    
+    def _stream_sql_with_ollama(self, prompt: str) -> SQLStream:
+        on_complete = None
+        if self.cache is not None:
+            key = self._cache_key(prompt)
+            cached = self.cache.get(key, self.model_digests)
+            if cached is not None:
+                return SQLStream.from_cache(cached)
+            def on_complete(sql: str):
+                # Called once the stream has finished, so `backend` is the one that answered
+                self.cache.put(key, sql, self.config.model_name, backend.digest)
+        started_at = time.monotonic()
+        try:
+            response, backend = self._post_generate(self._generate_payload(prompt, stream=True), stream=True)
         except Exception as e:
             print(f"Error generating SQL: {str(e)}")
             raise
+        return SQLStream(
+            response, started_at, on_complete,
+            on_close=lambda failed: self.backends.release(backend, failed=failed)
+        )
     
-    def to_sql(self, natural_language_query: str, schema_info: Optional[str] = None) -> str:
+    def _build_prompt(
+        self,
+        natural_language_query: str,
+        schema_info: Optional[Union[str, SchemaIndex]] = None,
+        examples: Optional[List[Example]] = None
+    ) -> str:
+        # The instruction comes first and never changes so Ollama can reuse its prompt cache
+        schema_info = schema_info if schema_info is not None else self.schema_index
+        if isinstance(schema_info, SchemaIndex):
+            schema_info = schema_info.prompt_context(
+                natural_language_query, self.config.schema_max_tables, self.config.schema_max_columns
+            )
         prompt = f"Convert the following natural language query to SQL"
         if schema_info:
             prompt += f" using this schema information:\n\n{schema_info}\n\n"
         else:
             prompt += ":\n\n"
+        
+        if examples:
+            prompt += "Examples:\n\n"
+            for example in examples:
+                prompt += f"Query: {example.question}\nSQL: {example.sql}\n\n"
             
         prompt += f"Query: {natural_language_query}\n\nSQL:"
+        return prompt
+    
+    def _prepare(self, natural_language_query: str, schema_info: Optional[Union[str, SchemaIndex]]):
+        """
+        Look the question up among accepted pairs.
         
-        if self.config.model_type == ModelType.OLLAMA:
-            return self._generate_sql_with_ollama(prompt)
+        Returns:
+            (stored SQL of a paraphrase or None, prompt with the nearest pairs as examples)
+        """
+        neighbours = []
+        if self.examples is not None:
+            neighbours = self.examples.search(natural_language_query, max(1, self.config.few_shot_examples))
+            best = neighbours[0] if neighbours else None
+            # Reuse only a paraphrase about the same places, numbers and dates
+            if best and best.score >= self.config.example_match_threshold \
+                    and entities(best.question) == entities(natural_language_query):
+                return best.sql, None
+        return None, self._build_prompt(
+            natural_language_query, schema_info, neighbours[:self.config.few_shot_examples]
+        )
+    
+    def accept(self, natural_language_query: str, sql: str):
+        """Record a question / SQL pair as correct so paraphrases can reuse it."""
+        if self.examples is None:
+            self.examples = ExampleIndex()
+        self.examples.add(natural_language_query, sql)
+    
+    def to_sql(self, natural_language_query: str, schema_info: Optional[Union[str, SchemaIndex]] = None) -> str:
+        stored_sql, prompt = self._prepare(natural_language_query, schema_info)
+        if stored_sql is not None:
+            sql = stored_sql
+        elif self.config.model_type == ModelType.OLLAMA:
+            sql = self._generate_sql_with_ollama(prompt)
+        else:
+            raise ValueError(f"Unsupported model type: {self.config.model_type}")
+        return self.sql_guard(sql) if self.sql_guard and sql else sql
+    
+    def to_sql_many(
+        self,
+        natural_language_queries: List[str],
+        schema_info: Optional[Union[str, SchemaIndex]] = None,
+        max_concurrency: Optional[int] = None
+    ) -> List[SQLResult]:
+        """
+        Convert many questions concurrently over the pooled session.
+        
+        At most max_concurrency (default: config.max_concurrency) requests are
+        in flight at once. A failing question does not stop the batch: each
+        SQLResult carries either the SQL or the error, in input order.
+        """
+        def convert(query: str) -> SQLResult:
+            started_at = time.monotonic()
+            try:
+                return SQLResult(query, sql=self.to_sql(query, schema_info), elapsed=time.monotonic() - started_at)
+            except Exception as e:
+                return SQLResult(query, error=e, elapsed=time.monotonic() - started_at)
+        
+        workers = max(1, min(max_concurrency or self.config.max_concurrency, len(natural_language_queries)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nl-to-sql") as pool:
+            return list(pool.map(convert, natural_language_queries))
+    
+    def close(self):
+        self.backends.stop()
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def to_sql_stream(self, natural_language_query: str, schema_info: Optional[Union[str, SchemaIndex]] = None) -> SQLStream:
+        """
+        Streaming variant of to_sql.
+        
+        Returns an SQLStream: iterate it to receive tokens as they are generated.
+        Generation is aborted once the SQL statement is complete, and
+        stream.stats reports time to first token, token count and whether it
+        stopped early.
+        """
+        stored_sql, prompt = self._prepare(natural_language_query, schema_info)
+        if stored_sql is not None:
+            stream = SQLStream.from_cache(stored_sql)
+        elif self.config.model_type == ModelType.OLLAMA:
+            stream = self._stream_sql_with_ollama(prompt)
         else:
             raise ValueError(f"Unsupported model type: {self.config.model_type}")
+        stream.guard = self.sql_guard
+        return stream
 
 if __name__ == "__main__":
     SCHEMA_INFO = """
@@ -90,13 +583,19 @@ if __name__ == "__main__":
     - points_of_interest.version = versions.version_number
     """
     
-    nlp_to_sql = NLToSQL()
+    nlp_to_sql = NLToSQL(NLToSQLConfig(warm_up=True))
+    if not nlp_to_sql.wait_until_ready():
+        print(f"Error: Ollama is not ready: {nlp_to_sql.startup_error}")
     
     query = "Find all restaurants in the latest version"
     
     try:
-        sql = nlp_to_sql.to_sql(query, SCHEMA_INFO)
         print(f"\nNatural Language: {query}")
-        print(f"Generated SQL: {sql}")
+        print("Generated SQL: ", end="", flush=True)
+        stream = nlp_to_sql.to_sql_stream(query, SCHEMA_INFO)
+        for token in stream:
+            print(token, end="", flush=True)
+        print(f"\n({stream.stats.tokens} tokens, first token after {stream.stats.time_to_first_token or 0:.2f}s, "
+              f"total {stream.stats.total_time:.2f}s)")
     except Exception as e:
         print(f"Error: {str(e)}")
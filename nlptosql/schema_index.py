@@ -0,0 +1,183 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+_TABLE_LINE = re.compile(r"^\s*-\s*([\w.]+)\s*\(([^)]*)\)")
+_RELATIONSHIP_LINE = re.compile(r"^\s*-\s*([\w.]+)\.(\w+)\s*=\s*([\w.]+)\.(\w+)")
+
+# Columns that are kept for every selected table so joins stay possible
+_KEY_COLUMN = re.compile(r"^(id|.*_id)$", re.I)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased word tokens; snake_case and camelCase identifiers are split into
+    words and a plural "s" is dropped so "restaurants" matches "restaurant".
+    """
+    tokens = [token.lower() for token in _WORD.findall(text.replace("_", " "))]
+    return [token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+            for token in tokens]
+
+
+@dataclass
+class Column:
+    name: str
+    type: str = ""
+    description: str = ""
+
+
+@dataclass
+class Table:
+    name: str
+    columns: List[Column] = field(default_factory=list)
+    description: str = ""
+
+
+class SchemaIndex:
+    """
+    BM25 index over table metadata, built once per catalog.
+
+    Each table is one document made of its name, description and column
+    names / descriptions. BM25 weights are precomputed into a dense
+    (tables x terms) matrix, so scoring a question is a column gather and a sum.
+    prompt_context() turns the best matches into a compact schema block for
+    the NLToSQL prompt.
+    """
+
+    def __init__(self, tables: List[Table], relationships: Optional[List[Tuple[str, str, str, str]]] = None,
+                 k1: float = 1.5, b: float = 0.75):
+        """
+        :param tables: Table metadata
+        :param relationships: (table, column, other table, other column) join keys
+        """
+        self.tables = tables
+        self.relationships = relationships or []
+        self._positions = {table.name: i for i, table in enumerate(tables)}
+
+        documents = [self._document_tokens(table) for table in tables]
+        self.vocabulary: Dict[str, int] = {}
+        for tokens in documents:
+            for token in tokens:
+                self.vocabulary.setdefault(token, len(self.vocabulary))
+
+        tf = np.zeros((len(tables), len(self.vocabulary)), dtype=np.float32)
+        for row, tokens in enumerate(documents):
+            np.add.at(tf[row], np.array([self.vocabulary[token] for token in tokens], dtype=np.intp), 1.0)
+
+        lengths = tf.sum(axis=1, keepdims=True)
+        average_length = lengths.mean() if len(tables) else 1.0
+        document_frequency = (tf > 0).sum(axis=0)
+        idf = np.log(1.0 + (len(tables) - document_frequency + 0.5) / (document_frequency + 0.5))
+        norm = k1 * (1.0 - b + b * lengths / max(average_length, 1e-9))
+        self._weights = (idf * tf * (k1 + 1.0) / (tf + norm)).astype(np.float32)
+
+    @classmethod
+    def from_dict(cls, metadata: Dict) -> "SchemaIndex":
+        """
+        Build from structured metadata:
+
+        {"tables": [{"name", "description", "columns": [{"name", "type", "description"}]}],
+         "relationships": [["table", "column", "other_table", "other_column"]]}
+        """
+        tables = [
+            Table(
+                name=table["name"],
+                description=table.get("description", ""),
+                columns=[
+                    Column(column["name"], column.get("type", ""), column.get("description", ""))
+                    if isinstance(column, dict) else Column(column)
+                    for column in table.get("columns", [])
+                ],
+            )
+            for table in metadata.get("tables", [])
+        ]
+        relationships = [tuple(relationship) for relationship in metadata.get("relationships", [])]
+        return cls(tables, relationships)
+
+    @classmethod
+    def from_schema_info(cls, schema_info: str) -> "SchemaIndex":
+        """Build from the plain-text `- table (col, col)` / `- a.x = b.y` schema_info format."""
+        tables, relationships = [], []
+        for line in schema_info.splitlines():
+            relationship = _RELATIONSHIP_LINE.match(line)
+            if relationship:
+                relationships.append(relationship.groups())
+                continue
+            table = _TABLE_LINE.match(line)
+            if table:
+                columns = [Column(name.strip()) for name in table.group(2).split(",") if name.strip()]
+                tables.append(Table(table.group(1), columns))
+        return cls(tables, relationships)
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def search(self, question: str, top_k: int = 5) -> List[Tuple[Table, float]]:
+        """The top_k tables by BM25 score against the question (tables with no matching term are left out)."""
+        ids = [self.vocabulary[token] for token in set(tokenize(question)) if token in self.vocabulary]
+        if not ids or not self.tables:
+            return []
+        scores = self._weights[:, ids].sum(axis=1)
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.tables[i], float(scores[i])) for i in best if scores[i] > 0]
+
+    def prompt_context(self, question: str, max_tables: int = 5, max_columns: int = 12) -> str:
+        """
+        Compact schema block with only the tables (and columns) relevant to the question.
+
+        Tables are listed in catalog order rather than score order, so questions
+        that select the same tables produce the same block and the model's
+        prompt cache can be reused. Falls back to the first max_tables tables if
+        nothing matches.
+        """
+        selected = [table for table, _ in self.search(question, max_tables)] or self.tables[:max_tables]
+        selected.sort(key=lambda table: self._positions[table.name])
+        names = {table.name for table in selected}
+        question_tokens = set(tokenize(question))
+
+        lines = ["Tables:"]
+        for table in selected:
+            columns = self._relevant_columns(table, question_tokens, max_columns)
+            line = f"- {table.name} ({', '.join(self._format_column(column) for column in columns)})"
+            if table.description:
+                line += f" -- {table.description}"
+            lines.append(line)
+
+        joins = [
+            f"- {left}.{left_column} = {right}.{right_column}"
+            for left, left_column, right, right_column in self.relationships
+            if left in names and right in names
+        ]
+        if joins:
+            lines += ["", "Relationships:"] + joins
+        return "\n".join(lines)
+
+    @staticmethod
+    def _document_tokens(table: Table) -> List[str]:
+        tokens = tokenize(table.name) * 2 + tokenize(table.description)
+        for column in table.columns:
+            tokens += tokenize(column.name) + tokenize(column.description)
+        return tokens
+
+    @staticmethod
+    def _relevant_columns(table: Table, question_tokens: set, max_columns: int) -> List[Column]:
+        if len(table.columns) <= max_columns:
+            return table.columns
+        keys = [column for column in table.columns if _KEY_COLUMN.match(column.name)]
+        matches = [
+            column for column in table.columns
+            if column not in keys and question_tokens & set(tokenize(f"{column.name} {column.description}"))
+        ]
+        rest = [column for column in table.columns if column not in keys and column not in matches]
+        chosen = (keys + matches + rest)[:max_columns]
+        # Keep the catalog's column order
+        return [column for column in table.columns if column in chosen]
+
+    @staticmethod
+    def _format_column(column: Column) -> str:
+        return f"{column.name} {column.type}".strip()